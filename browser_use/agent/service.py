@@ -840,7 +840,7 @@ class Agent(Generic[Context]):
 		if not historical_element or not current_state.element_tree:
 			return action
 
-		current_element = HistoryTreeProcessor.find_history_element_in_tree(historical_element, current_state.element_tree)
+		current_element = HistoryTreeProcessor.find_history_element_in_index(historical_element, current_state.hash_index)
 
 		if not current_element or current_element.highlight_index is None:
 			return None
@@ -15,6 +15,7 @@ from playwright.async_api import (
 )
 
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
+from browser_use.browser.pool import BrowserContextPool
 from browser_use.utils import time_execution_async
 
 logger = logging.getLogger(__name__)
@@ -44,6 +45,15 @@ class BrowserConfig:
 		chrome_instance_path: None
 			Path to a Chrome instance to use to connect to your normal browser
 			e.g. '/Applications/Google\ Chrome.app/Contents/MacOS/Google\ Chrome'
+
+		context_pool_size: 2
+			Number of warm contexts kept by Browser.get_context_pool()
+
+		context_pool_max_uses: 20
+			Number of tasks after which a pooled context is closed and replaced by a fresh one
+
+		context_pool_max_age: None
+			Seconds after which a pooled context is replaced on release, None to keep it until max_uses
 	"""
 
 	headless: bool = False
@@ -56,6 +66,10 @@ class BrowserConfig:
 	proxy: ProxySettings | None = field(default=None)
 	new_context_config: BrowserContextConfig = field(default_factory=BrowserContextConfig)
 
+	context_pool_size: int = 2
+	context_pool_max_uses: int = 20
+	context_pool_max_age: float | None = None
+
 	_force_keep_browser_alive: bool = False
 
 
@@ -77,6 +91,7 @@ class Browser:
 		self.config = config
 		self.playwright: Playwright | None = None
 		self.playwright_browser: PlaywrightBrowser | None = None
+		self.context_pool: BrowserContextPool | None = None
 
 		self.disable_security_args = []
 		if self.config.disable_security:
@@ -90,6 +105,18 @@ class Browser:
 		"""Create a browser context"""
 		return BrowserContext(config=config, browser=self)
 
+	async def get_context_pool(self) -> BrowserContextPool:
+		"""Pool of warm contexts for agents that run one after another, warmed on first call"""
+		if self.context_pool is None:
+			self.context_pool = BrowserContextPool(
+				self,
+				size=self.config.context_pool_size,
+				max_uses=self.config.context_pool_max_uses,
+				max_age=self.config.context_pool_max_age,
+			)
+			await self.context_pool.start()
+		return self.context_pool
+
 	async def get_playwright_browser(self) -> PlaywrightBrowser:
 		"""Get a browser context"""
 		if self.playwright_browser is None:
@@ -224,6 +251,10 @@ class Browser:
 	async def close(self):
 		"""Close the browser instance"""
 		try:
+			if self.context_pool is not None:
+				await self.context_pool.close()
+				self.context_pool = None
+
 			if not self.config._force_keep_browser_alive:
 				if self.playwright_browser:
 					await self.playwright_browser.close()
@@ -0,0 +1,174 @@
+"""
+Shared CDP sessions of a browser context.
+
+Attaching a CDP session to a target and detaching it again costs two round trips to the browser.
+CDPSessionManager attaches one session per page, and one to the browser, the first time they are
+needed and reuses them for every later command, so the CDP DOM backends, performance metrics, storage
+clearing and target lookups share them. Screenshots are taken with Playwright's page.screenshot and
+do not use these sessions. A session is attached again after its page crashed or it was detached.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional, TypedDict
+
+if TYPE_CHECKING:
+	from playwright.async_api import BrowserContext as PlaywrightBrowserContext
+	from playwright.async_api import CDPSession, Page
+
+logger = logging.getLogger(__name__)
+
+
+class TargetInfo(TypedDict):
+	targetId: str
+	type: str
+	title: str
+	url: str
+	attached: bool
+
+
+class LayoutMetrics(TypedDict):
+	cssLayoutViewport: dict[str, float]
+	cssVisualViewport: dict[str, float]
+	cssContentSize: dict[str, float]
+
+
+@dataclass
+class _SessionEntry:
+	session: 'CDPSession'
+	# Domains enabled on the session, e.g. 'Performance'
+	enabled: set[str] = field(default_factory=set)
+
+
+def is_protocol_error(error: Exception) -> bool:
+	"""Whether the browser rejected the command itself, resending it on a new session would not help"""
+	return str(error).startswith('Protocol error')
+
+
+class CDPSessionManager:
+	"""
+	Per-page and per-browser CDP sessions of a Playwright context, attached on demand and reused.
+
+	Only Chromium supports CDP, creating a session raises on other browsers.
+	"""
+
+	def __init__(self, context: 'PlaywrightBrowserContext'):
+		self.context = context
+		self._pages: dict['Page', asyncio.Task[_SessionEntry]] = {}
+		self._browser: Optional[asyncio.Task[_SessionEntry]] = None
+		# Sessions attached so far, including re-attached ones
+		self.attached = 0
+
+	async def _attach_page(self, page: 'Page') -> _SessionEntry:
+		session = await self.context.new_cdp_session(page)
+		self.attached += 1
+		# A crashed renderer takes the session with it
+		page.once('crash', lambda _: self.invalidate(page))
+		page.once('close', lambda _: self.invalidate(page))
+		return _SessionEntry(session)
+
+	async def _attach_browser(self) -> _SessionEntry:
+		browser = self.context.browser
+		if browser is None:
+			raise RuntimeError('Browser context has no browser to attach a CDP session to')
+		session = await browser.new_browser_cdp_session()
+		self.attached += 1
+		return _SessionEntry(session)
+
+	async def _page_entry(self, page: 'Page') -> _SessionEntry:
+		task = self._pages.get(page)
+		if task is None:
+			# Concurrent callers share one attach
+			task = asyncio.ensure_future(self._attach_page(page))
+			self._pages[page] = task
+		try:
+			return await task
+		except Exception:
+			if self._pages.get(page) is task:
+				del self._pages[page]
+			raise
+
+	async def _browser_entry(self) -> _SessionEntry:
+		if self._browser is None:
+			self._browser = asyncio.ensure_future(self._attach_browser())
+		task = self._browser
+		try:
+			return await task
+		except Exception:
+			if self._browser is task:
+				self._browser = None
+			raise
+
+	async def page_session(self, page: 'Page') -> 'CDPSession':
+		"""The CDP session of the page, for callers that subscribe to its events"""
+		return (await self._page_entry(page)).session
+
+	def invalidate(self, page: Optional['Page'] = None) -> None:
+		"""Forget the session of the page, or of the browser if page is None, so the next command attaches again"""
+		if page is None:
+			self._browser = None
+		else:
+			self._pages.pop(page, None)
+
+	async def send(self, page: 'Page', method: str, params: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+		"""Send a command to the page, attaching again once if its session was lost"""
+		entry = await self._page_entry(page)
+		try:
+			return await entry.session.send(method, params)
+		except Exception as e:
+			if is_protocol_error(e) or page.is_closed():
+				raise
+			logger.debug(f'CDP session of page lost, attaching again: {str(e)}')
+			self.invalidate(page)
+			entry = await self._page_entry(page)
+			return await entry.session.send(method, params)
+
+	async def send_browser(self, method: str, params: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+		"""Send a command to the browser target, attaching again once if its session was lost"""
+		entry = await self._browser_entry()
+		try:
+			return await entry.session.send(method, params)
+		except Exception as e:
+			if is_protocol_error(e):
+				raise
+			logger.debug(f'CDP session of browser lost, attaching again: {str(e)}')
+			self.invalidate()
+			entry = await self._browser_entry()
+			return await entry.session.send(method, params)
+
+	async def enable(self, page: 'Page', domain: str) -> None:
+		"""Enable a domain on the session of the page, once per session"""
+		entry = await self._page_entry(page)
+		if domain not in entry.enabled:
+			await self.send(page, f'{domain}.enable')
+			# send may have attached a new session
+			(await self._page_entry(page)).enabled.add(domain)
+
+	async def get_targets(self) -> list[TargetInfo]:
+		result = await self.send_browser('Target.getTargets')
+		return result.get('targetInfos', [])
+
+	async def get_layout_metrics(self, page: 'Page') -> LayoutMetrics:
+		return await self.send(page, 'Page.getLayoutMetrics')  # type: ignore[return-value]
+
+	async def get_performance_metrics(self, page: 'Page') -> dict[str, float]:
+		"""Performance.getMetrics of the page by name, e.g. 'JSHeapUsedSize', 'Nodes', 'LayoutCount'"""
+		await self.enable(page, 'Performance')
+		result = await self.send(page, 'Performance.getMetrics')
+		return {metric['name']: metric['value'] for metric in result.get('metrics', [])}
+
+	async def clear_storage(self, page: 'Page', origin: str, storage_types: str = 'all') -> None:
+		await self.send(page, 'Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': storage_types})
+
+	async def close(self) -> None:
+		"""Detach all sessions"""
+		tasks = list(self._pages.values()) + ([self._browser] if self._browser is not None else [])
+		self._pages.clear()
+		self._browser = None
+		for task in tasks:
+			try:
+				entry = await task
+				await entry.session.detach()
+			except Exception as e:
+				logger.debug(f'Failed to detach CDP session: {str(e)}')
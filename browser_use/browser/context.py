@@ -12,7 +12,8 @@ import re
 import time
 import uuid
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Optional, TypedDict
+from typing import TYPE_CHECKING, Literal, Optional, TypedDict
+from urllib.parse import urlparse
 
 from playwright._impl._errors import TimeoutError
 from playwright.async_api import Browser as PlaywrightBrowser
@@ -21,18 +22,33 @@ from playwright.async_api import (
 )
 from playwright.async_api import (
 	ElementHandle,
+	Frame,
 	FrameLocator,
 	Page,
 )
 
+from browser_use.browser.cdp import CDPSessionManager, TargetInfo
+from browser_use.browser.network import NetworkTracker
+from browser_use.browser.persistence import StatePersister, normalize_cookies, normalize_storage_state
+from browser_use.browser.resource_policy import DomainSuffixTrie, ResourceBlocker, ResourcePolicy, url_host
+from browser_use.browser.screenshot import (
+	ScreenshotFormat,
+	hamming_distance,
+	needs_processing,
+	perceptual_hash,
+	process_screenshot,
+	require_pillow,
+)
+from browser_use.browser.settle import DOM_MUTATION_TIME_INIT_SCRIPT, DOM_QUIET_TIME_SCRIPT, SettleStats
 from browser_use.browser.views import (
 	BrowserError,
 	BrowserState,
 	TabInfo,
 	URLNotAllowedError,
 )
+from browser_use.dom.history_tree_processor.view import HashedDomElement
 from browser_use.dom.service import DomService
-from browser_use.dom.views import DOMElementNode, SelectorMap
+from browser_use.dom.views import DOMElementNode, DOMState, HighlightRect, SelectorMap
 from browser_use.utils import time_execution_async, time_execution_sync
 
 if TYPE_CHECKING:
@@ -40,6 +56,124 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+REMOVE_HIGHLIGHTS_SCRIPT = """
+try {
+	// Remove the highlight container and all its contents
+	const container = document.getElementById('playwright-highlight-container');
+	if (container) {
+		container.remove();
+	}
+
+	// Remove highlight attributes from elements
+	const highlightedElements = document.querySelectorAll('[browser-user-highlight-id^="playwright-highlight-"]');
+	highlightedElements.forEach(el => {
+		el.removeAttribute('browser-user-highlight-id');
+	});
+} catch (e) {
+	console.error('Failed to remove highlights:', e);
+}
+"""
+
+# Sets domVersion to '<document id>:<mutation count>' of the current document. The count is kept by a
+# MutationObserver that is installed on first use and ignores our own highlights, the id tells documents apart.
+DOM_VERSION_JS = """
+	if (window.__browserUseDomVersion === undefined) {
+		const containerId = 'playwright-highlight-container';
+		const isHighlight = (node) => {
+			const el = node && node.nodeType === Node.TEXT_NODE ? node.parentElement : node;
+			return !!(el && el.closest && el.closest('#' + containerId));
+		};
+		window.__browserUseDocumentId = Math.random().toString(36).slice(2);
+		window.__browserUseDomVersion = 0;
+		new MutationObserver((records) => {
+			const changed = records.some((record) => {
+				if (isHighlight(record.target)) return false;
+				const nodes = [...record.addedNodes, ...record.removedNodes];
+				return !(nodes.length > 0 && nodes.every((node) => node.id === containerId));
+			});
+			if (changed) window.__browserUseDomVersion++;
+		}).observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+	}
+	const domVersion = window.__browserUseDocumentId + ':' + window.__browserUseDomVersion;
+"""
+
+# Removes the highlights of the previous state and returns the page metrics of the new state in one round trip.
+# It also returns the DOM version and, for the given cached element handles, their current xpath (null if removed).
+PAGE_STATE_PROBE_SCRIPT = (
+	"""
+(handles = []) => {
+"""
+	+ REMOVE_HIGHLIGHTS_SCRIPT
+	+ DOM_VERSION_JS
+	+ """
+	const xpath = (element) => {
+		if (!element.isConnected) return null;
+		const segments = [];
+		for (let current = element; current && current.nodeType === Node.ELEMENT_NODE; current = current.parentNode) {
+			if (current.parentNode instanceof ShadowRoot || current.parentNode instanceof HTMLIFrameElement) break;
+			let index = 0;
+			for (let sibling = current.previousSibling; sibling; sibling = sibling.previousSibling) {
+				if (sibling.nodeType === Node.ELEMENT_NODE && sibling.nodeName === current.nodeName) index++;
+			}
+			segments.unshift(current.nodeName.toLowerCase() + (index > 0 ? `[${index + 1}]` : ''));
+		}
+		return segments.join('/');
+	};
+	return {
+		title: document.title,
+		scrollX: window.scrollX,
+		scrollY: window.scrollY,
+		viewportWidth: window.innerWidth,
+		viewportHeight: window.innerHeight,
+		scrollHeight: document.documentElement.scrollHeight,
+		domVersion,
+		handleXPaths: handles.map(xpath),
+	};
+}
+"""
+)
+
+# Returns the DOM version of the element's document, or null if the element was removed
+DOM_VERSION_SCRIPT = (
+	"""
+(element) => {
+	if (!element.isConnected) return null;
+"""
+	+ DOM_VERSION_JS
+	+ """
+	return domVersion;
+}
+"""
+)
+
+# Returns a version of what the viewport shows: the DOM version plus a counter of the events that change the rendering
+# without mutating the DOM, and whether the page can only change through those (no animations, videos, canvases or frames).
+SCREENSHOT_FINGERPRINT_SCRIPT = (
+	"""
+() => {
+"""
+	+ DOM_VERSION_JS
+	+ """
+	if (window.__browserUseViewVersion === undefined) {
+		window.__browserUseViewVersion = 0;
+		const bump = () => window.__browserUseViewVersion++;
+		// Scrolled containers, loaded images, focus and hover styles and edited form values
+		for (const type of ['scroll', 'load', 'focusin', 'focusout', 'pointerover', 'pointerout', 'input', 'change']) {
+			window.addEventListener(type, bump, { capture: true, passive: true });
+		}
+		window.addEventListener('resize', bump, { passive: true });
+		if (document.fonts) document.fonts.addEventListener('loadingdone', bump);
+	}
+	const version = [domVersion, window.__browserUseViewVersion, window.scrollX, window.scrollY, window.innerWidth, window.innerHeight];
+	return {
+		version: version.join(':'),
+		domVersion,
+		static: document.getAnimations().length === 0 && !document.querySelector('video, canvas, iframe, embed, object'),
+	};
+}
+"""
+)
+
 
 class BrowserContextWindowSize(TypedDict):
 	width: int
@@ -98,6 +232,10 @@ class BrowserContextConfig:
 	    highlight_elements: True
 	        Highlight elements in the DOM on the screen
 
+	    highlight_rendering: 'page'
+	        'page' draws the highlights into the page, 'screenshot' draws them onto the screenshot with Pillow
+	        (the screenshots extra) and never changes the DOM of the page.
+
 	    viewport_expansion: 500
 	        Viewport expansion in pixels. This amount will increase the number of elements which are included in the state what the LLM will see. If set to -1, all elements will be included (this leads to high token usage). If set to 0, only the elements which are visible in the viewport will be included.
 
@@ -107,6 +245,94 @@ class BrowserContextConfig:
 
 	    include_dynamic_attributes: bool = True
 	        Include dynamic attributes in the CSS selector. If you want to reuse the css_selectors, it might be better to set this to False.
+
+	    incremental_dom_snapshots: False
+	        Keep a MutationObserver on each page and only re-extract the parts of the DOM that changed since the last step.
+	        Scrolling, resizing, changing the viewport expansion or covering and uncovering elements outside of the
+	        changed parts (e.g. opening a modal) falls back to a full snapshot.
+
+	    compact_dom_payload: False
+	        Transfer the extracted DOM as parallel arrays with a shared string table instead of one dict per node.
+	        This shrinks the payload and the parsing time on large pages.
+
+	    dom_occlusion_mode: 'point'
+	        How the DOM extractor checks if an element is covered by another element.
+	        'point' hit tests every visible element, 'grid' batches the hit tests per cell of a screen-space grid.
+
+	    dom_backend: 'js'
+	        How the DOM is extracted. 'js' evaluates buildDomTree.js in the page, 'cdp_snapshot' uses one CDP
+	        DOMSnapshot.captureSnapshot call and detects visible and interactive elements in Python (Chromium only).
+	        'accessibility' only lists the interactive elements of the browser's accessibility tree with their
+	        accessible names, without highlights or layout checks. It is the cheapest, for simple forms (Chromium only).
+
+	    parallel_frame_extraction: False
+	        Run the DOM extractor in every frame of the page concurrently and link the frames into one tree.
+	        This also extracts cross-origin iframes, which the single call extraction cannot access, as far as
+	        Playwright lists them in page.frames (Chromium attaches out-of-process iframes on its own). Frames that
+	        cannot be evaluated, e.g. detached, still loading or not attached by the browser, are skipped with the
+	        frames inside them, their iframe element stays in the tree without content.
+
+	    persistent_dom_cache: False
+	        Keep the layout and style reads of the DOM extractor on the page between steps.
+	        Cached rects are dropped on DOM mutations, scrolling, resizing, loaded images, frames and fonts and finished
+	        transitions or animations. While animations are running, rects are read again on every step.
+
+	    adaptive_page_load_timing: False
+	        Learn per-domain settle times from the network gaps and DOM mutations seen while waiting for pages to load,
+	        and wait for a percentile of them instead of minimum_wait_page_load_time and wait_for_network_idle_page_load_time.
+	        The configured times stay the upper bound.
+
+	    page_load_stats_file: None
+	        Path to a JSON file that keeps the learned settle times between runs.
+
+	    page_load_timing_percentile: 0.9
+	        Percentile of the observed settle times of a domain to wait for.
+
+	    resource_policy: None
+	        ResourcePolicy that aborts requests at the network layer by resource type, ad and tracker domains
+	        or custom predicates, and main frame navigations outside of allowed_domains.
+	        ResourcePolicy.text_only() blocks images, media, fonts and trackers.
+	        Blocked requests are counted in BrowserContext.resource_blocker.
+
+	    har_path: None
+	        Path to the HAR file of har_mode. With a .zip extension, response bodies are stored as separate
+	        content-addressed files in the archive instead of being embedded in the HAR.
+
+	    har_mode: 'off'
+	        'record' saves all network traffic of the context to har_path when the context is closed.
+	        'replay' serves every request from har_path and aborts requests that were not recorded, without network access.
+	        Together with a fixed browser_window_size this makes runs and history reruns reproducible.
+
+	    capture_screenshots: True
+	        Take a screenshot with every state. Agents without vision that do not generate a GIF can turn it off.
+
+	    screenshot_format: 'png'
+	        Encoding of screenshots, 'png', 'jpeg' or 'webp'. WebP and screenshot_max_dimension need Pillow,
+	        install it with pip install 'browser-use[screenshots]'.
+
+	    screenshot_quality: 80
+	        Quality of JPEG and WebP screenshots, from 0 to 100.
+
+	    screenshot_max_dimension: None
+	        Downscale screenshots so their longest side is at most this many pixels, e.g. the largest image
+	        the model takes without tiling or resizing it itself.
+
+	    screenshot_skip_unchanged: False
+	        Reuse the previous screenshot if the page did not change since it was taken. A page without DOM mutations,
+	        scrolling, input, animations, videos, canvases or frames since then is not captured again. Otherwise the
+	        new screenshot replaces the previous one unless the DOM is unchanged and a perceptual hash of both
+	        differs in at most screenshot_unchanged_threshold bits (out of 256), which skips encoding it. Needs Pillow.
+
+	    screenshot_unchanged_threshold: 0
+	        Number of bits the perceptual hashes of two screenshots may differ in for them to count as unchanged.
+
+	    storage_state_file: None
+	        Path to a Playwright storage state file (cookies and local storage of every origin), loaded into
+	        new contexts and saved like the cookies_file.
+
+	    state_save_debounce: 1.0
+	        Seconds to coalesce the saves of cookies_file and storage_state_file requested by successive steps.
+	        Saves are skipped if the content did not change and always happen when the context is closed.
 	"""
 
 	cookies_file: str | None = None
@@ -129,17 +355,97 @@ class BrowserContextConfig:
 	)
 
 	highlight_elements: bool = True
+	highlight_rendering: Literal['page', 'screenshot'] = 'page'
 	viewport_expansion: int = 500
 	allowed_domains: list[str] | None = None
 	include_dynamic_attributes: bool = True
+	incremental_dom_snapshots: bool = False
+	compact_dom_payload: bool = False
+	dom_occlusion_mode: Literal['point', 'grid'] = 'point'
+	dom_backend: Literal['js', 'cdp_snapshot', 'accessibility'] = 'js'
+	parallel_frame_extraction: bool = False
+	persistent_dom_cache: bool = False
+	adaptive_page_load_timing: bool = False
+	page_load_stats_file: str | None = None
+	page_load_timing_percentile: float = 0.9
+	resource_policy: ResourcePolicy | None = None
+	har_path: str | None = None
+	har_mode: Literal['off', 'record', 'replay'] = 'off'
+	capture_screenshots: bool = True
+	screenshot_format: ScreenshotFormat = 'png'
+	screenshot_quality: int = 80
+	screenshot_max_dimension: int | None = None
+	screenshot_skip_unchanged: bool = False
+	screenshot_unchanged_threshold: int = 0
+	storage_state_file: str | None = None
+	state_save_debounce: float = 1.0
 
 	_force_keep_context_alive: bool = False
 
+	def __post_init__(self):
+		if self.screenshot_format == 'webp':
+			require_pillow("screenshot_format='webp'")
+		if self.screenshot_max_dimension is not None:
+			require_pillow('screenshot_max_dimension')
+		if self.screenshot_skip_unchanged:
+			require_pillow('screenshot_skip_unchanged')
+		if self.highlight_elements and self.highlight_rendering == 'screenshot':
+			require_pillow("highlight_rendering='screenshot'")
+
+
+@dataclass
+class CachedScreenshot:
+	"""Last screenshot of a context, for screenshot_skip_unchanged"""
+
+	page: Page
+	# full_page and the drawn highlights
+	variant: tuple
+	# Result of SCREENSHOT_FINGERPRINT_SCRIPT right before the capture, None if it failed
+	fingerprint: dict | None
+	perceptual_hash: int
+	screenshot_b64: str
+
+
+# xpaths of the iframes and shadow hosts above an element, and its hash. The xpath in the hash restarts at
+# every iframe document and shadow root, so the hash alone is the same for elements of two identical iframes.
+ElementHandleKey = tuple[tuple[str, ...], HashedDomElement]
+
+
+@dataclass
+class CachedElementHandle:
+	"""Element handle resolved for an element, kept across snapshots in which the element is unchanged"""
+
+	page: Page
+	element: DOMElementNode
+	handle: ElementHandle
+	# Version of the element's document when the handle was last known to be valid
+	dom_version: str
+	# Handles of the main frame are checked by the state probe, handles in iframes on use
+	in_main_frame: bool
+
 
 @dataclass
 class BrowserSession:
 	context: PlaywrightBrowserContext
 	cached_state: BrowserState | None
+	dom_services: dict[Page, DomService] = field(default_factory=dict)
+	network_trackers: dict[Page, NetworkTracker] = field(default_factory=dict)
+	# Bumped on every new DOM snapshot and navigation, handles resolved meanwhile are not cached
+	snapshot_version: int = 0
+	# Element handles by element handle key, and the DOM version of every page as of the last state probe
+	element_handles: dict[ElementHandleKey, CachedElementHandle] = field(default_factory=dict)
+	dom_versions: dict[Page, str] = field(default_factory=dict)
+	# Last DOM state of every page, its hash index tells which elements can be cached
+	dom_states: dict[Page, DOMState] = field(default_factory=dict)
+	# Origins of every frame the context navigated to, their storage is cleared by reset_for_reuse
+	visited_origins: set[str] = field(default_factory=set)
+	# Page last brought to front, None once another page may have taken the focus
+	front_page: Page | None = None
+	# CDP sessions of the pages and the browser, shared by everything that talks CDP
+	cdp_sessions: CDPSessionManager = field(init=False)
+
+	def __post_init__(self):
+		self.cdp_sessions = CDPSessionManager(self.context)
 
 
 @dataclass
@@ -168,6 +474,33 @@ class BrowserContext:
 
 		# Initialize these as None - they'll be set up when needed
 		self.session: BrowserSession | None = None
+		self.settle_stats: SettleStats | None = None
+		self.allowed_domains = DomainSuffixTrie(self.config.allowed_domains) if self.config.allowed_domains else None
+		self.resource_blocker: ResourceBlocker | None = None
+		self._last_screenshot: CachedScreenshot | None = None
+		if self.config.resource_policy:
+			self.resource_blocker = ResourceBlocker(self.config.resource_policy, self.config.allowed_domains)
+		if self.config.adaptive_page_load_timing:
+			self.settle_stats = SettleStats(self.config.page_load_stats_file, percentile=self.config.page_load_timing_percentile)
+
+		self.cookie_persister: StatePersister | None = None
+		self.storage_state_persister: StatePersister | None = None
+		if self.config.cookies_file:
+			self.cookie_persister = StatePersister(
+				self.config.cookies_file,
+				self._fetch_cookies,
+				debounce=self.config.state_save_debounce,
+				normalize=normalize_cookies,
+				name='cookies',
+			)
+		if self.config.storage_state_file:
+			self.storage_state_persister = StatePersister(
+				self.config.storage_state_file,
+				self._fetch_storage_state,
+				debounce=self.config.state_save_debounce,
+				normalize=normalize_storage_state,
+				name='storage state',
+			)
 
 	async def __aenter__(self):
 		"""Async context manager entry"""
@@ -197,6 +530,10 @@ class BrowserContext:
 				self._page_event_handler = None
 
 			await self.save_cookies()
+			await self.save_storage_state()
+			if self.settle_stats:
+				self.settle_stats.save()
+			await self.session.cdp_sessions.close()
 
 			if self.config.trace_path:
 				try:
@@ -246,6 +583,7 @@ class BrowserContext:
 			context=context,
 			cached_state=None,
 		)
+		self._track_visited_origins(self.session)
 
 		active_page = None
 		if self.browser.config.cdp_url:
@@ -280,10 +618,28 @@ class BrowserContext:
 
 		# Bring page to front
 		await active_page.bring_to_front()
+		self.session.front_page = active_page
 		await active_page.wait_for_load_state('load')
 
 		return self.session
 
+	def _track_visited_origins(self, session: BrowserSession):
+		"""Record the origin of every frame navigation of every page of the context"""
+
+		def on_frame_navigated(frame: Frame):
+			url = urlparse(frame.url)
+			if url.scheme in ('http', 'https') and url.netloc:
+				session.visited_origins.add(f'{url.scheme}://{url.netloc}')
+
+		def watch_page(page: Page):
+			page.on('framenavigated', on_frame_navigated)
+			for frame in page.frames:
+				on_frame_navigated(frame)
+
+		for page in session.context.pages:
+			watch_page(page)
+		session.context.on('page', watch_page)
+
 	def _add_new_page_listener(self, context: PlaywrightBrowserContext):
 		async def on_page(page: Page):
 			if self.browser.config.cdp_url:
@@ -292,6 +648,7 @@ class BrowserContext:
 			logger.debug(f'New page opened: {page.url}')
 			if self.session is not None:
 				self.state.target_id = None
+				self.session.front_page = None
 
 		self._page_event_handler = on_page
 		context.on('page', on_page)
@@ -307,6 +664,20 @@ class BrowserContext:
 		session = await self.get_session()
 		return await self._get_current_page(session)
 
+	async def _load_cookies(self, context: PlaywrightBrowserContext):
+		"""Load cookies if they exist"""
+		if self.config.storage_state_file and os.path.exists(self.config.storage_state_file):
+			# Local storage of the file is only restored by new_context, cookies can be added to any context
+			with open(self.config.storage_state_file, 'r') as f:
+				cookies = json.load(f).get('cookies', [])
+				logger.info(f'Loaded {len(cookies)} cookies from {self.config.storage_state_file}')
+				await context.add_cookies(cookies)
+		if self.config.cookies_file and os.path.exists(self.config.cookies_file):
+			with open(self.config.cookies_file, 'r') as f:
+				cookies = json.load(f)
+				logger.info(f'Loaded {len(cookies)} cookies from {self.config.cookies_file}')
+				await context.add_cookies(cookies)
+
 	async def _create_context(self, browser: PlaywrightBrowser):
 		"""Creates a new browser context with anti-detection measures and loads cookies if available."""
 		if self.browser.config.cdp_url and len(browser.contexts) > 0:
@@ -326,17 +697,24 @@ class BrowserContext:
 				record_video_dir=self.config.save_recording_path,
 				record_video_size=self.config.browser_window_size,
 				locale=self.config.locale,
+				storage_state=self.config.storage_state_file
+				if self.config.storage_state_file and os.path.exists(self.config.storage_state_file)
+				else None,
 			)
 
 		if self.config.trace_path:
 			await context.tracing.start(screenshots=True, snapshots=True, sources=True)
 
-		# Load cookies if they exist
-		if self.config.cookies_file and os.path.exists(self.config.cookies_file):
-			with open(self.config.cookies_file, 'r') as f:
-				cookies = json.load(f)
-				logger.info(f'Loaded {len(cookies)} cookies from {self.config.cookies_file}')
-				await context.add_cookies(cookies)
+		if self.settle_stats:
+			await context.add_init_script(DOM_MUTATION_TIME_INIT_SCRIPT)
+
+		await self._setup_har(context)
+
+		# Registered after the HAR routes so it runs first and falls back to them
+		if self.resource_blocker:
+			await context.route('**/*', self.resource_blocker.handle)
+
+		await self._load_cookies(context)
 
 		# Expose anti-detection scripts
 		await context.add_init_script(
@@ -377,174 +755,41 @@ class BrowserContext:
 
 		return context
 
-	async def _wait_for_stable_network(self):
-		page = await self.get_current_page()
-
-		pending_requests = set()
-		last_activity = asyncio.get_event_loop().time()
-
-		# Define relevant resource types and content types
-		RELEVANT_RESOURCE_TYPES = {
-			'document',
-			'stylesheet',
-			'image',
-			'font',
-			'script',
-			'iframe',
-		}
-
-		RELEVANT_CONTENT_TYPES = {
-			'text/html',
-			'text/css',
-			'application/javascript',
-			'image/',
-			'font/',
-			'application/json',
-		}
-
-		# Additional patterns to filter out
-		IGNORED_URL_PATTERNS = {
-			# Analytics and tracking
-			'analytics',
-			'tracking',
-			'telemetry',
-			'beacon',
-			'metrics',
-			# Ad-related
-			'doubleclick',
-			'adsystem',
-			'adserver',
-			'advertising',
-			# Social media widgets
-			'facebook.com/plugins',
-			'platform.twitter',
-			'linkedin.com/embed',
-			# Live chat and support
-			'livechat',
-			'zendesk',
-			'intercom',
-			'crisp.chat',
-			'hotjar',
-			# Push notifications
-			'push-notifications',
-			'onesignal',
-			'pushwoosh',
-			# Background sync/heartbeat
-			'heartbeat',
-			'ping',
-			'alive',
-			# WebRTC and streaming
-			'webrtc',
-			'rtmp://',
-			'wss://',
-			# Common CDNs for dynamic content
-			'cloudfront.net',
-			'fastly.net',
-		}
-
-		async def on_request(request):
-			# Filter by resource type
-			if request.resource_type not in RELEVANT_RESOURCE_TYPES:
-				return
-
-			# Filter out streaming, websocket, and other real-time requests
-			if request.resource_type in {
-				'websocket',
-				'media',
-				'eventsource',
-				'manifest',
-				'other',
-			}:
-				return
-
-			# Filter out by URL patterns
-			url = request.url.lower()
-			if any(pattern in url for pattern in IGNORED_URL_PATTERNS):
-				return
-
-			# Filter out data URLs and blob URLs
-			if url.startswith(('data:', 'blob:')):
-				return
-
-			# Filter out requests with certain headers
-			headers = request.headers
-			if headers.get('purpose') == 'prefetch' or headers.get('sec-fetch-dest') in [
-				'video',
-				'audio',
-			]:
-				return
-
-			nonlocal last_activity
-			pending_requests.add(request)
-			last_activity = asyncio.get_event_loop().time()
-			# logger.debug(f'Request started: {request.url} ({request.resource_type})')
-
-		async def on_response(response):
-			request = response.request
-			if request not in pending_requests:
-				return
-
-			# Filter by content type if available
-			content_type = response.headers.get('content-type', '').lower()
-
-			# Skip if content type indicates streaming or real-time data
-			if any(
-				t in content_type
-				for t in [
-					'streaming',
-					'video',
-					'audio',
-					'webm',
-					'mp4',
-					'event-stream',
-					'websocket',
-					'protobuf',
-				]
-			):
-				pending_requests.remove(request)
-				return
-
-			# Only process relevant content types
-			if not any(ct in content_type for ct in RELEVANT_CONTENT_TYPES):
-				pending_requests.remove(request)
-				return
-
-			# Skip if response is too large (likely not essential for page load)
-			content_length = response.headers.get('content-length')
-			if content_length and int(content_length) > 5 * 1024 * 1024:  # 5MB
-				pending_requests.remove(request)
-				return
-
-			nonlocal last_activity
-			pending_requests.remove(request)
-			last_activity = asyncio.get_event_loop().time()
-			# logger.debug(f'Request resolved: {request.url} ({content_type})')
-
-		# Attach event listeners
-		page.on('request', on_request)
-		page.on('response', on_response)
-
-		try:
-			# Wait for idle time
-			start_time = asyncio.get_event_loop().time()
-			while True:
-				await asyncio.sleep(0.1)
-				now = asyncio.get_event_loop().time()
-				if len(pending_requests) == 0 and (now - last_activity) >= self.config.wait_for_network_idle_page_load_time:
-					break
-				if now - start_time > self.config.maximum_wait_page_load_time:
-					logger.debug(
-						f'Network timeout after {self.config.maximum_wait_page_load_time}s with {len(pending_requests)} '
-						f'pending requests: {[r.url for r in pending_requests]}'
-					)
-					break
+	async def _setup_har(self, context: PlaywrightBrowserContext):
+		"""Record the network traffic of the context to a HAR file or replay it from one"""
+		if self.config.har_mode == 'off':
+			return
+		if not self.config.har_path:
+			raise BrowserError(f'har_mode {self.config.har_mode} requires har_path')
+
+		if self.config.har_mode == 'record':
+			dirname = os.path.dirname(self.config.har_path)
+			if dirname:
+				os.makedirs(dirname, exist_ok=True)
+			# Every request goes to the network and is written to the HAR when the context closes
+			await context.route_from_har(
+				self.config.har_path,
+				update=True,
+				update_content='attach' if self.config.har_path.endswith('.zip') else 'embed',
+				update_mode='full',
+			)
+			logger.info(f'Recording network traffic to {self.config.har_path}')
+		else:
+			if not os.path.exists(self.config.har_path):
+				raise BrowserError(f'HAR file to replay not found: {self.config.har_path}')
+			await context.route_from_har(self.config.har_path, not_found='abort')
+			logger.info(f'Replaying network traffic from {self.config.har_path}')
 
-		finally:
-			# Clean up event listeners
-			page.remove_listener('request', on_request)
-			page.remove_listener('response', on_response)
+	async def _wait_for_stable_network(self, idle_time: float | None = None) -> float:
+		"""Wait for the network to be idle for idle_time seconds, returns the longest quiet gap seen in between"""
+		session = await self.get_session()
+		page = await self.get_current_page()
 
-		logger.debug(f'Network stabilized for {self.config.wait_for_network_idle_page_load_time} seconds')
+		idle_time = self.config.wait_for_network_idle_page_load_time if idle_time is None else idle_time
+		tracker = self._get_network_tracker(session, page)
+		if await tracker.wait_for_idle(self.config.maximum_wait_page_load_time, idle_time):
+			logger.debug(f'Network stabilized for {idle_time:.2f} seconds')
+		return tracker.max_gap
 
 	async def _wait_for_page_and_frames_load(self, timeout_overwrite: float | None = None):
 		"""
@@ -555,9 +800,20 @@ class BrowserContext:
 		# Start timing
 		start_time = time.time()
 
+		# Settle times learned for the domain the page is on before it loads
+		domain = None
+		settle_times = None
+		if self.settle_stats:
+			domain = urlparse((await self.get_current_page()).url).hostname
+			if domain:
+				settle_times = self.settle_stats.settle_times(
+					domain, self.config.wait_for_network_idle_page_load_time, self.config.minimum_wait_page_load_time
+				)
+
 		# Wait for page load
+		network_gap = None
 		try:
-			await self._wait_for_stable_network()
+			network_gap = await self._wait_for_stable_network(settle_times.network_idle if settle_times else None)
 
 			# Check if the loaded URL is allowed
 			page = await self.get_current_page()
@@ -570,7 +826,8 @@ class BrowserContext:
 
 		# Calculate remaining time to meet minimum WAIT_TIME
 		elapsed = time.time() - start_time
-		remaining = max((timeout_overwrite or self.config.minimum_wait_page_load_time) - elapsed, 0)
+		minimum_wait = settle_times.minimum_wait if settle_times else self.config.minimum_wait_page_load_time
+		remaining = max((timeout_overwrite or minimum_wait) - elapsed, 0)
 
 		logger.debug(f'--Page loaded in {elapsed:.2f} seconds, waiting for additional {remaining:.2f} seconds')
 
@@ -578,26 +835,30 @@ class BrowserContext:
 		if remaining > 0:
 			await asyncio.sleep(remaining)
 
+		if settle_times and domain:
+			await self._record_settle_times(domain, network_gap, time.time() - start_time)
+
+	async def _record_settle_times(self, domain: str, network_gap: float | None, waited: float):
+		"""Record how long the network and the DOM of the page took to settle during a wait of waited seconds"""
+		assert self.settle_stats is not None
+		dom_settle = None
+		try:
+			page = await self.get_current_page()
+			quiet_time = await page.evaluate(DOM_QUIET_TIME_SCRIPT)
+			if quiet_time is not None:
+				dom_settle = waited - quiet_time
+		except Exception as e:
+			logger.debug(f'Failed to measure DOM settle time: {str(e)}')
+		self.settle_stats.record(domain, network_gap, dom_settle)
+
 	def _is_url_allowed(self, url: str) -> bool:
 		"""Check if a URL is allowed based on the whitelist configuration."""
-		if not self.config.allowed_domains:
+		if not self.allowed_domains:
 			return True
 
 		try:
-			from urllib.parse import urlparse
-
-			parsed_url = urlparse(url)
-			domain = parsed_url.netloc.lower()
-
-			# Remove port number if present
-			if ':' in domain:
-				domain = domain.split(':')[0]
-
 			# Check if domain matches any allowed domain pattern
-			return any(
-				domain == allowed_domain.lower() or domain.endswith('.' + allowed_domain.lower())
-				for allowed_domain in self.config.allowed_domains
-			)
+			return self.allowed_domains.matches(url_host(url))
 		except Exception as e:
 			logger.error(f'Error checking URL allowlist: {str(e)}')
 			return False
@@ -618,18 +879,21 @@ class BrowserContext:
 			raise BrowserError(f'Navigation to non-allowed URL: {url}')
 
 		page = await self.get_current_page()
+		self._invalidate_element_handles(self.session)
 		await page.goto(url)
 		await page.wait_for_load_state()
 
 	async def refresh_page(self):
 		"""Refresh the current page"""
 		page = await self.get_current_page()
+		self._invalidate_element_handles(self.session)
 		await page.reload()
 		await page.wait_for_load_state()
 
 	async def go_back(self):
 		"""Navigate back in history"""
 		page = await self.get_current_page()
+		self._invalidate_element_handles(self.session)
 		try:
 			# 10 ms timeout
 			await page.go_back(timeout=10, wait_until='domcontentloaded')
@@ -641,6 +905,7 @@ class BrowserContext:
 	async def go_forward(self):
 		"""Navigate forward in history"""
 		page = await self.get_current_page()
+		self._invalidate_element_handles(self.session)
 		try:
 			await page.go_forward(timeout=10, wait_until='domcontentloaded')
 		except Exception as e:
@@ -747,21 +1012,24 @@ class BrowserContext:
 		session = await self.get_session()
 		session.cached_state = await self._update_state()
 
-		# Save cookies if a file is specified
-		if self.config.cookies_file:
-			asyncio.create_task(self.save_cookies())
+		# Save cookies and storage state if a file is specified, coalesced over successive steps
+		if self.cookie_persister:
+			self.cookie_persister.schedule()
+		if self.storage_state_persister:
+			self.storage_state_persister.schedule()
 
 		return session.cached_state
 
 	async def _update_state(self, focus_element: int = -1) -> BrowserState:
 		"""Update and return state."""
 		session = await self.get_session()
+		session.snapshot_version += 1
 
-		# Check if current page is still valid, if not switch to another available page
+		# Check if current page is still valid, if not switch to another available page.
+		# The probe also removes the old highlights and reads title and scroll position in the same round trip.
 		try:
 			page = await self.get_current_page()
-			# Test if page is still accessible
-			await page.evaluate('1')
+			probe = await self._probe_page(session, page)
 		except Exception as e:
 			logger.debug(f'Current page is no longer accessible: {str(e)}')
 			# Get all available pages
@@ -769,35 +1037,58 @@ class BrowserContext:
 			if pages:
 				self.state.target_id = None
 				page = await self._get_current_page(session)
-				logger.debug(f'Switched to page: {await page.title()}')
+				probe = await self._probe_page(session, page)
+				logger.debug(f'Switched to page: {probe["title"]}')
 			else:
 				raise BrowserError('Browser closed: no valid pages available')
 
+		# Tab titles only need other pages, so they are read while the DOM is extracted
+		tabs_task = asyncio.create_task(self.get_tabs_info())
+		# Retrieve its exception if the extraction fails first, so it is not reported as never retrieved
+		tabs_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+		# Highlights drawn onto the screenshot only need the boxes of the elements, the page is not touched
+		render_highlights = (
+			self.config.highlight_elements and self.config.highlight_rendering == 'screenshot' and self.config.capture_screenshots
+		)
 		try:
-			await self.remove_highlights()
-			dom_service = DomService(page)
+			dom_service = self._get_dom_service(session, page)
 			content = await dom_service.get_clickable_elements(
 				focus_element=focus_element,
 				viewport_expansion=self.config.viewport_expansion,
-				highlight_elements=self.config.highlight_elements,
+				highlight_elements=self.config.highlight_elements and not render_highlights,
+				incremental=self.config.incremental_dom_snapshots,
+				compact_payload=self.config.compact_dom_payload,
+				occlusion_mode=self.config.dom_occlusion_mode,
+				backend=self.config.dom_backend,
+				parallel_frames=self.config.parallel_frame_extraction,
+				persistent_cache=self.config.persistent_dom_cache,
+				return_highlight_rects=render_highlights,
 			)
+			self._refresh_element_handles(session, page, content)
 
-			screenshot_b64 = await self.take_screenshot()
-			pixels_above, pixels_below = await self.get_scroll_info(page)
+			# The screenshot has to show the highlights of the extraction, so it is taken after it
+			screenshot_b64 = None
+			if self.config.capture_screenshots:
+				# The page was waited for by get_state already, it only has to be brought to front after a tab change
+				await self._bring_to_front(session, page)
+				screenshot_b64 = await self._capture_screenshot(
+					page, highlights=content.highlight_rects, viewport_width=probe['viewportWidth']
+				)
 
 			self.current_state = BrowserState(
 				element_tree=content.element_tree,
 				selector_map=content.selector_map,
 				url=page.url,
-				title=await page.title(),
-				tabs=await self.get_tabs_info(),
+				title=probe['title'],
+				tabs=await tabs_task,
 				screenshot=screenshot_b64,
-				pixels_above=pixels_above,
-				pixels_below=pixels_below,
+				pixels_above=probe['scrollY'],
+				pixels_below=probe['scrollHeight'] - (probe['scrollY'] + probe['viewportHeight']),
 			)
 
 			return self.current_state
 		except Exception as e:
+			tabs_task.cancel()
 			logger.error(f'Failed to update state: {str(e)}')
 			# Return last known good state if available
 			if hasattr(self, 'current_state'):
@@ -812,20 +1103,101 @@ class BrowserContext:
 		"""
 		page = await self.get_current_page()
 
-		await page.bring_to_front()
+		await self._bring_to_front(await self.get_session(), page)
 		await page.wait_for_load_state()
 
-		screenshot = await page.screenshot(
-			full_page=full_page,
-			animations='disabled',
-		)
+		# await self.remove_highlights()
 
-		screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+		return await self._capture_screenshot(page, full_page)
 
-		# await self.remove_highlights()
+	async def _bring_to_front(self, session: BrowserSession, page: Page) -> None:
+		if page is not session.front_page:
+			await page.bring_to_front()
+			session.front_page = page
+
+	async def _capture_screenshot(
+		self,
+		page: Page,
+		full_page: bool = False,
+		highlights: dict[int, HighlightRect] | None = None,
+		viewport_width: float | None = None,
+	) -> str:
+		"""
+		Capture and encode a screenshot as configured, reusing the previous one if the page looks unchanged.
+		highlights are drawn onto it, viewport_width is the width of the viewport in CSS pixels.
+		"""
+		# A reused screenshot must show the same highlights
+		drawn = tuple(sorted((index, rect.x, rect.y, rect.width, rect.height) for index, rect in (highlights or {}).items()))
+		variant = (full_page, drawn)
+		fingerprint = None
+		if self.config.screenshot_skip_unchanged:
+			fingerprint = await self._screenshot_fingerprint(page)
+			last = self._last_screenshot
+			if (
+				last is not None
+				and last.page is page
+				and last.variant == variant
+				and fingerprint is not None
+				and last.fingerprint is not None
+				and fingerprint['static']
+				and fingerprint['version'] == last.fingerprint['version']
+			):
+				logger.debug('Page unchanged since the last screenshot, reusing it without capturing')
+				return last.screenshot_b64
+
+		screenshot_format = self.config.screenshot_format
+		process = needs_processing(screenshot_format, self.config.screenshot_max_dimension, bool(highlights))
+		# The browser encodes PNG and JPEG itself, other formats and downscaling start from a lossless PNG
+		if screenshot_format == 'jpeg' and not process:
+			screenshot = await page.screenshot(
+				full_page=full_page, animations='disabled', type='jpeg', quality=self.config.screenshot_quality
+			)
+		else:
+			screenshot = await page.screenshot(full_page=full_page, animations='disabled')
+
+		if self.config.screenshot_skip_unchanged:
+			# Decoding the screenshot would hold the event loop
+			screenshot_hash = await asyncio.to_thread(perceptual_hash, screenshot)
+			last = self._last_screenshot
+			if (
+				last is not None
+				and last.page is page
+				and last.variant == variant
+				and fingerprint is not None
+				and last.fingerprint is not None
+				# The hash alone misses small changes like edited text
+				and fingerprint['domVersion'] == last.fingerprint['domVersion']
+				and hamming_distance(last.perceptual_hash, screenshot_hash) <= self.config.screenshot_unchanged_threshold
+			):
+				logger.debug('Screenshot unchanged, reusing the previous one')
+				# Until the page changes again, the next one is not even captured
+				last.fingerprint = fingerprint
+				return last.screenshot_b64
+
+		if process:
+			# Decoding, drawing and encoding hold the event loop for tens of milliseconds on large screenshots
+			screenshot = await asyncio.to_thread(
+				process_screenshot,
+				screenshot,
+				screenshot_format,
+				self.config.screenshot_quality,
+				self.config.screenshot_max_dimension,
+				highlights,
+				viewport_width,
+			)
+		screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
 
+		if self.config.screenshot_skip_unchanged:
+			self._last_screenshot = CachedScreenshot(page, variant, fingerprint, screenshot_hash, screenshot_b64)
 		return screenshot_b64
 
+	async def _screenshot_fingerprint(self, page: Page) -> dict | None:
+		try:
+			return await page.evaluate(SCREENSHOT_FINGERPRINT_SCRIPT)
+		except Exception as e:
+			logger.debug(f'Failed to fingerprint the page for its screenshot: {str(e)}')
+			return None
+
 	@time_execution_async('--remove_highlights')
 	async def remove_highlights(self):
 		"""
@@ -834,25 +1206,7 @@ class BrowserContext:
 		"""
 		try:
 			page = await self.get_current_page()
-			await page.evaluate(
-				"""
-                try {
-                    // Remove the highlight container and all its contents
-                    const container = document.getElementById('playwright-highlight-container');
-                    if (container) {
-                        container.remove();
-                    }
-
-                    // Remove highlight attributes from elements
-                    const highlightedElements = document.querySelectorAll('[browser-user-highlight-id^="playwright-highlight-"]');
-                    highlightedElements.forEach(el => {
-                        el.removeAttribute('browser-user-highlight-id');
-                    });
-                } catch (e) {
-                    console.error('Failed to remove highlights:', e);
-                }
-                """
-			)
+			await page.evaluate(REMOVE_HIGHLIGHTS_SCRIPT)
 		except Exception as e:
 			logger.debug(f'Failed to remove highlights (this is usually ok): {str(e)}')
 			# Don't raise the error since this is not critical functionality
@@ -1017,9 +1371,146 @@ class BrowserContext:
 			tag_name = element.tag_name or '*'
 			return f"{tag_name}[highlight_index='{element.highlight_index}']"
 
+	def _invalidate_element_handles(self, session: BrowserSession | None) -> None:
+		"""Drop all cached element handles, e.g. before a navigation"""
+		if session is None:
+			return
+		session.snapshot_version += 1
+		session.element_handles.clear()
+		session.dom_versions.clear()
+		session.dom_states.clear()
+
+	async def _probe_page(self, session: BrowserSession, page: Page) -> dict:
+		"""
+		Evaluate the state probe. The cached handles of the page's main frame are passed along, handles whose
+		element was removed or moved are dropped and the others are marked valid for the current DOM version.
+		"""
+		entries = [(key, entry) for key, entry in session.element_handles.items() if entry.page is page and entry.in_main_frame]
+		if not entries:
+			probe = await page.evaluate(PAGE_STATE_PROBE_SCRIPT)
+		else:
+			try:
+				probe = await page.evaluate(PAGE_STATE_PROBE_SCRIPT, [entry.handle for _, entry in entries])
+			except Exception as e:
+				# Handles of a document that was navigated away cannot be passed to the new one
+				logger.debug(f'Failed to check cached element handles: {str(e)}')
+				for key, _ in entries:
+					del session.element_handles[key]
+				entries = []
+				probe = await page.evaluate(PAGE_STATE_PROBE_SCRIPT)
+
+		dom_version = probe.get('domVersion')
+		for (key, entry), xpath in zip(entries, probe.get('handleXPaths') or []):
+			if dom_version is None or xpath != entry.element.xpath:
+				del session.element_handles[key]
+			else:
+				entry.dom_version = dom_version
+		if dom_version is not None:
+			session.dom_versions[page] = dom_version
+		return probe
+
+	def _refresh_element_handles(self, session: BrowserSession, page: Page, content: DOMState) -> None:
+		"""
+		Point the cached handles to the elements of the new snapshot, dropping those of elements it no longer has
+		or no longer tells apart from other elements
+		"""
+		session.dom_states[page] = content
+		if not session.element_handles:
+			return
+		index = content.hash_index
+		for key, entry in list(session.element_handles.items()):
+			element = index.exact.get(key[1]) if entry.page is page and key[1] not in index.duplicates else None
+			if element is None or self._element_handle_key(element) != key:
+				del session.element_handles[key]
+			else:
+				entry.element = element
+
+	@staticmethod
+	def _element_handle_key(element: DOMElementNode) -> ElementHandleKey:
+		boundaries = []
+		parent = element.parent
+		while parent is not None:
+			if parent.tag_name == 'iframe' or parent.shadow_root:
+				boundaries.append(parent.xpath)
+			parent = parent.parent
+		return tuple(reversed(boundaries)), element.hash
+
+	async def _get_element_dom_version(self, element_handle: ElementHandle) -> Optional[str]:
+		"""DOM version of the document of the element, None if the element is gone"""
+		try:
+			return await element_handle.evaluate(DOM_VERSION_SCRIPT)
+		except Exception as e:
+			# The document of the element was navigated away or closed
+			logger.debug(f'Failed to get DOM version of element: {str(e)}')
+			return None
+
+	async def _get_cached_element_handle(
+		self, session: BrowserSession, page: Page, element: DOMElementNode
+	) -> Optional[ElementHandle]:
+		key = self._element_handle_key(element)
+		cached = session.element_handles.get(key)
+		if cached is None or cached.page is not page:
+			return None
+
+		# Checked by the last state probe, no round trip needed
+		if cached.in_main_frame and cached.dom_version == session.dom_versions.get(page):
+			return cached.handle
+
+		if await self._get_element_dom_version(cached.handle) == cached.dom_version:
+			return cached.handle
+
+		# The DOM of the element's document changed since the handle was checked
+		session.element_handles.pop(key, None)
+		return None
+
+	async def _cache_element_handle(
+		self, session: BrowserSession, page: Page, element: DOMElementNode, element_handle: ElementHandle
+	) -> None:
+		# Only elements with a hash of their own in the current snapshot, a cached handle must not be mixed up
+		state = session.dom_states.get(page)
+		if state is None or element.hash in state.hash_index.duplicates:
+			return
+
+		snapshot_version = session.snapshot_version
+		dom_version = await self._get_element_dom_version(element_handle)
+		# Skip the handle if the element is gone or a new snapshot was taken in the meantime
+		if dom_version is None or session.snapshot_version != snapshot_version:
+			return
+
+		in_main_frame = True
+		parent = element.parent
+		while parent is not None:
+			if parent.tag_name == 'iframe':
+				in_main_frame = False
+				break
+			parent = parent.parent
+		session.element_handles[self._element_handle_key(element)] = CachedElementHandle(
+			page=page, element=element, handle=element_handle, dom_version=dom_version, in_main_frame=in_main_frame
+		)
+
 	@time_execution_async('--get_locate_element')
 	async def get_locate_element(self, element: DOMElementNode) -> Optional[ElementHandle]:
-		current_frame = await self.get_current_page()
+		"""
+		Resolve the element handle of an element of the current snapshot.
+
+		Handles are cached by element hash and the xpaths of the iframes and shadow hosts above the element, across
+		snapshots that still contain the element, unless other elements of the snapshot share its hash. The state probe
+		checks the handles of the main frame in the same round trip, so using them costs nothing while the
+		DOM is unchanged. Handles in iframes are checked on use. Navigations drop all handles.
+		"""
+		session = await self.get_session()
+		page = await self.get_current_page()
+		element_handle = await self._get_cached_element_handle(session, page, element)
+		if element_handle is not None:
+			return element_handle
+
+		element_handle = await self._locate_element(page, element)
+		if element_handle is not None:
+			await self._cache_element_handle(session, page, element, element_handle)
+		return element_handle
+
+	async def _locate_element(self, page: Page, element: DOMElementNode) -> Optional[ElementHandle]:
+		current_frame = page
 
 		# Start with the target element and collect all parents
 		parents: list[DOMElementNode] = []
@@ -1162,13 +1653,11 @@ class BrowserContext:
 	async def get_tabs_info(self) -> list[TabInfo]:
 		"""Get information about all tabs"""
 		session = await self.get_session()
+		pages = session.context.pages
 
-		tabs_info = []
-		for page_id, page in enumerate(session.context.pages):
-			tab_info = TabInfo(page_id=page_id, url=page.url, title=await page.title())
-			tabs_info.append(tab_info)
-
-		return tabs_info
+		# One title round trip per tab, all at once
+		titles = await asyncio.gather(*(page.title() for page in pages))
+		return [TabInfo(page_id=page_id, url=page.url, title=title) for page_id, (page, title) in enumerate(zip(pages, titles))]
 
 	@time_execution_async('--switch_to_tab')
 	async def switch_to_tab(self, page_id: int) -> None:
@@ -1194,6 +1683,7 @@ class BrowserContext:
 					break
 
 		await page.bring_to_front()
+		session.front_page = page
 		await page.wait_for_load_state()
 
 	@time_execution_async('--create_new_tab')
@@ -1204,6 +1694,7 @@ class BrowserContext:
 
 		session = await self.get_session()
 		new_page = await session.context.new_page()
+		session.front_page = None
 		await new_page.wait_for_load_state()
 
 		if url:
@@ -1236,6 +1727,24 @@ class BrowserContext:
 		# Fallback to last page
 		return pages[-1] if pages else await session.context.new_page()
 
+	def _get_network_tracker(self, session: BrowserSession, page: Page) -> NetworkTracker:
+		"""Get the NetworkTracker of a page, its listeners are attached once when the page is first waited for"""
+		for closed_page in [p for p in session.network_trackers if p.is_closed()]:
+			del session.network_trackers[closed_page]
+
+		if page not in session.network_trackers:
+			session.network_trackers[page] = NetworkTracker(page, self.config.wait_for_network_idle_page_load_time)
+		return session.network_trackers[page]
+
+	def _get_dom_service(self, session: BrowserSession, page: Page) -> DomService:
+		"""Get the DomService of a page, one per page so incremental snapshots can build on the previous one"""
+		for closed_page in [p for p in session.dom_services if p.is_closed()]:
+			del session.dom_services[closed_page]
+
+		if page not in session.dom_services:
+			session.dom_services[page] = DomService(page, session.cdp_sessions)
+		return session.dom_services[page]
+
 	async def get_selector_map(self) -> SelectorMap:
 		session = await self.get_session()
 		if session.cached_state is None:
@@ -1251,22 +1760,25 @@ class BrowserContext:
 		selector_map = await self.get_selector_map()
 		return selector_map[index]
 
-	async def save_cookies(self):
-		"""Save current cookies to file"""
-		if self.session and self.session.context and self.config.cookies_file:
-			try:
-				cookies = await self.session.context.cookies()
-				logger.debug(f'Saving {len(cookies)} cookies to {self.config.cookies_file}')
+	async def _fetch_cookies(self) -> list[dict] | None:
+		if self.session and self.session.context:
+			return await self.session.context.cookies()
+		return None
 
-				# Check if the path is a directory and create it if necessary
-				dirname = os.path.dirname(self.config.cookies_file)
-				if dirname:
-					os.makedirs(dirname, exist_ok=True)
+	async def _fetch_storage_state(self) -> dict | None:
+		if self.session and self.session.context:
+			return await self.session.context.storage_state()
+		return None
 
-				with open(self.config.cookies_file, 'w') as f:
-					json.dump(cookies, f)
-			except Exception as e:
-				logger.warning(f'Failed to save cookies: {str(e)}')
+	async def save_cookies(self):
+		"""Save current cookies to file now, unless they are unchanged since the last save"""
+		if self.cookie_persister:
+			await self.cookie_persister.flush()
+
+	async def save_storage_state(self):
+		"""Save the current storage state to file now, unless it is unchanged since the last save"""
+		if self.storage_state_persister:
+			await self.storage_state_persister.flush()
 
 	async def is_file_uploader(self, element_node: DOMElementNode, max_depth: int = 3, current_depth: int = 0) -> bool:
 		"""Check if element or its children are file uploaders"""
@@ -1316,7 +1828,61 @@ class BrowserContext:
 			await page.close()
 
 		session.cached_state = None
+		self._invalidate_element_handles(session)
+		self.state.target_id = None
+
+	async def reset_for_reuse(self):
+		"""
+		Bring the context back to a blank state for the next task without closing it: extra tabs are closed,
+		cookies, all storage of the visited origins and granted permissions are cleared, the cookies_file is loaded
+		again and the remaining tab shows about:blank.
+		"""
+		# Saves scheduled by the last steps must not fire halfway through the reset and write the emptied jar
+		await self.save_cookies()
+		await self.save_storage_state()
+
+		session = await self.get_session()
+		context = session.context
+		pages = [page for page in context.pages if not page.is_closed()]
+		page = pages[0] if pages else await context.new_page()
+		for extra_page in pages[1:]:
+			await extra_page.close()
+
+		await self._clear_web_storage(session, page)
+		await context.clear_cookies()
+		await context.clear_permissions()
+		await self._load_cookies(context)
+		await page.goto('about:blank')
+
+		session.cached_state = None
+		session.dom_services.clear()
+		self._invalidate_element_handles(session)
 		self.state.target_id = None
+		session.front_page = None
+		self._last_screenshot = None
+		if hasattr(self, 'current_state'):
+			del self.current_state
+
+	async def _clear_web_storage(self, session: BrowserSession, page: Page):
+		"""
+		Clear all storage (local storage, IndexedDB, service workers, Cache Storage, ...) of every origin the context
+		visited or has local storage for, over CDP if the browser supports it
+		"""
+		origins = {origin['origin'] for origin in (await session.context.storage_state())['origins']}
+		origins |= session.visited_origins
+		try:
+			await session.cdp_sessions.page_session(page)
+		except Exception:
+			# Not Chromium, storage can only be cleared from a page of its origin
+			try:
+				await page.evaluate('() => { localStorage.clear(); sessionStorage.clear(); }')
+			except Exception as e:
+				logger.debug(f'Failed to clear web storage: {str(e)}')
+			return
+
+		for origin in origins:
+			await session.cdp_sessions.clear_storage(page, origin)
+		session.visited_origins.clear()
 
 	async def _get_unique_filename(self, directory, filename):
 		"""Generate a unique filename by appending (1), (2), etc., if a file already exists."""
@@ -1328,20 +1894,19 @@ class BrowserContext:
 			counter += 1
 		return new_filename
 
-	async def _get_cdp_targets(self) -> list[dict]:
-		"""Get all CDP targets directly using CDP protocol"""
+	async def get_performance_metrics(self) -> dict[str, float]:
+		"""CDP performance metrics of the current page, e.g. 'JSHeapUsedSize' or 'Nodes' (Chromium only)"""
+		session = await self.get_session()
+		page = await self._get_current_page(session)
+		return await session.cdp_sessions.get_performance_metrics(page)
+
+	async def _get_cdp_targets(self) -> list[TargetInfo]:
+		"""Get all CDP targets over the shared browser CDP session"""
 		if not self.browser.config.cdp_url or not self.session:
 			return []
 
 		try:
-			pages = self.session.context.pages
-			if not pages:
-				return []
-
-			cdp_session = await pages[0].context.new_cdp_session(pages[0])
-			result = await cdp_session.send('Target.getTargets')
-			await cdp_session.detach()
-			return result.get('targetInfos', [])
+			return await self.session.cdp_sessions.get_targets()
 		except Exception as e:
 			logger.debug(f'Failed to get CDP targets: {e}')
 			return []
@@ -0,0 +1,222 @@
+"""
+Network idle detection for pages.
+
+A NetworkTracker is attached to a page once and keeps the set of pending requests that matter for page
+load up to date from the page events. Waiting for idle is an asyncio.Event that a timer sets as soon as
+no relevant request has been pending for the idle window, so there is no polling.
+"""
+
+import asyncio
+import logging
+import re
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+	from playwright.async_api import Page, Request, Response
+
+logger = logging.getLogger(__name__)
+
+# Requests of other resource types (websockets, media, event streams, ...) never block page load
+RELEVANT_RESOURCE_TYPES = {
+	'document',
+	'stylesheet',
+	'image',
+	'font',
+	'script',
+	'iframe',
+}
+
+RELEVANT_CONTENT_TYPES = {
+	'text/html',
+	'text/css',
+	'application/javascript',
+	'image/',
+	'font/',
+	'application/json',
+}
+
+STREAMING_CONTENT_TYPES = {
+	'streaming',
+	'video',
+	'audio',
+	'webm',
+	'mp4',
+	'event-stream',
+	'websocket',
+	'protobuf',
+}
+
+# Substrings of request URLs that are not waited for
+IGNORED_URL_PATTERNS = {
+	# Analytics and tracking
+	'analytics',
+	'tracking',
+	'telemetry',
+	'beacon',
+	'metrics',
+	# Ad-related
+	'doubleclick',
+	'adsystem',
+	'adserver',
+	'advertising',
+	# Social media widgets
+	'facebook.com/plugins',
+	'platform.twitter',
+	'linkedin.com/embed',
+	# Live chat and support
+	'livechat',
+	'zendesk',
+	'intercom',
+	'crisp.chat',
+	'hotjar',
+	# Push notifications
+	'push-notifications',
+	'onesignal',
+	'pushwoosh',
+	# Background sync/heartbeat
+	'heartbeat',
+	'ping',
+	'alive',
+	# WebRTC and streaming
+	'webrtc',
+	'rtmp://',
+	'wss://',
+	# Common CDNs for dynamic content
+	'cloudfront.net',
+	'fastly.net',
+}
+
+MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB
+
+
+def compile_substring_matcher(patterns: set[str]) -> re.Pattern:
+	"""One regex alternation for a set of literal substrings, so a string is scanned once instead of once per pattern"""
+	# Longest first, so overlapping patterns do not shadow each other
+	return re.compile('|'.join(re.escape(pattern) for pattern in sorted(patterns, key=lambda p: (-len(p), p))))
+
+
+IGNORED_URL_MATCHER = compile_substring_matcher(IGNORED_URL_PATTERNS)
+STREAMING_CONTENT_TYPE_MATCHER = compile_substring_matcher(STREAMING_CONTENT_TYPES)
+RELEVANT_CONTENT_TYPE_MATCHER = compile_substring_matcher(RELEVANT_CONTENT_TYPES)
+
+
+def is_relevant_request(request: 'Request') -> bool:
+	"""Whether page load has to wait for the request"""
+	if request.resource_type not in RELEVANT_RESOURCE_TYPES:
+		return False
+
+	url = request.url.lower()
+	if url.startswith(('data:', 'blob:')) or IGNORED_URL_MATCHER.search(url):
+		return False
+
+	headers = request.headers
+	if headers.get('purpose') == 'prefetch' or headers.get('sec-fetch-dest') in ('video', 'audio'):
+		return False
+
+	return True
+
+
+def is_relevant_response(response: 'Response') -> bool:
+	"""Whether the response counts as network activity, streams and large downloads do not"""
+	content_type = response.headers.get('content-type', '').lower()
+	if STREAMING_CONTENT_TYPE_MATCHER.search(content_type) or not RELEVANT_CONTENT_TYPE_MATCHER.search(content_type):
+		return False
+
+	content_length = response.headers.get('content-length')
+	if content_length and content_length.isdigit() and int(content_length) > MAX_CONTENT_LENGTH:
+		return False
+
+	return True
+
+
+class NetworkTracker:
+	"""
+	Tracks the relevant pending requests of a page.
+
+	The listeners are attached once for the lifetime of the page. Whenever the last pending request
+	finishes, a timer is scheduled for the end of the idle window; a new request cancels it.
+	"""
+
+	def __init__(self, page: 'Page', idle_time: float):
+		self.page = page
+		self.idle_time = idle_time
+		# Idle window of the current wait and the longest quiet period that was followed by another request
+		self._window = idle_time
+		self.max_gap = 0.0
+		# Pending requests with the loop time they started at
+		self.pending_requests: dict['Request', float] = {}
+		self._loop = asyncio.get_running_loop()
+		self._last_activity = self._loop.time()
+		self._idle = asyncio.Event()
+		self._idle_timer: Optional[asyncio.TimerHandle] = None
+
+		page.on('request', self._on_request)
+		page.on('response', self._on_response)
+		page.on('requestfailed', self._on_request_failed)
+
+	def _on_request(self, request: 'Request') -> None:
+		if not is_relevant_request(request):
+			return
+		now = self._loop.time()
+		if not self.pending_requests:
+			self.max_gap = max(self.max_gap, now - self._last_activity)
+		self.pending_requests[request] = now
+		self._mark_activity()
+
+	def _on_response(self, response: 'Response') -> None:
+		request = response.request
+		if request not in self.pending_requests:
+			return
+		del self.pending_requests[request]
+		if is_relevant_response(response):
+			self._mark_activity()
+		else:
+			self._schedule_idle()
+
+	def _on_request_failed(self, request: 'Request') -> None:
+		if self.pending_requests.pop(request, None) is not None:
+			self._schedule_idle()
+
+	def _mark_activity(self) -> None:
+		self._last_activity = self._loop.time()
+		self._schedule_idle()
+
+	def _schedule_idle(self) -> None:
+		"""Clear the idle event and, if nothing is pending, set it again at the end of the idle window"""
+		if self._idle_timer is not None:
+			self._idle_timer.cancel()
+			self._idle_timer = None
+		self._idle.clear()
+
+		if self.pending_requests:
+			return
+		delay = max(self._last_activity + self._window - self._loop.time(), 0)
+		self._idle_timer = self._loop.call_later(delay, self._idle.set)
+
+	def _drop_stale_requests(self, max_age: float) -> None:
+		"""Requests that hang for longer than a whole wait (long polling, stuck connections) stop blocking page load"""
+		now = self._loop.time()
+		for request, started in list(self.pending_requests.items()):
+			if now - started > max_age:
+				del self.pending_requests[request]
+
+	async def wait_for_idle(self, timeout: float, idle_time: Optional[float] = None) -> bool:
+		"""
+		Wait until no relevant request has been pending for the idle window, which starts no earlier than
+		this call so requests fired right after an action are still waited for.
+		idle_time overrides the idle window of the tracker for this wait.
+		Returns False if the network did not become idle within timeout seconds.
+		"""
+		self._window = self.idle_time if idle_time is None else idle_time
+		self.max_gap = 0.0
+		self._drop_stale_requests(timeout)
+		self._mark_activity()
+		try:
+			await asyncio.wait_for(self._idle.wait(), timeout)
+			return True
+		except asyncio.TimeoutError:
+			logger.debug(
+				f'Network timeout after {timeout}s with {len(self.pending_requests)} '
+				f'pending requests: {[r.url for r in self.pending_requests]}'
+			)
+			return False
@@ -0,0 +1,130 @@
+"""
+Debounced, atomic persistence of cookies and storage state.
+
+A StatePersister coalesces the save requests of a burst of steps into one write, skips the write if
+the content did not change since the last one and replaces the file atomically, so concurrent saves
+and crashes never leave a half written file behind.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: Any) -> str:
+	"""Hash of the JSON encoding of data, independent of the order of dictionary keys"""
+	return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def normalize_cookies(cookies: list[dict]) -> list[dict]:
+	"""Cookies in a stable order, so the same cookie set always has the same hash"""
+	return sorted(cookies, key=lambda cookie: (cookie.get('domain', ''), cookie.get('path', ''), cookie.get('name', '')))
+
+
+def normalize_storage_state(state: dict) -> dict:
+	return {
+		'cookies': normalize_cookies(state.get('cookies', [])),
+		'origins': sorted(state.get('origins', []), key=lambda origin: origin.get('origin', '')),
+	}
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+	"""Write data to a temporary file next to path and rename it over path"""
+	dirname = os.path.dirname(path)
+	if dirname:
+		os.makedirs(dirname, exist_ok=True)
+	fd, tmp_path = tempfile.mkstemp(dir=dirname or '.', prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			json.dump(data, f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp_path, path)
+	except BaseException:
+		try:
+			os.unlink(tmp_path)
+		except OSError:
+			pass
+		raise
+
+
+class StatePersister:
+	"""
+	Saves the JSON returned by fetch to path.
+
+	schedule() saves debounce seconds after the first request of a burst, flush() saves right away.
+	fetch returns None if there is nothing to save, e.g. before the browser context is created.
+	"""
+
+	def __init__(
+		self,
+		path: str,
+		fetch: Callable[[], Awaitable[Optional[Any]]],
+		debounce: float = 1.0,
+		normalize: Callable[[Any], Any] = lambda data: data,
+		name: str = 'state',
+	):
+		self.path = path
+		self.fetch = fetch
+		self.debounce = debounce
+		self.normalize = normalize
+		self.name = name
+		self.writes = 0
+		self.skipped = 0
+		self._last_hash: Optional[str] = None
+		self._timer: Optional[asyncio.Task] = None
+		self._lock = asyncio.Lock()
+
+		# An unchanged state right after loading the file is not written again
+		if os.path.exists(path):
+			try:
+				with open(path, 'r') as f:
+					self._last_hash = content_hash(normalize(json.load(f)))
+			except (OSError, ValueError, AttributeError, TypeError) as e:
+				logger.debug(f'Failed to read {name} file {path}: {str(e)}')
+
+	def schedule(self) -> None:
+		"""Save after the debounce delay, requests made before the save happens are coalesced"""
+		if self._timer is None or self._timer.done():
+			self._timer = asyncio.create_task(self._delayed_flush())
+
+	async def _delayed_flush(self) -> None:
+		await asyncio.sleep(self.debounce)
+		# Cleared first, so a flush() from now on does not cancel the save in progress
+		self._timer = None
+		await self.flush()
+
+	def cancel(self) -> None:
+		"""Drop a scheduled save"""
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+
+	async def flush(self) -> bool:
+		"""Save now if the state changed, returns whether the file was written"""
+		self.cancel()
+		async with self._lock:
+			try:
+				data = await self.fetch()
+				if data is None:
+					return False
+				data = self.normalize(data)
+				digest = content_hash(data)
+				if digest == self._last_hash:
+					self.skipped += 1
+					return False
+
+				await asyncio.to_thread(write_json_atomic, self.path, data)
+				self._last_hash = digest
+				self.writes += 1
+				logger.debug(f'Saved {self.name} to {self.path}')
+				return True
+			except Exception as e:
+				logger.warning(f'Failed to save {self.name}: {str(e)}')
+				return False
@@ -0,0 +1,165 @@
+"""
+Pool of pre-warmed browser contexts.
+
+Creating a BrowserContext is cheap, but its first use launches the Playwright context, installs the
+init scripts, loads cookies and opens a page. The pool does this ahead of time for a fixed number of
+contexts, hands them out to agents and resets them when they are released.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+from browser_use.browser.context import BrowserContext, BrowserContextConfig
+
+if TYPE_CHECKING:
+	from browser_use.browser.browser import Browser
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserContextPool:
+	"""
+	Keeps up to size warm contexts of one browser.
+
+	acquire() waits until a context is free. release() resets the context for the next task, or closes
+	it and warms a replacement once it has been used max_uses times, is older than max_age seconds or
+	fails to reset.
+	"""
+
+	def __init__(
+		self,
+		browser: 'Browser',
+		size: int = 2,
+		config: Optional[BrowserContextConfig] = None,
+		max_uses: int = 20,
+		max_age: Optional[float] = None,
+	):
+		if size < 1:
+			raise ValueError('Pool size must be at least 1')
+		self.browser = browser
+		self.size = size
+		self.config = config or browser.config.new_context_config
+		self.max_uses = max_uses
+		self.max_age = max_age
+
+		# Idle contexts, close() puts None to wake the acquire() calls waiting for one
+		self._idle: asyncio.Queue[Optional[BrowserContext]] = asyncio.Queue()
+		# Uses and creation time of every context of the pool, idle or handed out
+		self._uses: dict[BrowserContext, int] = {}
+		self._created_at: dict[BrowserContext, float] = {}
+		self._warming: set[asyncio.Task] = set()
+		self._creating = 0
+		self._closed = False
+
+	async def start(self) -> None:
+		"""Warm all contexts of the pool"""
+		missing = self.size - self._count()
+		await asyncio.gather(*(self._add_context() for _ in range(missing)))
+
+	def _count(self) -> int:
+		return len(self._uses) + self._creating
+
+	async def _new_context(self) -> BrowserContext:
+		context = BrowserContext(browser=self.browser, config=self.config)
+		try:
+			# Launches the Playwright context and opens its page
+			await context.get_session()
+		except BaseException:
+			# Also when the warm-up is cancelled by close(), the Playwright context may already be open
+			await context.close()
+			raise
+		return context
+
+	async def _create(self) -> BrowserContext:
+		self._creating += 1
+		try:
+			context = await self._new_context()
+		finally:
+			self._creating -= 1
+		self._uses[context] = 0
+		self._created_at[context] = time.monotonic()
+		return context
+
+	async def _add_context(self) -> None:
+		context = await self._create()
+		if self._closed:
+			await self._discard(context)
+			return
+		self._idle.put_nowait(context)
+
+	async def _discard(self, context: BrowserContext) -> None:
+		del self._uses[context]
+		del self._created_at[context]
+		await context.close()
+
+	def _warm_replacement(self) -> None:
+		task = asyncio.create_task(self._add_context())
+		self._warming.add(task)
+		task.add_done_callback(self._warming.discard)
+		task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+	async def acquire(self) -> BrowserContext:
+		"""Take a warm context, waiting for one to be released if all are in use"""
+		if self._closed:
+			raise RuntimeError('Browser context pool is closed')
+		if self._idle.empty() and self._count() < self.size:
+			# Not warmed yet or a replacement failed to start, errors reach the caller
+			return await self._create()
+		context = await self._idle.get()
+		if context is None:
+			# Closed while waiting, the next waiter is woken the same way
+			self._idle.put_nowait(None)
+			raise RuntimeError('Browser context pool is closed')
+		return context
+
+	async def release(self, context: BrowserContext) -> None:
+		"""Return a context to the pool, resetting or recycling it"""
+		if context not in self._uses:
+			raise ValueError('Browser context does not belong to this pool')
+
+		self._uses[context] += 1
+		expired = self.max_age is not None and time.monotonic() - self._created_at[context] > self.max_age
+		if not self._closed and self._uses[context] < self.max_uses and not expired:
+			try:
+				await context.reset_for_reuse()
+				self._idle.put_nowait(context)
+				return
+			except Exception as e:
+				logger.debug(f'Failed to reset browser context, recycling it: {str(e)}')
+
+		await self._discard(context)
+		if not self._closed:
+			self._warm_replacement()
+
+	@asynccontextmanager
+	async def context(self) -> AsyncIterator[BrowserContext]:
+		"""Acquire a context for the duration of the block"""
+		context = await self.acquire()
+		try:
+			yield context
+		finally:
+			await self.release(context)
+
+	async def close(self) -> None:
+		"""
+		Close all idle contexts and stop the warm-ups in progress, contexts still in use are closed when they are released.
+		Pending and later acquire() calls raise RuntimeError.
+		"""
+		self._closed = True
+		idle = []
+		while not self._idle.empty():
+			context = self._idle.get_nowait()
+			if context is not None:
+				idle.append(context)
+		self._idle.put_nowait(None)
+
+		warming = list(self._warming)
+		for task in warming:
+			task.cancel()
+		# A cancelled warm-up closes its half-started context, one that finished meanwhile discards its context
+		await asyncio.gather(*warming, return_exceptions=True)
+		for context in idle:
+			await self._discard(context)
@@ -0,0 +1,164 @@
+"""
+Request blocking at the network layer.
+
+A ResourcePolicy in BrowserContextConfig installs a route handler on the browser context that aborts
+requests before they are sent: by resource type, by tracker and ad domains, by custom predicates and,
+for main frame navigations, by the allowed_domains of the context.
+"""
+
+import logging
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+	from playwright.async_api import Request, Route
+
+logger = logging.getLogger(__name__)
+
+# Well known ad and tracker domains, blocked with ResourcePolicy.block_trackers (subdomains included)
+TRACKER_DOMAINS = [
+	'doubleclick.net',
+	'googlesyndication.com',
+	'googleadservices.com',
+	'google-analytics.com',
+	'googletagmanager.com',
+	'googletagservices.com',
+	'adservice.google.com',
+	'amazon-adsystem.com',
+	'adnxs.com',
+	'criteo.com',
+	'criteo.net',
+	'taboola.com',
+	'outbrain.com',
+	'scorecardresearch.com',
+	'quantserve.com',
+	'hotjar.com',
+	'mixpanel.com',
+	'segment.io',
+	'connect.facebook.net',
+	'ads.linkedin.com',
+	'analytics.twitter.com',
+	'bat.bing.com',
+	'clarity.ms',
+]
+
+
+def url_host(url: str) -> str:
+	"""Lowercase host of a URL without port, empty if the URL has none"""
+	host = urlparse(url).netloc.lower()
+	# Remove port number if present
+	if ':' in host:
+		host = host.split(':')[0]
+	return host
+
+
+class DomainSuffixTrie:
+	"""
+	Matches hosts against a set of domains and their subdomains.
+
+	Domains are stored label by label from the top level down, so a lookup walks the labels of the
+	host once instead of comparing it with every domain.
+	"""
+
+	_END = ''
+
+	def __init__(self, domains: Iterable[str]):
+		self.root: dict = {}
+		for domain in domains:
+			node = self.root
+			for label in reversed(domain.lower().strip('.').split('.')):
+				node = node.setdefault(label, {})
+			node[self._END] = True
+
+	def matches(self, host: str) -> bool:
+		"""Whether the host is one of the domains or a subdomain of one"""
+		if not host:
+			return False
+		node = self.root
+		for label in reversed(host.split('.')):
+			node = node.get(label)
+			if node is None:
+				return False
+			if self._END in node:
+				return True
+		return False
+
+
+@dataclass
+class ResourcePolicy:
+	"""
+	Which requests the browser context aborts.
+
+	Routing requests disables the HTTP cache of the browser, so only use a policy if the blocked
+	requests outweigh it.
+	"""
+
+	# Playwright resource types, e.g. 'image', 'media', 'font', 'stylesheet'
+	blocked_resource_types: set[str] = field(default_factory=set)
+	blocked_domains: list[str] = field(default_factory=list)
+	# Also block the ad and tracker domains of TRACKER_DOMAINS
+	block_trackers: bool = False
+	# Requests for which any predicate returns True are blocked
+	predicates: list[Callable[['Request'], bool]] = field(default_factory=list)
+	# Abort main frame navigations to domains outside of allowed_domains before they load
+	enforce_allowed_domains: bool = True
+
+	@classmethod
+	def text_only(cls) -> 'ResourcePolicy':
+		"""Policy for agents that do not look at screenshots"""
+		return cls(blocked_resource_types={'image', 'media', 'font'}, block_trackers=True)
+
+
+class ResourceBlocker:
+	"""Route handler that applies a ResourcePolicy and counts the blocked requests by reason"""
+
+	def __init__(self, policy: ResourcePolicy, allowed_domains: Optional[list[str]] = None, history_size: int = 100):
+		self.policy = policy
+		blocked_domains = list(policy.blocked_domains) + (TRACKER_DOMAINS if policy.block_trackers else [])
+		self.blocked_domains = DomainSuffixTrie(blocked_domains) if blocked_domains else None
+		self.allowed_domains = (
+			DomainSuffixTrie(allowed_domains) if allowed_domains and policy.enforce_allowed_domains else None
+		)
+		# Blocked requests by reason, and the last blocked ones as (reason, url)
+		self.blocked_counts: Counter[str] = Counter()
+		self.blocked_requests: deque[tuple[str, str]] = deque(maxlen=history_size)
+
+	def block_reason(self, request: 'Request') -> Optional[str]:
+		"""Why the request is blocked, None if it is allowed"""
+		if request.resource_type in self.policy.blocked_resource_types:
+			return f'resource_type:{request.resource_type}'
+
+		host = url_host(request.url)
+		if self.allowed_domains and request.is_navigation_request() and request.frame.parent_frame is None:
+			if not self.allowed_domains.matches(host):
+				return 'not_allowed'
+
+		if self.blocked_domains and self.blocked_domains.matches(host):
+			return 'domain'
+
+		for predicate in self.policy.predicates:
+			try:
+				if predicate(request):
+					return 'predicate'
+			except Exception as e:
+				logger.debug(f'Resource policy predicate failed for {request.url}: {str(e)}')
+
+		return None
+
+	async def handle(self, route: 'Route') -> None:
+		request = route.request
+		reason = self.block_reason(request)
+		if reason is None:
+			# Other route handlers, like a HAR replay, still get the request
+			await route.fallback()
+			return
+
+		self.blocked_counts[reason] += 1
+		self.blocked_requests.append((reason, request.url))
+		await route.abort('blockedbyclient')
+
+	@property
+	def total_blocked(self) -> int:
+		return sum(self.blocked_counts.values())
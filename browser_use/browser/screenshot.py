@@ -0,0 +1,176 @@
+"""
+Screenshot encoding, downscaling, highlight rendering and change detection.
+
+Re-encoding to WebP, downscaling, drawing highlights and the perceptual hash need Pillow, the optional
+screenshots extra. It is imported lazily so screenshots in the default PNG or JPEG format work without it.
+"""
+
+import io
+from typing import TYPE_CHECKING, Literal, Optional
+
+if TYPE_CHECKING:
+	from PIL.Image import Image
+
+	from browser_use.dom.views import HighlightRect
+
+ScreenshotFormat = Literal['png', 'jpeg', 'webp']
+
+# Leading characters of the base64 encoding of each format's magic bytes
+BASE64_MIME_PREFIXES = {
+	'iVBOR': 'image/png',
+	'/9j/': 'image/jpeg',
+	'UklGR': 'image/webp',
+}
+
+# Same colors as the overlays buildDomTree.js draws into the page
+HIGHLIGHT_COLORS = [
+	'#FF0000',
+	'#00FF00',
+	'#0000FF',
+	'#FFA500',
+	'#800080',
+	'#008080',
+	'#FF69B4',
+	'#4B0082',
+	'#FF4500',
+	'#2E8B57',
+	'#DC143C',
+	'#4682B4',
+]
+
+
+def screenshot_mime_type(screenshot_b64: str) -> str:
+	"""Mime type of a base64 encoded screenshot, for data urls"""
+	for prefix, mime_type in BASE64_MIME_PREFIXES.items():
+		if screenshot_b64.startswith(prefix):
+			return mime_type
+	return 'image/png'
+
+
+def require_pillow(feature: str) -> None:
+	"""Raise if Pillow is not installed, so a config that needs it fails when it is created instead of on the first screenshot"""
+	try:
+		import PIL  # noqa: F401
+	except ImportError as e:
+		raise ImportError(f"{feature} needs Pillow, install it with pip install 'browser-use[screenshots]'") from e
+
+
+def needs_processing(format: ScreenshotFormat, max_dimension: Optional[int], highlights: bool = False) -> bool:
+	"""Whether the screenshot of the browser has to be re-encoded with Pillow, the browser encodes PNG and JPEG itself"""
+	return format == 'webp' or max_dimension is not None or highlights
+
+
+def draw_highlights(image: 'Image', highlights: dict[int, 'HighlightRect'], scale: float) -> 'Image':
+	"""
+	Draw a box and an index label for every highlight, like the overlays of buildDomTree.js.
+	The rects are in CSS pixels, scale is the number of screenshot pixels per CSS pixel.
+	"""
+	from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+	overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
+	draw = ImageDraw.Draw(overlay)
+	border = max(1, round(2 * scale))
+	label_width, label_height = 20 * scale, 16 * scale
+	fonts = {}
+
+	for index, rect in sorted(highlights.items()):
+		left, top = rect.x * scale, rect.y * scale
+		width, height = rect.width * scale, rect.height * scale
+		if left + width < 0 or top + height < 0 or left > image.width or top > image.height:
+			continue
+
+		red, green, blue = ImageColor.getrgb(HIGHLIGHT_COLORS[index % len(HIGHLIGHT_COLORS)])
+		draw.rectangle(
+			(left, top, left + width - 1, top + height - 1),
+			fill=(red, green, blue, 0x1A),
+			outline=(red, green, blue, 255),
+			width=border,
+		)
+
+		label_top = top + 2 * scale
+		label_left = left + width - label_width - 2 * scale
+		if width < label_width + 4 * scale or height < label_height + 4 * scale:
+			label_top = top - label_height - 2 * scale
+			label_left = left + width - label_width
+
+		font_size = round(min(12, max(8, rect.height / 2)) * scale)
+		if font_size not in fonts:
+			try:
+				fonts[font_size] = ImageFont.load_default(font_size)
+			except (TypeError, OSError):
+				# Pillow before 10.1 or without FreeType only has a fixed size bitmap font
+				fonts[font_size] = ImageFont.load_default()
+		font = fonts[font_size]
+		text = str(index)
+		text_left, text_top, text_right, text_bottom = draw.textbbox((0, 0), text, font=font)
+		text_width, text_height = text_right - text_left, text_bottom - text_top
+		box_width = max(label_width, text_width + 8 * scale)
+		draw.rounded_rectangle(
+			(label_left, label_top, label_left + box_width, label_top + label_height),
+			radius=4 * scale,
+			fill=(red, green, blue, 255),
+		)
+		draw.text(
+			(label_left + (box_width - text_width) / 2 - text_left, label_top + (label_height - text_height) / 2 - text_top),
+			text,
+			font=font,
+			fill='white',
+		)
+
+	return Image.alpha_composite(image.convert('RGBA'), overlay)
+
+
+def process_screenshot(
+	data: bytes,
+	format: ScreenshotFormat,
+	quality: int,
+	max_dimension: Optional[int],
+	highlights: Optional[dict[int, 'HighlightRect']] = None,
+	viewport_width: Optional[float] = None,
+) -> bytes:
+	"""
+	Draw the highlights, downscale the screenshot so its longest side is at most max_dimension and encode it
+	in format. viewport_width is the width of the screenshot in CSS pixels, needed with highlights.
+	"""
+	from PIL import Image
+
+	image = Image.open(io.BytesIO(data))
+	if highlights:
+		# Drawn at full resolution, so labels stay legible after downscaling
+		image = draw_highlights(image, highlights, image.width / viewport_width if viewport_width else 1.0)
+
+	if max_dimension is not None and max(image.size) > max_dimension:
+		# thumbnail keeps the aspect ratio
+		image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+	output = io.BytesIO()
+	if format == 'png':
+		image.save(output, format='PNG', optimize=False)
+	else:
+		if image.mode not in ('RGB', 'L'):
+			image = image.convert('RGB')
+		image.save(output, format=format.upper(), quality=quality)
+	return output.getvalue()
+
+
+def perceptual_hash(data: bytes, size: int = 16) -> int:
+	"""
+	Difference hash of the screenshot: one bit per pair of horizontally adjacent cells of a
+	size x size grayscale thumbnail, set if the left cell is brighter.
+	"""
+	from PIL import Image
+
+	image = Image.open(io.BytesIO(data))
+	image.draft('L', (size * 4, size * 4))  # JPEG only, decodes at a reduced size
+	pixels = list(image.convert('L').resize((size + 1, size), Image.Resampling.BILINEAR).getdata())
+
+	value = 0
+	for row in range(size):
+		offset = row * (size + 1)
+		for col in range(size):
+			value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+	return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+	return bin(a ^ b).count('1')
@@ -0,0 +1,122 @@
+"""
+Per-domain page settle times learned from previous page loads.
+
+After every wait for a page to load, the longest quiet period of the network that was followed by
+another request and the time until the last DOM mutation are recorded for the domain of the page.
+The next waits on that domain use a percentile of these samples instead of the global floors.
+"""
+
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from browser_use.browser.persistence import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Keeps the time of the last DOM mutation of every document, installed as an init script
+DOM_MUTATION_TIME_INIT_SCRIPT = """
+(() => {
+	window.__browserUseLastMutation = performance.now();
+	new MutationObserver((records) => {
+		const ownHighlights = records.every((record) => {
+			const target = record.target.nodeType === Node.ELEMENT_NODE ? record.target : record.target.parentElement;
+			return !!(target && target.closest && target.closest('#playwright-highlight-container')) ||
+				[...record.addedNodes, ...record.removedNodes].some((node) => node.id === 'playwright-highlight-container');
+		});
+		if (!ownHighlights) window.__browserUseLastMutation = performance.now();
+	}).observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+})();
+"""
+
+# Seconds since the last DOM mutation, null if the document was created before the init script was added
+DOM_QUIET_TIME_SCRIPT = """
+() => window.__browserUseLastMutation === undefined ? null : (performance.now() - window.__browserUseLastMutation) / 1000
+"""
+
+
+@dataclass
+class SettleTimes:
+	"""How long to wait for a page: the network idle window and the minimum total wait"""
+
+	network_idle: float
+	minimum_wait: float
+
+
+class SettleStats:
+	"""
+	Settle time samples per domain, stored as JSON.
+
+	Learned times are a percentile of the samples with a margin and never exceed the configured
+	times, which stay the safety cap. Every explore_every-th wait on a domain uses the configured
+	times, so gaps longer than a learned window can still be observed.
+	"""
+
+	def __init__(
+		self,
+		path: Optional[str] = None,
+		percentile: float = 0.9,
+		margin: float = 1.25,
+		min_samples: int = 5,
+		max_samples: int = 50,
+		explore_every: int = 10,
+	):
+		self.path = path
+		self.percentile = percentile
+		self.margin = margin
+		self.min_samples = min_samples
+		self.max_samples = max_samples
+		self.explore_every = explore_every
+		# domain -> sample name ('network_gap' or 'dom_settle') -> recent samples in seconds
+		self.samples: dict[str, dict[str, deque[float]]] = {}
+		self.waits: dict[str, int] = {}
+		self.dirty = False
+
+		if path and os.path.exists(path):
+			try:
+				with open(path, 'r') as f:
+					for domain, series in json.load(f).items():
+						self.samples[domain] = {name: deque(values, maxlen=max_samples) for name, values in series.items()}
+				logger.debug(f'Loaded page settle stats of {len(self.samples)} domains from {path}')
+			except (OSError, ValueError, AttributeError) as e:
+				logger.warning(f'Failed to load page settle stats: {str(e)}')
+
+	def record(self, domain: str, network_gap: Optional[float], dom_settle: Optional[float]) -> None:
+		series = self.samples.setdefault(domain, {})
+		for name, value in (('network_gap', network_gap), ('dom_settle', dom_settle)):
+			if value is not None:
+				series.setdefault(name, deque(maxlen=self.max_samples)).append(round(max(value, 0.0), 3))
+				self.dirty = True
+
+	def learned(self, domain: str, name: str, cap: float) -> float:
+		"""Percentile of the samples with the margin, or the cap if there are not enough samples"""
+		values = sorted(self.samples.get(domain, {}).get(name, ()))
+		if len(values) < self.min_samples:
+			return cap
+		value = values[min(int(self.percentile * len(values)), len(values) - 1)]
+		return min(value * self.margin, cap)
+
+	def settle_times(self, domain: str, network_idle_cap: float, minimum_wait_cap: float) -> SettleTimes:
+		waits = self.waits.get(domain, 0) + 1
+		self.waits[domain] = waits
+		if waits % self.explore_every == 0:
+			return SettleTimes(network_idle=network_idle_cap, minimum_wait=minimum_wait_cap)
+		return SettleTimes(
+			network_idle=self.learned(domain, 'network_gap', network_idle_cap),
+			minimum_wait=self.learned(domain, 'dom_settle', minimum_wait_cap),
+		)
+
+	def save(self) -> None:
+		if not self.path or not self.dirty:
+			return
+		try:
+			# Written through a temporary file, a crash mid-write keeps the previous stats
+			write_json_atomic(
+				self.path, {domain: {name: list(values) for name, values in series.items()} for domain, series in self.samples.items()}
+			)
+			self.dirty = False
+		except OSError as e:
+			logger.warning(f'Failed to save page settle stats: {str(e)}')
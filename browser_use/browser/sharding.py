@@ -0,0 +1,267 @@
+"""
+Browser contexts spread over several Chromium processes.
+
+One Chromium process becomes CPU and memory bound when dozens of agents share it. ShardedBrowser
+launches a fixed number of processes from one Playwright driver, places every new context on the
+least loaded process, relaunches processes as soon as they crash and drains and relaunches
+processes that served too many contexts or grew too large.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from playwright.async_api import CDPSession, Playwright, async_playwright
+
+from browser_use.browser.browser import Browser, BrowserConfig
+from browser_use.browser.context import BrowserContext, BrowserContextConfig
+from browser_use.utils import time_execution_async
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ShardLoad:
+	"""Load of one Chromium process"""
+
+	index: int
+	connected: bool
+	draining: bool
+	contexts: int
+	pages: int
+	# Contexts placed on the process since it was (re)launched
+	served: int
+	restarts: int
+	# Resident memory of the browser and its child processes, None without psutil
+	memory_mb: Optional[float] = None
+
+
+class BrowserShard:
+	"""One Chromium process, wrapped in a Browser so BrowserContext can use it unchanged"""
+
+	def __init__(self, index: int):
+		self.index = index
+		self.browser: Browser | None = None
+		self.served = 0
+		self.restarts = 0
+		# Contexts being set up on the process, not visible in its contexts yet
+		self.placing = 0
+		# No new contexts are placed on a draining process, it is relaunched once its contexts are closed
+		self.draining = False
+		# Browser CDP session of the memory probe, kept until the process is relaunched
+		self.cdp_session: CDPSession | None = None
+
+	@property
+	def connected(self) -> bool:
+		return (
+			self.browser is not None
+			and self.browser.playwright_browser is not None
+			and self.browser.playwright_browser.is_connected()
+		)
+
+	@property
+	def contexts(self) -> int:
+		if not self.connected:
+			return 0
+		assert self.browser is not None and self.browser.playwright_browser is not None
+		return len(self.browser.playwright_browser.contexts)
+
+	@property
+	def pages(self) -> int:
+		if not self.connected:
+			return 0
+		assert self.browser is not None and self.browser.playwright_browser is not None
+		return sum(len(context.pages) for context in self.browser.playwright_browser.contexts)
+
+	@property
+	def load(self) -> int:
+		return self.contexts + self.placing
+
+
+class ShardedBrowser:
+	"""
+	Launches shards Chromium processes with the settings of config and places contexts on them.
+
+	A process is relaunched as soon as it disconnects (crashes), and drained and relaunched once it served
+	max_contexts_per_process contexts or its memory exceeds max_memory_mb (requires psutil).
+	"""
+
+	def __init__(
+		self,
+		config: BrowserConfig = BrowserConfig(),
+		shards: int = 2,
+		max_contexts_per_process: Optional[int] = 200,
+		max_memory_mb: Optional[float] = None,
+	):
+		if config.cdp_url or config.wss_url or config.chrome_instance_path:
+			raise ValueError('ShardedBrowser launches its own processes, it cannot connect to an existing browser')
+		if shards < 1:
+			raise ValueError('At least one shard is required')
+		self.config = config
+		self.max_contexts_per_process = max_contexts_per_process
+		self.max_memory_mb = max_memory_mb
+		self.playwright: Playwright | None = None
+		self.shards = [BrowserShard(index) for index in range(shards)]
+		self._lock = asyncio.Lock()
+		self._relaunching: set[asyncio.Task] = set()
+
+	@time_execution_async('--start (sharded browser)')
+	async def start(self) -> None:
+		"""Launch all processes"""
+		async with self._lock:
+			if self.playwright is None:
+				self.playwright = await async_playwright().start()
+			await asyncio.gather(*(self._launch(shard) for shard in self.shards if not shard.connected))
+
+	async def _launch(self, shard: BrowserShard) -> None:
+		assert self.playwright is not None
+		browser = Browser(config=self.config)
+		browser.playwright_browser = await browser._setup_standard_browser(self.playwright)
+		browser.playwright_browser.on('disconnected', lambda _: self._on_disconnected(shard, browser))
+		shard.browser = browser
+		shard.served = 0
+		shard.draining = False
+		shard.cdp_session = None
+		logger.debug(f'Launched browser shard {shard.index}')
+
+	def _on_disconnected(self, shard: BrowserShard, browser: Browser) -> None:
+		# Processes closed on purpose are detached from their shard first
+		if shard.browser is not browser:
+			return
+		logger.warning(f'Browser shard {shard.index} disconnected, relaunching it')
+		shard.cdp_session = None
+		task = asyncio.create_task(self._relaunch_crashed(shard, browser))
+		self._relaunching.add(task)
+		task.add_done_callback(self._relaunching.discard)
+
+	async def _relaunch_crashed(self, shard: BrowserShard, browser: Browser) -> None:
+		async with self._lock:
+			# Relaunched by a placement meanwhile, or the sharded browser was closed
+			if shard.browser is not browser or self.playwright is None:
+				return
+			try:
+				await self._relaunch(shard)
+			except Exception as e:
+				# The next placement tries again
+				logger.warning(f'Failed to relaunch browser shard {shard.index}: {str(e)}')
+
+	async def _relaunch(self, shard: BrowserShard) -> None:
+		browser = shard.browser
+		shard.browser = None
+		shard.cdp_session = None
+		if browser is not None and browser.playwright_browser is not None:
+			try:
+				await browser.playwright_browser.close()
+			except Exception as e:
+				logger.debug(f'Failed to close browser shard {shard.index}: {str(e)}')
+		shard.restarts += 1
+		await self._launch(shard)
+
+	async def _memory_mb(self, shard: BrowserShard) -> Optional[float]:
+		"""Resident memory of the processes of the shard, from their pids over CDP"""
+		try:
+			import psutil
+		except ImportError:
+			return None
+		if not shard.connected:
+			return None
+
+		assert shard.browser is not None and shard.browser.playwright_browser is not None
+		try:
+			if shard.cdp_session is None:
+				shard.cdp_session = await shard.browser.playwright_browser.new_browser_cdp_session()
+			info = await shard.cdp_session.send('SystemInfo.getProcessInfo')
+		except Exception as e:
+			logger.debug(f'Failed to get process info of browser shard {shard.index}: {str(e)}')
+			# Attached again on the next probe
+			shard.cdp_session = None
+			return None
+
+		rss = 0
+		for process in info.get('processInfo', []):
+			try:
+				rss += psutil.Process(process['id']).memory_info().rss
+			except (psutil.NoSuchProcess, psutil.AccessDenied):
+				pass
+		return rss / (1024 * 1024)
+
+	async def _maintain(self) -> None:
+		"""Relaunch crashed processes, mark bloated ones as draining and relaunch drained ones"""
+		for shard in self.shards:
+			if not shard.connected:
+				logger.info(f'Relaunching disconnected browser shard {shard.index}')
+				await self._relaunch(shard)
+				continue
+
+			if not shard.draining:
+				too_many = self.max_contexts_per_process is not None and shard.served >= self.max_contexts_per_process
+				memory = await self._memory_mb(shard) if self.max_memory_mb is not None else None
+				too_large = memory is not None and self.max_memory_mb is not None and memory > self.max_memory_mb
+				if too_many or too_large:
+					logger.debug(f'Draining browser shard {shard.index} (served {shard.served}, memory {memory} MB)')
+					shard.draining = True
+
+			if shard.draining and shard.load == 0:
+				logger.info(f'Relaunching drained browser shard {shard.index}')
+				await self._relaunch(shard)
+
+	async def _place(self) -> BrowserShard:
+		async with self._lock:
+			if self.playwright is None:
+				self.playwright = await async_playwright().start()
+			await self._maintain()
+
+			# All processes draining still has to place the context somewhere
+			candidates = [shard for shard in self.shards if not shard.draining] or self.shards
+			shard = min(candidates, key=lambda shard: (shard.load, shard.served))
+			shard.placing += 1
+			shard.served += 1
+			if self.max_contexts_per_process is not None and shard.served >= self.max_contexts_per_process:
+				shard.draining = True
+			return shard
+
+	async def new_context(self, config: Optional[BrowserContextConfig] = None) -> BrowserContext:
+		"""
+		Create a context on the least loaded process. The context is set up right away, so it counts
+		towards the load of its process until it is closed.
+		"""
+		shard = await self._place()
+		try:
+			assert shard.browser is not None
+			context = BrowserContext(browser=shard.browser, config=config or self.config.new_context_config)
+			await context.get_session()
+			return context
+		finally:
+			shard.placing -= 1
+
+	async def get_load(self) -> list[ShardLoad]:
+		"""Current load of every process"""
+		loads = []
+		for shard in self.shards:
+			loads.append(
+				ShardLoad(
+					index=shard.index,
+					connected=shard.connected,
+					draining=shard.draining,
+					contexts=shard.contexts,
+					pages=shard.pages,
+					served=shard.served,
+					restarts=shard.restarts,
+					memory_mb=await self._memory_mb(shard),
+				)
+			)
+		return loads
+
+	async def close(self) -> None:
+		"""Close all processes and the Playwright driver"""
+		async with self._lock:
+			for shard in self.shards:
+				if shard.browser is not None:
+					browser = shard.browser
+					shard.browser = None
+					shard.cdp_session = None
+					await browser.close()
+			if self.playwright is not None:
+				await self.playwright.stop()
+				self.playwright = None
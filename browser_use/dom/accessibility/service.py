@@ -0,0 +1,192 @@
+"""
+Low cost DOM state built from the browser's accessibility tree.
+
+Roles and accessible names are computed natively by the browser, so the interactive elements are listed
+from CDP Accessibility.getFullAXTree without walking the DOM in the page or computing styles.
+Their xpaths and attributes come from one DOM.getDocument call.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.views import DOMElementNode, DOMState, DOMTextNode, SelectorMap
+from browser_use.utils import time_execution_async, time_execution_sync
+
+if TYPE_CHECKING:
+	from playwright.async_api import CDPSession, Page
+
+	from browser_use.browser.cdp import CDPSessionManager
+
+logger = logging.getLogger(__name__)
+
+ELEMENT_NODE = 1
+
+# Roles of the accessibility tree that are listed as interactive elements
+INTERACTIVE_ROLES = {
+	'button',
+	'checkbox',
+	'combobox',
+	'link',
+	'listbox',
+	'menuitem',
+	'menuitemcheckbox',
+	'menuitemradio',
+	'option',
+	'radio',
+	'searchbox',
+	'slider',
+	'spinbutton',
+	'switch',
+	'tab',
+	'textbox',
+	'treeitem',
+	'MenuListOption',
+	'MenuListPopup',
+}
+
+# Roles whose name is shown as text when they are not inside an interactive element
+TEXT_ROLES = {'StaticText'}
+
+
+@dataclass
+class DOMNodeInfo:
+	tag_name: str
+	xpath: str
+	attributes: dict[str, str]
+
+
+def _ax_value(ax_node: dict, key: str) -> Optional[str]:
+	value = ax_node.get(key)
+	if not value:
+		return None
+	return value.get('value')
+
+
+@time_execution_sync('--index_dom_nodes')
+def index_dom_nodes(root: dict) -> dict[int, DOMNodeInfo]:
+	"""
+	Map the backend node ids of a DOM.getDocument(pierce=True) result to tag, xpath and attributes.
+	Xpaths follow buildDomTree.js: paths restart in iframe documents and shadow root children get an empty xpath.
+	"""
+	nodes: dict[int, DOMNodeInfo] = {}
+	# (node, xpath of the node, whether the node is a shadow root)
+	stack: list[tuple[dict, str, bool]] = [(root, '', False)]
+	while stack:
+		node, xpath, is_shadow_root = stack.pop()
+
+		if node.get('nodeType') == ELEMENT_NODE:
+			flat = node.get('attributes', [])
+			nodes[node['backendNodeId']] = DOMNodeInfo(
+				tag_name=node.get('localName') or node['nodeName'].lower(),
+				xpath=xpath,
+				attributes={flat[i]: flat[i + 1] for i in range(0, len(flat), 2)},
+			)
+
+		pending: list[tuple[dict, str, bool]] = []
+		if 'contentDocument' in node:
+			pending.append((node['contentDocument'], '', False))
+		for shadow_root in node.get('shadowRoots', []):
+			pending.append((shadow_root, '', True))
+
+		tag_counts: dict[str, int] = {}
+		for child in node.get('children', []):
+			child_xpath = ''
+			if not is_shadow_root and child.get('nodeType') == ELEMENT_NODE:
+				count = tag_counts.get(child['nodeName'], 0) + 1
+				tag_counts[child['nodeName']] = count
+				segment = child['nodeName'].lower() + (f'[{count}]' if count > 1 else '')
+				child_xpath = f'{xpath}/{segment}' if xpath else segment
+			pending.append((child, child_xpath, False))
+
+		stack.extend(reversed(pending))
+
+	return nodes
+
+
+@time_execution_sync('--build_accessibility_tree')
+def build_accessibility_tree(ax_nodes: list[dict], dom_nodes: dict[int, DOMNodeInfo]) -> tuple[DOMElementNode, SelectorMap]:
+	"""
+	Build a flat element tree: interactive nodes of the accessibility tree become highlighted elements with their
+	accessible name as text, and the text outside of them becomes text nodes of the root, all in document order.
+	"""
+	root = DOMElementNode(is_visible=True, parent=None, tag_name='body', xpath='/body', attributes={}, children=[])
+	selector_map: SelectorMap = {}
+	if not ax_nodes:
+		return root, selector_map
+
+	by_id = {ax_node['nodeId']: ax_node for ax_node in ax_nodes}
+	stack = [ax_nodes[0]]
+	while stack:
+		ax_node = stack.pop()
+		role = _ax_value(ax_node, 'role')
+		name = (_ax_value(ax_node, 'name') or '').strip()
+
+		if not ax_node.get('ignored') and role in INTERACTIVE_ROLES:
+			dom_node = dom_nodes.get(ax_node.get('backendDOMNodeId', -1))
+			if dom_node is not None:
+				element = DOMElementNode(
+					is_visible=True,
+					parent=root,
+					tag_name=dom_node.tag_name,
+					xpath=dom_node.xpath,
+					attributes=dom_node.attributes,
+					children=[],
+					is_interactive=True,
+					is_top_element=True,
+					is_in_viewport=True,
+					highlight_index=len(selector_map),
+				)
+				if name:
+					element.children.append(DOMTextNode(is_visible=True, parent=element, text=name))
+				root.children.append(element)
+				selector_map[element.highlight_index] = element
+				# The accessible name already covers the content of the element
+				continue
+
+		if not ax_node.get('ignored') and role in TEXT_ROLES and name:
+			root.children.append(DOMTextNode(is_visible=True, parent=root, text=name))
+			continue
+
+		stack.extend(by_id[child_id] for child_id in reversed(ax_node.get('childIds', [])) if child_id in by_id)
+
+	return root, selector_map
+
+
+class AccessibilityTreeService:
+	"""
+	Extracts the DOM state of a page from its accessibility tree.
+
+	Nothing is evaluated in the page, so elements are not highlighted (nor have highlight rects) and visibility is what the browser
+	exposes to assistive technology (hidden elements are ignored, elements outside of the viewport are not).
+	"""
+
+	def __init__(self, page: 'Page', cdp_sessions: Optional['CDPSessionManager'] = None):
+		self.page = page
+		self.cdp_sessions = cdp_sessions
+		self.cdp_session: Optional['CDPSession'] = None
+
+	async def _send(self, method: str, params: Optional[dict] = None) -> dict:
+		"""Send over the shared sessions of the browser context if there are any, else over an own session"""
+		if self.cdp_sessions is not None:
+			return await self.cdp_sessions.send(self.page, method, params)
+		if self.cdp_session is None:
+			self.cdp_session = await self.page.context.new_cdp_session(self.page)
+		return await self.cdp_session.send(method, params)
+
+	@time_execution_async('--get_clickable_elements_accessibility')
+	async def get_clickable_elements(
+		self,
+		highlight_elements: bool = True,
+		focus_element: int = -1,
+		viewport_expansion: int = 0,
+		return_highlight_rects: bool = False,
+	) -> DOMState:
+		document = await self._send('DOM.getDocument', {'depth': -1, 'pierce': True})
+		ax_tree = await self._send('Accessibility.getFullAXTree')
+
+		element_tree, selector_map = build_accessibility_tree(ax_tree['nodes'], index_dom_nodes(document['root']))
+		HistoryTreeProcessor.hash_dom_tree(element_tree)
+
+		return DOMState(element_tree=element_tree, selector_map=selector_map)
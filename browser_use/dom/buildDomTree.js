@@ -4,9 +4,32 @@
     focusHighlightIndex: -1,
     viewportExpansion: 0,
     debugMode: false,
+    incremental: false,
+    baseVersion: null,
+    compactPayload: false,
+    occlusionMode: "point",
+    descendIframes: true,
+    deferHighlights: false,
+    highlightTargets: null,
+    persistentCache: false,
+    collectHighlightRects: false,
   }
 ) => {
-  const { doHighlightElements, focusHighlightIndex, viewportExpansion, debugMode } = args;
+  const {
+    doHighlightElements,
+    focusHighlightIndex,
+    viewportExpansion,
+    debugMode,
+    incremental = false,
+    baseVersion = null,
+    compactPayload = false,
+    occlusionMode = "point",
+    descendIframes = true,
+    deferHighlights = false,
+    highlightTargets = null,
+    persistentCache = false,
+    collectHighlightRects = false,
+  } = args;
   let highlightIndex = 0; // Reset highlight index
 
   // Add timing stack to handle recursion
@@ -99,11 +122,13 @@
     return result;
   }
 
-  // Add caching mechanisms at the top level
+  // Add caching mechanisms at the top level. With persistentCache the maps are
+  // taken over from the page cache further down and survive between calls.
   const DOM_CACHE = {
     boundingRects: new WeakMap(),
     computedStyles: new WeakMap(),
     clearCache: () => {
+      if (PAGE_CACHE) return;
       DOM_CACHE.boundingRects = new WeakMap();
       DOM_CACHE.computedStyles = new WeakMap();
     }
@@ -187,6 +212,456 @@
 
   const HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container";
 
+  /**
+   * Occlusion checks in "grid" mode are deferred until the walk is done and then
+   * resolved per cell of a screen-space grid: candidates whose center falls into
+   * the same cell share one elementFromPoint hit test if the tested point is
+   * inside their rect. "point" mode hit tests every candidate during the walk.
+   */
+  const OCCLUSION_GRID = occlusionMode === "grid";
+  const OCCLUSION_GRID_CELL_SIZE = 16;
+  const PENDING_OCCLUSION = [];
+
+  /**
+   * When frames are extracted separately, highlight indices are only known once all frames
+   * are stitched together. The walk then keeps the highlightable elements by their local index
+   * and a second call draws them with highlightTargets, a list of [localIndex, globalIndex].
+   */
+  const DEFERRED_HIGHLIGHTS_KEY = "__browserUseDeferredHighlights";
+  const DEFERRED_HIGHLIGHTS = deferHighlights ? new Map() : null;
+
+  /**
+   * With collectHighlightRects the highlights are drawn onto the screenshot by the caller
+   * instead of into the page, so the walk only keeps [index, element, parentIframe] of every
+   * highlighted element and their viewport rects are returned as highlightRects.
+   */
+  const HIGHLIGHT_ENTRIES = collectHighlightRects ? [] : null;
+
+  /**
+   * Persistent state for incremental snapshots.
+   *
+   * It lives on the window so it survives between evaluate calls and is dropped
+   * together with the document on navigation. A MutationObserver collects the
+   * nodes that changed since the last snapshot, so only their subtrees need to
+   * be walked again.
+   */
+  const INCREMENTAL_STATE_KEY = "__browserUseIncrementalState";
+  const MUTATION_OBSERVER_OPTIONS = {
+    subtree: true,
+    childList: true,
+    attributes: true,
+    characterData: true,
+  };
+
+  function isOwnHighlightMutation(record) {
+    const target = record.target;
+    if (target.id === HIGHLIGHT_CONTAINER_ID || target.parentElement?.id === HIGHLIGHT_CONTAINER_ID) {
+      return true;
+    }
+    if (record.type !== "childList") return false;
+
+    const changedNodes = [...record.addedNodes, ...record.removedNodes];
+    return changedNodes.length > 0 && changedNodes.every((node) => node.id === HIGHLIGHT_CONTAINER_ID);
+  }
+
+  function isScriptOnlyMutation(record) {
+    if (record.type !== "childList") return false;
+
+    const changedNodes = [...record.addedNodes, ...record.removedNodes];
+    return changedNodes.length > 0 && changedNodes.every((node) => node.nodeName === "SCRIPT");
+  }
+
+  function isHeadMutationWithoutStyles(record) {
+    const head = record.target.ownerDocument?.head;
+    if (!head || !head.contains(record.target)) return false;
+
+    const touchedNodes = [...record.addedNodes, ...record.removedNodes, record.target, record.target.parentNode];
+    return !touchedNodes.some((node) => node && (node.nodeName === "STYLE" || node.nodeName === "LINK"));
+  }
+
+  function collectMutations(state, records) {
+    for (const record of records) {
+      if (isOwnHighlightMutation(record) || isScriptOnlyMutation(record) || isHeadMutationWithoutStyles(record)) {
+        continue;
+      }
+
+      let target = record.type === "characterData" ? record.target.parentNode : record.target;
+      if (target && target.nodeType === Node.DOCUMENT_FRAGMENT_NODE && target.host) {
+        target = target.host;
+      }
+      if (target) state.dirty.add(target);
+    }
+  }
+
+  function createIncrementalState() {
+    const state = {
+      version: 0,
+      viewportExpansion: null,
+      occlusionMode: null,
+      needsFullSnapshot: true,
+      // Stable ids, so unchanged nodes keep their id across snapshots
+      nodeIds: new WeakMap(),
+      nextNodeId: 0,
+      // Structure of the last snapshot, keyed by node id
+      nodes: new Map(),
+      parents: new Map(),
+      children: new Map(),
+      // Highlight indices stay attached to their element until the next full snapshot
+      highlightIndices: new WeakMap(),
+      nextHighlightIndex: 0,
+      highlighted: new Map(),
+      // Point and result of the occlusion check of every hit tested element, keyed by node id
+      hitTests: new Map(),
+      observedIframes: new WeakSet(),
+      dirty: new Set(),
+      observer: null,
+    };
+
+    state.observer = new MutationObserver((records) => collectMutations(state, records));
+    state.observer.observe(document, MUTATION_OBSERVER_OPTIONS);
+
+    // Scrolling and resizing move every rect, so the next snapshot has to be a full one
+    const invalidate = () => {
+      state.needsFullSnapshot = true;
+    };
+    window.addEventListener("scroll", invalidate, { capture: true, passive: true });
+    window.addEventListener("resize", invalidate, { passive: true });
+
+    window[INCREMENTAL_STATE_KEY] = state;
+    return state;
+  }
+
+  const INCREMENTAL = incremental ? (window[INCREMENTAL_STATE_KEY] || createIncrementalState()) : null;
+
+  /**
+   * Layout and style cache that is kept on the window between calls.
+   *
+   * Computed style declarations are live objects, so a cached one never goes
+   * stale. Bounding rects are snapshots relative to the viewport of their
+   * document: they are dropped when the layout can have changed, i.e. on DOM
+   * mutations (except our own highlights, scripts and head changes without
+   * styles), on scrolling of any element and resizing of any observed document,
+   * when the size of a document element changes without a mutation, when an
+   * image, frame or font finishes loading and when a CSS transition or animation
+   * ends. As scroll events are dispatched with the next frame, every call also
+   * compares the scroll position and viewport size with those the rects were
+   * read at. While animations or transitions are running, rects only live for
+   * a single call.
+   */
+  const PAGE_CACHE_KEY = "__browserUsePageCache";
+
+  function createPageCache() {
+    const cache = {
+      boundingRects: new WeakMap(),
+      computedStyles: new WeakMap(),
+      observedRoots: new WeakSet(),
+      invalidations: 0,
+      // Scroll position and viewport size the cached rects were read at
+      viewportKey: null,
+      observer: null,
+      resizeObserver: null,
+      invalidateRects: null,
+    };
+
+    cache.invalidateRects = () => {
+      cache.boundingRects = new WeakMap();
+      cache.invalidations++;
+    };
+    cache.observer = new MutationObserver((records) => {
+      const changesLayout = records.some(
+        (record) => !isOwnHighlightMutation(record) && !isScriptOnlyMutation(record) && !isHeadMutationWithoutStyles(record)
+      );
+      if (changesLayout) cache.invalidateRects();
+    });
+    cache.resizeObserver = typeof ResizeObserver === "function" ? new ResizeObserver(cache.invalidateRects) : null;
+    window.addEventListener("resize", cache.invalidateRects, { passive: true });
+
+    window[PAGE_CACHE_KEY] = cache;
+    return cache;
+  }
+
+  const PAGE_CACHE = persistentCache ? (window[PAGE_CACHE_KEY] || createPageCache()) : null;
+
+  function observePageCacheRoot(root) {
+    if (!PAGE_CACHE || PAGE_CACHE.observedRoots.has(root)) return;
+    PAGE_CACHE.observedRoots.add(root);
+    PAGE_CACHE.observer.observe(root, MUTATION_OBSERVER_OPTIONS);
+
+    if (root.nodeType !== Node.DOCUMENT_NODE) return;
+    // Scroll and load events do not bubble, but a capturing listener on the document
+    // sees the scrolling of every element and the loading of every image and frame
+    for (const type of ["scroll", "load", "transitionend", "transitioncancel", "animationend", "animationcancel"]) {
+      root.addEventListener(type, PAGE_CACHE.invalidateRects, { capture: true, passive: true });
+    }
+    root.fonts?.addEventListener("loadingdone", PAGE_CACHE.invalidateRects);
+    if (PAGE_CACHE.resizeObserver && root.documentElement) {
+      PAGE_CACHE.resizeObserver.observe(root.documentElement);
+    }
+  }
+
+  if (PAGE_CACHE) {
+    observePageCacheRoot(document);
+    const viewportKey = `${window.scrollX},${window.scrollY},${window.innerWidth},${window.innerHeight}`;
+    const animating = typeof document.getAnimations === "function" && document.getAnimations().length > 0;
+    if (animating || viewportKey !== PAGE_CACHE.viewportKey) PAGE_CACHE.invalidateRects();
+    PAGE_CACHE.viewportKey = viewportKey;
+    DOM_CACHE.boundingRects = PAGE_CACHE.boundingRects;
+    DOM_CACHE.computedStyles = PAGE_CACHE.computedStyles;
+  }
+
+  function getStableNodeId(node) {
+    let id = INCREMENTAL.nodeIds.get(node);
+    if (id === undefined) {
+      id = INCREMENTAL.nextNodeId++;
+      INCREMENTAL.nodeIds.set(node, id);
+    }
+    return `${id}`;
+  }
+
+  /**
+   * Stores the node data in the hash map and returns its id.
+   */
+  function registerNode(node, nodeData, parentIframe = null) {
+    const id = INCREMENTAL ? getStableNodeId(node) : `${ID.current++}`;
+    DOM_HASH_MAP[id] = nodeData;
+
+    if (INCREMENTAL) {
+      const childIds = nodeData.children || [];
+      INCREMENTAL.nodes.set(id, node);
+      INCREMENTAL.children.set(id, childIds);
+      for (const childId of childIds) {
+        INCREMENTAL.parents.set(childId, id);
+      }
+      if (nodeData.highlightIndex !== undefined) {
+        INCREMENTAL.highlighted.set(nodeData.highlightIndex, { element: node, parentIframe });
+      }
+    }
+
+    if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
+    return id;
+  }
+
+  function assignHighlightIndex(element) {
+    if (!INCREMENTAL) return highlightIndex++;
+
+    let index = INCREMENTAL.highlightIndices.get(element);
+    if (index === undefined) {
+      index = INCREMENTAL.nextHighlightIndex++;
+      INCREMENTAL.highlightIndices.set(element, index);
+    }
+    return index;
+  }
+
+  function observeRoot(root) {
+    if (INCREMENTAL) INCREMENTAL.observer.observe(root, MUTATION_OBSERVER_OPTIONS);
+    observePageCacheRoot(root);
+  }
+
+  function observeIframe(iframe) {
+    if (!INCREMENTAL || INCREMENTAL.observedIframes.has(iframe)) return;
+    INCREMENTAL.observedIframes.add(iframe);
+    // A reloaded iframe gets a new document that no observer is attached to yet
+    iframe.addEventListener("load", () => INCREMENTAL.dirty.add(iframe));
+  }
+
+  function getParentAcrossBoundaries(node) {
+    const parent = node.parentNode;
+    if (!parent) return null;
+    if (parent.nodeType === Node.DOCUMENT_FRAGMENT_NODE && parent.host) return parent.host;
+    if (parent.nodeType === Node.DOCUMENT_NODE) {
+      try {
+        return parent.defaultView?.frameElement || null;
+      } catch (e) {
+        return null;
+      }
+    }
+    return parent;
+  }
+
+  function getParentIframe(node) {
+    if (node.ownerDocument === document) return null;
+    try {
+      return node.ownerDocument.defaultView?.frameElement || null;
+    } catch (e) {
+      return null;
+    }
+  }
+
+  /**
+   * Returns the id of the closest element that was part of the last snapshot.
+   */
+  function findSnapshotAncestorId(node) {
+    let current = node;
+    while (current) {
+      if (current.nodeType === Node.ELEMENT_NODE) {
+        const id = INCREMENTAL.nodeIds.get(current);
+        if (id !== undefined && INCREMENTAL.nodes.has(`${id}`)) return `${id}`;
+      }
+      current = getParentAcrossBoundaries(current);
+    }
+    return null;
+  }
+
+  /**
+   * Returns the ids of the outermost snapshot elements touched by a mutation,
+   * or null if the changes cannot be localized and a full snapshot is needed.
+   */
+  function collectDirtyRoots(rootId) {
+    collectMutations(INCREMENTAL, INCREMENTAL.observer.takeRecords());
+
+    const roots = new Set();
+    for (const node of INCREMENTAL.dirty) {
+      if (!node.isConnected) continue;
+
+      const id = findSnapshotAncestorId(node);
+      if (id === null || id === rootId) return null;
+      roots.add(id);
+    }
+
+    return [...roots].filter((id) => {
+      let parentId = INCREMENTAL.parents.get(id);
+      while (parentId !== undefined) {
+        if (roots.has(parentId)) return false;
+        parentId = INCREMENTAL.parents.get(parentId);
+      }
+      return true;
+    });
+  }
+
+  /**
+   * Forgets every node below the given id (and the node itself if requested).
+   * Returns the ids that were dropped.
+   */
+  function purgeSubtree(id, includeRoot) {
+    const removed = [];
+    const stack = [...(INCREMENTAL.children.get(id) || [])];
+    if (includeRoot) stack.push(id);
+
+    while (stack.length > 0) {
+      const currentId = stack.pop();
+      if (currentId !== id) stack.push(...(INCREMENTAL.children.get(currentId) || []));
+
+      const node = INCREMENTAL.nodes.get(currentId);
+      const index = node ? INCREMENTAL.highlightIndices.get(node) : undefined;
+      if (index !== undefined && INCREMENTAL.highlighted.get(index)?.element === node) {
+        INCREMENTAL.highlighted.delete(index);
+      }
+
+      INCREMENTAL.nodes.delete(currentId);
+      INCREMENTAL.children.delete(currentId);
+      INCREMENTAL.parents.delete(currentId);
+      INCREMENTAL.hitTests.delete(currentId);
+      removed.push(currentId);
+    }
+
+    if (!includeRoot) INCREMENTAL.children.set(id, []);
+    return removed;
+  }
+
+  function resetIncrementalState() {
+    INCREMENTAL.nodes.clear();
+    INCREMENTAL.parents.clear();
+    INCREMENTAL.children.clear();
+    INCREMENTAL.highlighted.clear();
+    INCREMENTAL.hitTests.clear();
+    INCREMENTAL.highlightIndices = new WeakMap();
+    INCREMENTAL.nextHighlightIndex = 0;
+    INCREMENTAL.observer.takeRecords();
+    INCREMENTAL.dirty.clear();
+    INCREMENTAL.needsFullSnapshot = false;
+    INCREMENTAL.viewportExpansion = viewportExpansion;
+    INCREMENTAL.occlusionMode = occlusionMode;
+  }
+
+  /**
+   * Walks only the subtrees that changed since the last snapshot.
+   * Returns the ids of the re-walked subtree roots and the ids that no longer exist,
+   * or null if a full snapshot is required.
+   */
+  function buildIncrementalPatch(rootId) {
+    const roots = collectDirtyRoots(rootId);
+    if (roots === null) return null;
+    INCREMENTAL.dirty.clear();
+
+    const removed = new Set();
+    for (const id of roots) {
+      for (const removedId of purgeSubtree(id, false)) removed.add(removedId);
+    }
+
+    // A change can cover or uncover elements outside of the changed subtrees, e.g. an opening modal
+    if (roots.length > 0 && !isOcclusionUnchanged(new Set(roots))) return null;
+
+    for (const id of roots) {
+      const node = INCREMENTAL.nodes.get(id);
+      const newId = buildDomTree(node, getParentIframe(node));
+      if (newId !== null) continue;
+
+      // The element itself is no longer part of the tree
+      const parentId = INCREMENTAL.parents.get(id);
+      const siblings = INCREMENTAL.children.get(parentId) || [];
+      siblings.splice(siblings.indexOf(id), 1);
+      for (const removedId of purgeSubtree(id, true)) removed.add(removedId);
+    }
+
+    for (const id of Object.keys(DOM_HASH_MAP)) removed.delete(id);
+    return { patch: roots, removed: [...removed] };
+  }
+
+  /**
+   * Remembers where an element was hit tested and whether it was on top, so that
+   * a later patch can check that its changes did not cover or uncover the element.
+   */
+  function recordHitTest(element, root, x, y, isTop) {
+    if (INCREMENTAL) INCREMENTAL.hitTests.set(getStableNodeId(element), { element, root, x, y, isTop });
+  }
+
+  /**
+   * Hit tests the recorded points of the elements outside of the patched subtrees again.
+   * Returns false if any of them is now covered or uncovered.
+   */
+  function isOcclusionUnchanged(patchedIds) {
+    const samples = new Map();
+    for (const [id, { element, root, x, y, isTop }] of INCREMENTAL.hitTests) {
+      if (patchedIds.has(id)) continue;
+
+      // Elements of the grid mode share their sample points
+      let rootSamples = samples.get(root);
+      if (!rootSamples) {
+        rootSamples = new Map();
+        samples.set(root, rootSamples);
+      }
+      const key = `${x},${y}`;
+      if (!rootSamples.has(key)) rootSamples.set(key, hitTestAncestors(root, x, y));
+
+      const hits = rootSamples.get(key);
+      if (hits !== null && hits.has(element) !== isTop) return false;
+    }
+    return true;
+  }
+
+  /**
+   * Returns [index, left, top, width, height] in viewport coordinates of the main frame
+   * for every connected element with a size, as highlightElement would place its overlay.
+   */
+  function measureHighlightRects(entries) {
+    const rects = [];
+    for (const [index, element, parentIframe] of entries) {
+      if (!element || !element.isConnected) continue;
+      if (focusHighlightIndex >= 0 && focusHighlightIndex !== index) continue;
+      const rect = getCachedBoundingRect(element);
+      if (!rect || rect.width === 0 || rect.height === 0) continue;
+      const iframeRect = parentIframe ? getCachedBoundingRect(parentIframe) : null;
+      rects.push([
+        index,
+        rect.left + (iframeRect ? iframeRect.left : 0),
+        rect.top + (iframeRect ? iframeRect.top : 0),
+        rect.width,
+        rect.height,
+      ]);
+    }
+    return rects;
+  }
+
   /**
    * Highlights an element in the DOM and returns the index of the next element.
    */
@@ -702,7 +1177,10 @@
     const centerY = rect.top + rect.height / 2;
 
     try {
-      const topEl = document.elementFromPoint(centerX, centerY);
+      const topEl = measureDomOperation(
+        () => document.elementFromPoint(centerX, centerY),
+        'elementFromPoint'
+      );
       if (!topEl) return false;
 
       let current = topEl;
@@ -716,6 +1194,117 @@
     }
   }
 
+  /**
+   * Sets the interactivity and highlight index of a visible top element.
+   */
+  function markInteractive(element, nodeData, parentIframe) {
+    nodeData.isInteractive = isInteractiveElement(element);
+    if (!nodeData.isInteractive) return;
+
+    nodeData.isInViewport = true;
+    nodeData.highlightIndex = assignHighlightIndex(element);
+    if (DEFERRED_HIGHLIGHTS) DEFERRED_HIGHLIGHTS.set(nodeData.highlightIndex, element);
+    if (HIGHLIGHT_ENTRIES && !INCREMENTAL) HIGHLIGHT_ENTRIES.push([nodeData.highlightIndex, element, parentIframe]);
+
+    // Incremental snapshots redraw all highlights once the patch is applied
+    if (doHighlightElements && !INCREMENTAL) {
+      if (focusHighlightIndex >= 0) {
+        if (focusHighlightIndex === nodeData.highlightIndex) {
+          highlightElement(element, nodeData.highlightIndex, parentIframe);
+        }
+      } else {
+        highlightElement(element, nodeData.highlightIndex, parentIframe);
+      }
+    }
+  }
+
+  /**
+   * Returns the root to hit test an element in, or null if the element is considered
+   * top without a hit test (outside of the viewport or inside an iframe).
+   */
+  function getOcclusionRoot(element, rect) {
+    const isInViewport = (
+      rect.left < window.innerWidth &&
+      rect.right > 0 &&
+      rect.top < window.innerHeight &&
+      rect.bottom > 0
+    );
+    if (!isInViewport || element.ownerDocument !== window.document) {
+      return null;
+    }
+
+    const root = element.getRootNode();
+    return root instanceof ShadowRoot ? root : document;
+  }
+
+  /**
+   * Hit tests a point and returns the hit element with all its ancestors in the root,
+   * or null if the hit test failed and every element should be considered top.
+   */
+  function hitTestAncestors(root, x, y) {
+    const hits = new Set();
+    try {
+      let current = measureDomOperation(() => root.elementFromPoint(x, y), 'elementFromPoint');
+      while (current && current !== root && current !== document.documentElement) {
+        hits.add(current);
+        current = current.parentElement;
+      }
+    } catch (e) {
+      return null;
+    }
+    return hits;
+  }
+
+  /**
+   * Resolves the deferred occlusion checks of the grid mode in one batch.
+   */
+  function resolvePendingOcclusion() {
+    const cellsByRoot = new Map();
+
+    for (const { element, nodeData, parentIframe } of PENDING_OCCLUSION) {
+      const rect = getCachedBoundingRect(element);
+      const root = getOcclusionRoot(element, rect);
+
+      if (root === null) {
+        nodeData.isTopElement = true;
+      } else {
+        const centerX = rect.left + rect.width / 2;
+        const centerY = rect.top + rect.height / 2;
+        const cellKey = `${Math.floor(centerX / OCCLUSION_GRID_CELL_SIZE)},${Math.floor(centerY / OCCLUSION_GRID_CELL_SIZE)}`;
+
+        let cells = cellsByRoot.get(root);
+        if (!cells) {
+          cells = new Map();
+          cellsByRoot.set(root, cells);
+        }
+        let samples = cells.get(cellKey);
+        if (!samples) {
+          samples = [];
+          cells.set(cellKey, samples);
+        }
+
+        let sample = samples.find(({ x, y }) =>
+          x >= rect.left && x < rect.right && y >= rect.top && y < rect.bottom
+        );
+        if (!sample) {
+          sample = { x: centerX, y: centerY, hits: hitTestAncestors(root, centerX, centerY) };
+          samples.push(sample);
+        }
+        nodeData.isTopElement = sample.hits === null || sample.hits.has(element);
+        if (sample.hits !== null) recordHitTest(element, root, sample.x, sample.y, nodeData.isTopElement);
+      }
+
+      if (nodeData.isTopElement) {
+        markInteractive(element, nodeData, parentIframe);
+        if (INCREMENTAL && nodeData.highlightIndex !== undefined) {
+          INCREMENTAL.highlighted.set(nodeData.highlightIndex, { element, parentIframe });
+        }
+      }
+    }
+
+    PENDING_OCCLUSION.length = 0;
+  }
+
   /**
    * Checks if an element is within the expanded viewport.
    */
@@ -789,10 +1378,39 @@
       element.style.visibility !== "hidden";
   }
 
+  /**
+   * Builds the given child nodes and adds them to the children of nodeData.
+   *
+   * The xpath of each element child is derived from the parent's xpath with per-tag counters,
+   * so it does not have to be rebuilt from the root. The paths match getXPathTree: an empty
+   * parentXPath starts a new path (iframe document), and direct children of a shadow root
+   * get an empty xpath because getXPathTree stops before them.
+   */
+  function buildChildren(nodeData, childNodes, parentIframe, parentXPath, isShadowRoot = false) {
+    const tagCounts = new Map();
+    for (const child of childNodes) {
+      let xpath = null;
+      if (isShadowRoot) {
+        xpath = "";
+      } else if (child.nodeType === Node.ELEMENT_NODE) {
+        const count = (tagCounts.get(child.nodeName) || 0) + 1;
+        tagCounts.set(child.nodeName, count);
+        const segment = count > 1 ? `${child.nodeName.toLowerCase()}[${count}]` : child.nodeName.toLowerCase();
+        xpath = parentXPath ? `${parentXPath}/${segment}` : segment;
+      }
+
+      const domElement = buildDomTree(child, parentIframe, xpath);
+      if (domElement) nodeData.children.push(domElement);
+    }
+  }
+
   /**
    * Creates a node data object for a given node and its descendants.
+   *
+   * xpath is the element's xpath computed by the parent, it is only computed from scratch
+   * for the roots of a walk.
    */
-  function buildDomTree(node, parentIframe = null) {
+  function buildDomTree(node, parentIframe = null, xpath = null) {
     if (debugMode) PERF_METRICS.nodeMetrics.totalNodes++;
 
     if (!node || node.id === HIGHLIGHT_CONTAINER_ID) {
@@ -810,15 +1428,9 @@
       };
 
       // Process children of body
-      for (const child of node.childNodes) {
-        const domElement = buildDomTree(child, parentIframe);
-        if (domElement) nodeData.children.push(domElement);
-      }
+      buildChildren(nodeData, node.childNodes, parentIframe, xpath ?? getXPathTree(node, true));
 
-      const id = `${ID.current++}`;
-      DOM_HASH_MAP[id] = nodeData;
-      if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
-      return id;
+      return registerNode(node, nodeData, parentIframe);
     }
 
     // Early bailout for non-element nodes except text
@@ -842,14 +1454,11 @@
         return null;
       }
 
-      const id = `${ID.current++}`;
-      DOM_HASH_MAP[id] = {
+      return registerNode(node, {
         type: "TEXT_NODE",
         text: textContent,
         isVisible: isTextNodeVisible(node),
-      };
-      if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
-      return id;
+      }, parentIframe);
     }
 
     // Quick checks for element nodes
@@ -884,7 +1493,7 @@
     const nodeData = {
       tagName: node.tagName.toLowerCase(),
       attributes: {},
-      xpath: getXPathTree(node, true),
+      xpath: xpath ?? getXPathTree(node, true),
       children: [],
     };
 
@@ -902,22 +1511,18 @@
     if (node.nodeType === Node.ELEMENT_NODE) {
       nodeData.isVisible = isElementVisible(node);
       if (nodeData.isVisible) {
-        nodeData.isTopElement = isTopElement(node);
-        if (nodeData.isTopElement) {
-          nodeData.isInteractive = isInteractiveElement(node);
-          if (nodeData.isInteractive) {
-            nodeData.isInViewport = true;
-            nodeData.highlightIndex = highlightIndex++;
-
-            if (doHighlightElements) {
-              if (focusHighlightIndex >= 0) {
-                if (focusHighlightIndex === nodeData.highlightIndex) {
-                  highlightElement(node, nodeData.highlightIndex, parentIframe);
-                }
-              } else {
-                highlightElement(node, nodeData.highlightIndex, parentIframe);
-              }
-            }
+        if (OCCLUSION_GRID) {
+          // Resolved in resolvePendingOcclusion, in the same order to keep highlight indices stable
+          PENDING_OCCLUSION.push({ element: node, nodeData, parentIframe });
+        } else {
+          nodeData.isTopElement = isTopElement(node);
+          if (INCREMENTAL) {
+            const rect = getCachedBoundingRect(node);
+            const root = getOcclusionRoot(node, rect);
+            if (root) recordHitTest(node, root, rect.left + rect.width / 2, rect.top + rect.height / 2, nodeData.isTopElement);
+          }
+          if (nodeData.isTopElement) {
+            markInteractive(node, nodeData, parentIframe);
           }
         }
       }
@@ -929,13 +1534,14 @@
 
       // Handle iframes
       if (tagName === "iframe") {
+        // Frames extracted on their own are linked to this element by the caller
+        if (!descendIframes) return registerNode(node, nodeData, parentIframe);
         try {
+          observeIframe(node);
           const iframeDoc = node.contentDocument || node.contentWindow?.document;
           if (iframeDoc) {
-            for (const child of iframeDoc.childNodes) {
-              const domElement = buildDomTree(child, node);
-              if (domElement) nodeData.children.push(domElement);
-            }
+            observeRoot(iframeDoc);
+            buildChildren(nodeData, iframeDoc.childNodes, node, "");
           }
         } catch (e) {
           console.warn("Unable to access iframe:", e);
@@ -950,25 +1556,17 @@
         (tagName === "body" && node.getAttribute("data-id")?.startsWith("mce_"))
       ) {
         // Process all child nodes to capture formatted text
-        for (const child of node.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        buildChildren(nodeData, node.childNodes, parentIframe, nodeData.xpath);
       }
       // Handle shadow DOM
       else if (node.shadowRoot) {
         nodeData.shadowRoot = true;
-        for (const child of node.shadowRoot.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        observeRoot(node.shadowRoot);
+        buildChildren(nodeData, node.shadowRoot.childNodes, parentIframe, "", true);
       }
       // Handle regular elements
       else {
-        for (const child of node.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        buildChildren(nodeData, node.childNodes, parentIframe, nodeData.xpath);
       }
     }
 
@@ -978,10 +1576,105 @@
       return null;
     }
 
-    const id = `${ID.current++}`;
-    DOM_HASH_MAP[id] = nodeData;
-    if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
-    return id;
+    return registerNode(node, nodeData, parentIframe);
+  }
+
+  // Bits of the flags column in the compact payload
+  const COMPACT_FLAGS = {
+    text: 1,
+    visible: 2,
+    interactive: 4,
+    topElement: 8,
+    inViewport: 16,
+    shadowRoot: 32,
+    relativeXPath: 64,
+  };
+
+  /**
+   * Encodes the trees below the given ids as parallel arrays in pre-order.
+   *
+   * Tag names, xpaths, texts and attribute names and values are interned into one string table.
+   * A node's parent always comes before the node, and xpaths that extend their parent's xpath
+   * only carry the last segment.
+   */
+  function encodeCompactPayload(rootIds) {
+    const strings = [];
+    const stringIndices = new Map();
+    function intern(value) {
+      let index = stringIndices.get(value);
+      if (index === undefined) {
+        index = strings.length;
+        strings.push(value);
+        stringIndices.set(value, index);
+      }
+      return index;
+    }
+
+    const nodes = {
+      parents: [],
+      tags: [],
+      flags: [],
+      highlights: [],
+      values: [],
+      attributeCounts: [],
+      attributes: [],
+      strings,
+    };
+    if (INCREMENTAL) nodes.ids = [];
+
+    const stack = [];
+    for (let i = rootIds.length - 1; i >= 0; i--) {
+      stack.push([rootIds[i], -1, null]);
+    }
+
+    while (stack.length > 0) {
+      const [id, parentPosition, parentXPath] = stack.pop();
+      const nodeData = DOM_HASH_MAP[id];
+      if (!nodeData) continue;
+
+      const position = nodes.parents.length;
+      nodes.parents.push(parentPosition);
+      if (INCREMENTAL) nodes.ids.push(Number(id));
+
+      if (nodeData.type === "TEXT_NODE") {
+        nodes.tags.push(-1);
+        nodes.flags.push(COMPACT_FLAGS.text | (nodeData.isVisible ? COMPACT_FLAGS.visible : 0));
+        nodes.highlights.push(-1);
+        nodes.values.push(intern(nodeData.text));
+        nodes.attributeCounts.push(0);
+        continue;
+      }
+
+      let flags = 0;
+      if (nodeData.isVisible) flags |= COMPACT_FLAGS.visible;
+      if (nodeData.isInteractive) flags |= COMPACT_FLAGS.interactive;
+      if (nodeData.isTopElement) flags |= COMPACT_FLAGS.topElement;
+      if (nodeData.isInViewport) flags |= COMPACT_FLAGS.inViewport;
+      if (nodeData.shadowRoot) flags |= COMPACT_FLAGS.shadowRoot;
+
+      let xpath = nodeData.xpath;
+      if (parentXPath && xpath.startsWith(`${parentXPath}/`)) {
+        flags |= COMPACT_FLAGS.relativeXPath;
+        xpath = xpath.slice(parentXPath.length + 1);
+      }
+
+      nodes.tags.push(intern(nodeData.tagName));
+      nodes.flags.push(flags);
+      nodes.highlights.push(nodeData.highlightIndex ?? -1);
+      nodes.values.push(intern(xpath));
+
+      const attributeNames = Object.keys(nodeData.attributes);
+      nodes.attributeCounts.push(attributeNames.length);
+      for (const name of attributeNames) {
+        nodes.attributes.push(intern(name), intern(nodeData.attributes[name]));
+      }
+
+      for (let i = nodeData.children.length - 1; i >= 0; i--) {
+        stack.push([nodeData.children[i], position, nodeData.xpath]);
+      }
+    }
+
+    return nodes;
   }
 
   // After all functions are defined, wrap them with performance measurement
@@ -990,13 +1683,75 @@
   isInteractiveElement = measureTime(isInteractiveElement);
   isElementVisible = measureTime(isElementVisible);
   isTopElement = measureTime(isTopElement);
+  resolvePendingOcclusion = measureTime(resolvePendingOcclusion);
   isInExpandedViewport = measureTime(isInExpandedViewport);
   isTextNodeVisible = measureTime(isTextNodeVisible);
   getEffectiveScroll = measureTime(getEffectiveScroll);
 
-  const rootId = buildDomTree(document.body);
+  if (highlightTargets) {
+    const elements = window[DEFERRED_HIGHLIGHTS_KEY] || new Map();
+    if (collectHighlightRects) {
+      // Rects relative to this frame, the caller adds the offset of the frame
+      const highlightRects = measureHighlightRects(
+        highlightTargets.map(([localIndex, index]) => [index, elements.get(localIndex), null])
+      );
+      DOM_CACHE.clearCache();
+      return { highlightRects };
+    }
+    for (const [localIndex, index] of highlightTargets) {
+      const element = elements.get(localIndex);
+      if (element && element.isConnected) highlightElement(element, index);
+    }
+    return { highlighted: highlightTargets.length };
+  }
 
-  // Clear the cache before starting
+  let rootId;
+  let patch = null;
+  let removed = [];
+
+  if (INCREMENTAL) {
+    rootId = getStableNodeId(document.body);
+    const canPatch = !INCREMENTAL.needsFullSnapshot &&
+      baseVersion === INCREMENTAL.version &&
+      INCREMENTAL.viewportExpansion === viewportExpansion &&
+      INCREMENTAL.occlusionMode === occlusionMode &&
+      INCREMENTAL.nodes.has(rootId);
+    const result = canPatch ? buildIncrementalPatch(rootId) : null;
+
+    if (result) {
+      patch = result.patch;
+      removed = result.removed;
+    } else {
+      resetIncrementalState();
+      rootId = buildDomTree(document.body);
+    }
+    resolvePendingOcclusion();
+    INCREMENTAL.version++;
+
+    if (doHighlightElements) {
+      for (const [index, { element, parentIframe }] of INCREMENTAL.highlighted) {
+        if (!element.isConnected) continue;
+        if (focusHighlightIndex >= 0 && focusHighlightIndex !== index) continue;
+        highlightElement(element, index, parentIframe);
+      }
+    }
+  } else {
+    rootId = buildDomTree(document.body);
+    resolvePendingOcclusion();
+  }
+
+  if (DEFERRED_HIGHLIGHTS) window[DEFERRED_HIGHLIGHTS_KEY] = DEFERRED_HIGHLIGHTS;
+
+  // Measured before the cache is cleared, the walk already read most of these rects
+  let highlightRects = null;
+  if (HIGHLIGHT_ENTRIES) {
+    const entries = INCREMENTAL ?
+      [...INCREMENTAL.highlighted].map(([index, { element, parentIframe }]) => [index, element, parentIframe]) :
+      HIGHLIGHT_ENTRIES;
+    highlightRects = measureHighlightRects(entries);
+  }
+
+  // Clear the cache unless it is kept for the next call
   DOM_CACHE.clearCache();
 
   // Only process metrics in debug mode
@@ -1047,9 +1802,28 @@
         (PERF_METRICS.cacheMetrics.boundingRectCacheHits + PERF_METRICS.cacheMetrics.computedStyleCacheHits) /
         (boundingRectTotal + computedStyleTotal);
     }
+
+    // Number of times the rects kept on the page were dropped since the cache was created
+    if (PAGE_CACHE) PERF_METRICS.cacheMetrics.boundingRectInvalidations = PAGE_CACHE.invalidations;
   }
 
-  return debugMode ?
+  const result = debugMode ?
     { rootId, map: DOM_HASH_MAP, perfMetrics: PERF_METRICS } :
     { rootId, map: DOM_HASH_MAP };
+
+  if (highlightRects) result.highlightRects = highlightRects;
+
+  if (compactPayload) {
+    delete result.map;
+    result.nodes = encodeCompactPayload(patch || [rootId]);
+    // Without stable ids the nodes are addressed by their position
+    if (!INCREMENTAL) result.rootId = "0";
+  }
+
+  if (INCREMENTAL) {
+    result.version = INCREMENTAL.version;
+    result.patch = patch;
+    result.removed = removed;
+  }
+  return result;
 };
@@ -1,9 +1,12 @@
 import hashlib
+import logging
 from typing import Optional
 
-from browser_use.dom.history_tree_processor.view import DOMHistoryElement, HashedDomElement
+from browser_use.dom.history_tree_processor.view import DOMHistoryElement, HashedDomElement, HashedDomElementIndex
 from browser_use.dom.views import DOMElementNode
 
+logger = logging.getLogger(__name__)
+
 
 class HistoryTreeProcessor:
 	""" "
@@ -33,21 +36,59 @@ class HistoryTreeProcessor:
 
 	@staticmethod
 	def find_history_element_in_tree(dom_history_element: DOMHistoryElement, tree: DOMElementNode) -> Optional[DOMElementNode]:
-		hashed_dom_history_element = HistoryTreeProcessor._hash_dom_history_element(dom_history_element)
+		index = HistoryTreeProcessor.build_hash_index(tree)
+		return HistoryTreeProcessor.find_history_element_in_index(dom_history_element, index)
+
+	@staticmethod
+	def build_hash_index(tree: DOMElementNode) -> HashedDomElementIndex:
+		"""Index all highlighted elements of the tree by their hash, the first element in document order wins"""
+		index = HashedDomElementIndex()
 
-		def process_node(node: DOMElementNode):
+		stack = [tree]
+		while stack:
+			node = stack.pop()
 			if node.highlight_index is not None:
-				hashed_node = HistoryTreeProcessor._hash_dom_element(node)
-				if hashed_node == hashed_dom_history_element:
-					return node
-			for child in node.children:
-				if isinstance(child, DOMElementNode):
-					result = process_node(child)
-					if result is not None:
-						return result
-			return None
+				hashed_node = node.hash
+				if hashed_node in index.exact:
+					index.duplicates.add(hashed_node)
+				else:
+					index.exact[hashed_node] = node
+				for key in HistoryTreeProcessor._partial_hash_keys(hashed_node):
+					index.partial.setdefault(key, []).append(node)
+
+			stack.extend(child for child in reversed(node.children) if isinstance(child, DOMElementNode))
+
+		return index
+
+	@staticmethod
+	def find_history_element_in_index(
+		dom_history_element: DOMHistoryElement, index: HashedDomElementIndex
+	) -> Optional[DOMElementNode]:
+		"""
+		Find the element with the same hash. If there is none, fall back to the element that matches
+		two of the three hash components, as long as exactly one element does.
+		"""
+		hashed_dom_history_element = HistoryTreeProcessor._hash_dom_history_element(dom_history_element)
+
+		node = index.exact.get(hashed_dom_history_element)
+		if node is not None:
+			return node
+
+		for key in HistoryTreeProcessor._partial_hash_keys(hashed_dom_history_element):
+			candidates = index.partial.get(key, [])
+			if len(candidates) == 1:
+				logger.debug(f'No exact hash match for {dom_history_element.tag_name} element, matched on {key[0]}')
+				return candidates[0]
+
+		return None
 
-		return process_node(tree)
+	@staticmethod
+	def _partial_hash_keys(hashed_dom_element: HashedDomElement) -> list[tuple[str, int, int]]:
+		return [
+			('branch_path+attributes', hashed_dom_element.branch_path_hash, hashed_dom_element.attributes_hash),
+			('branch_path+xpath', hashed_dom_element.branch_path_hash, hashed_dom_element.xpath_hash),
+			('attributes+xpath', hashed_dom_element.attributes_hash, hashed_dom_element.xpath_hash),
+		]
 
 	@staticmethod
 	def compare_history_element_and_dom_element(dom_history_element: DOMHistoryElement, dom_element: DOMElementNode) -> bool:
@@ -74,6 +115,35 @@ class HistoryTreeProcessor:
 
 		return HashedDomElement(branch_path_hash, attributes_hash, xpath_hash)
 
+	@staticmethod
+	def hash_dom_tree(root: DOMElementNode) -> None:
+		"""
+		Precompute the hashes of all highlighted elements below root (inclusive) in one top-down pass.
+
+		The branch path hash of every element continues the hash state of its parent,
+		so the parent chain is only walked once for the root.
+		"""
+		root_path = HistoryTreeProcessor._get_parent_branch_path(root)
+		root_hasher = HistoryTreeProcessor._new_hasher()
+		root_hasher.update('/'.join(root_path).encode())
+
+		stack = [(root, root_hasher, bool(root_path))]
+		while stack:
+			node, path_hasher, has_path = stack.pop()
+
+			if node.highlight_index is not None:
+				node._hash = HashedDomElement(
+					int.from_bytes(path_hasher.digest()),
+					HistoryTreeProcessor._attributes_hash(node.attributes),
+					HistoryTreeProcessor._xpath_hash(node.xpath),
+				)
+
+			for child in node.children:
+				if isinstance(child, DOMElementNode):
+					child_hasher = path_hasher.copy()
+					child_hasher.update(f'/{child.tag_name}'.encode() if has_path else child.tag_name.encode())
+					stack.append((child, child_hasher, True))
+
 	@staticmethod
 	def _get_parent_branch_path(dom_element: DOMElementNode) -> list[str]:
 		parents: list[DOMElementNode] = []
@@ -87,21 +157,31 @@ class HistoryTreeProcessor:
 		return [parent.tag_name for parent in parents]
 
 	@staticmethod
-	def _parent_branch_path_hash(parent_branch_path: list[str]) -> str:
+	def _new_hasher() -> hashlib.blake2b:
+		return hashlib.blake2b(digest_size=8)
+
+	@staticmethod
+	def _string_hash(string: str) -> int:
+		hasher = HistoryTreeProcessor._new_hasher()
+		hasher.update(string.encode())
+		return int.from_bytes(hasher.digest())
+
+	@staticmethod
+	def _parent_branch_path_hash(parent_branch_path: list[str]) -> int:
 		parent_branch_path_string = '/'.join(parent_branch_path)
-		return hashlib.sha256(parent_branch_path_string.encode()).hexdigest()
+		return HistoryTreeProcessor._string_hash(parent_branch_path_string)
 
 	@staticmethod
-	def _attributes_hash(attributes: dict[str, str]) -> str:
+	def _attributes_hash(attributes: dict[str, str]) -> int:
 		attributes_string = ''.join(f'{key}={value}' for key, value in attributes.items())
-		return hashlib.sha256(attributes_string.encode()).hexdigest()
+		return HistoryTreeProcessor._string_hash(attributes_string)
 
 	@staticmethod
-	def _xpath_hash(xpath: str) -> str:
-		return hashlib.sha256(xpath.encode()).hexdigest()
+	def _xpath_hash(xpath: str) -> int:
+		return HistoryTreeProcessor._string_hash(xpath)
 
 	@staticmethod
-	def _text_hash(dom_element: DOMElementNode) -> str:
+	def _text_hash(dom_element: DOMElementNode) -> int:
 		""" """
 		text_string = dom_element.get_all_text_till_next_clickable_element()
-		return hashlib.sha256(text_string.encode()).hexdigest()
+		return HistoryTreeProcessor._string_hash(text_string)
@@ -1,19 +1,36 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Optional
 
 from pydantic import BaseModel
 
+if TYPE_CHECKING:
+	from browser_use.dom.views import DOMElementNode
 
-@dataclass
+
+@dataclass(frozen=True)
 class HashedDomElement:
 	"""
-	Hash of the dom element to be used as a unique identifier
+	Hash of the dom element to be used as a unique identifier (64 bit blake2b digests)
+	"""
+
+	branch_path_hash: int
+	attributes_hash: int
+	xpath_hash: int
+	# text_hash: int
+
+
+@dataclass
+class HashedDomElementIndex:
+	"""
+	Highlighted elements of one snapshot by their hash, plus by each pair of hash components
+	to find elements when one component changed (e.g. an attribute or the xpath)
 	"""
 
-	branch_path_hash: str
-	attributes_hash: str
-	xpath_hash: str
-	# text_hash: str
+	exact: dict[HashedDomElement, 'DOMElementNode'] = field(default_factory=dict)
+	# Pair of hash components -> elements with these components, in document order
+	partial: dict[tuple[str, int, int], list['DOMElementNode']] = field(default_factory=dict)
+	# Hashes shared by more than one element, e.g. in two identical iframes
+	duplicates: set[HashedDomElement] = field(default_factory=set)
 
 
 class Coordinates(BaseModel):
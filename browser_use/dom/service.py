@@ -1,24 +1,107 @@
-import gc
+import asyncio
+import hashlib
 import json
 import logging
 from dataclasses import dataclass
+from functools import cache
 from importlib import resources
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Literal, Optional
 
 if TYPE_CHECKING:
-	from playwright.async_api import Page
+	from playwright.async_api import Frame, Page
 
+	from browser_use.browser.cdp import CDPSessionManager
+	from browser_use.dom.accessibility.service import AccessibilityTreeService
+	from browser_use.dom.snapshot.service import DOMSnapshotService
+
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
 from browser_use.dom.views import (
 	DOMBaseNode,
 	DOMElementNode,
 	DOMState,
 	DOMTextNode,
+	HighlightRect,
 	SelectorMap,
 )
-from browser_use.utils import time_execution_async
+from browser_use.utils import time_execution_async, time_execution_sync
 
 logger = logging.getLogger(__name__)
 
+# Bits of the flags column in the compact buildDomTree payload
+COMPACT_FLAG_TEXT = 1
+COMPACT_FLAG_VISIBLE = 2
+COMPACT_FLAG_INTERACTIVE = 4
+COMPACT_FLAG_TOP_ELEMENT = 8
+COMPACT_FLAG_IN_VIEWPORT = 16
+COMPACT_FLAG_SHADOW_ROOT = 32
+COMPACT_FLAG_RELATIVE_XPATH = 64
+
+
+@cache
+def get_build_dom_tree_js() -> str:
+	"""Source of the DOM extractor, read once per process"""
+	return resources.read_text('browser_use.dom', 'buildDomTree.js')
+
+
+@cache
+def get_extractor_scripts() -> tuple[str, str]:
+	"""
+	Scripts to call the extractor installed on the window and to install and call it.
+
+	The window property name contains a digest of the source, so a page that still has an
+	older extractor installed gets the current one.
+	"""
+	js_code = get_build_dom_tree_js()
+	name = f'__browserUseBuildDomTree_{hashlib.sha1(js_code.encode()).hexdigest()[:12]}'
+	call_script = f"(args) => typeof window.{name} === 'function' ? window.{name}(args) : null"
+	install_script = (
+		f'(args) => {{\n'
+		f"if (typeof window.{name} !== 'function') {{\n"
+		f'Object.defineProperty(window, "{name}", {{ value: {js_code.strip().rstrip(";")}, enumerable: false }});\n'
+		f'}}\n'
+		f'return window.{name}(args);\n'
+		f'}}'
+	)
+	return call_script, install_script
+
+
+# Same path as getXPathTree in buildDomTree.js, to find the iframe element of a frame in its parent's tree
+FRAME_ELEMENT_XPATH_SCRIPT = """
+(element) => {
+	const segments = [];
+	let current = element;
+	while (current && current.nodeType === Node.ELEMENT_NODE) {
+		if (current.parentNode instanceof ShadowRoot || current.parentNode instanceof HTMLIFrameElement) break;
+		let index = 0;
+		for (let sibling = current.previousSibling; sibling; sibling = sibling.previousSibling) {
+			if (sibling.nodeType === Node.ELEMENT_NODE && sibling.nodeName === current.nodeName) index++;
+		}
+		segments.unshift(current.nodeName.toLowerCase() + (index > 0 ? `[${index + 1}]` : ''));
+		current = current.parentNode;
+	}
+	return segments.join('/');
+}
+"""
+
+
+def parse_highlight_rects(rects: list[list[float]], offset_x: float = 0, offset_y: float = 0) -> dict[int, HighlightRect]:
+	"""highlightRects of the extractor, [index, x, y, width, height] each, by highlight index"""
+	return {
+		int(index): HighlightRect(x=x + offset_x, y=y + offset_y, width=width, height=height)
+		for index, x, y, width, height in rects
+	}
+
+
+@dataclass
+class FrameExtraction:
+	"""Tree of one frame extracted on its own, before it is linked into the tree of its parent frame"""
+
+	frame: 'Frame'
+	element_tree: DOMElementNode
+	selector_map: SelectorMap
+	# xpath of the iframe element in the parent frame, None for the main frame
+	iframe_xpath: Optional[str]
+
 
 @dataclass
 class ViewportInfo:
@@ -26,12 +109,29 @@ class ViewportInfo:
 	height: int
 
 
+@dataclass
+class IncrementalSnapshot:
+	"""
+	The last tree built in incremental mode, kept so that the next patch can be applied to it.
+	"""
+
+	version: int
+	element_tree: DOMElementNode
+	node_map: dict[str, DOMBaseNode]
+	selector_map: SelectorMap
+
+
 class DomService:
-	def __init__(self, page: 'Page'):
+	def __init__(self, page: 'Page', cdp_sessions: Optional['CDPSessionManager'] = None):
 		self.page = page
+		self.cdp_sessions = cdp_sessions
 		self.xpath_cache = {}
+		self.snapshot: Optional[IncrementalSnapshot] = None
+		self.backend_services: dict[str, 'DOMSnapshotService | AccessibilityTreeService'] = {}
+		# Boxes of the highlighted elements of the last extraction, if they were requested
+		self.highlight_rects: Optional[dict[int, HighlightRect]] = None
 
-		self.js_code = resources.read_text('browser_use.dom', 'buildDomTree.js')
+		self.js_code = get_build_dom_tree_js()
 
 	# region - Clickable elements
 	@time_execution_async('--get_clickable_elements')
@@ -40,9 +140,81 @@ class DomService:
 		highlight_elements: bool = True,
 		focus_element: int = -1,
 		viewport_expansion: int = 0,
+		incremental: bool = False,
+		compact_payload: bool = False,
+		occlusion_mode: Literal['point', 'grid'] = 'point',
+		backend: Literal['js', 'cdp_snapshot', 'accessibility'] = 'js',
+		parallel_frames: bool = False,
+		persistent_cache: bool = False,
+		return_highlight_rects: bool = False,
 	) -> DOMState:
-		element_tree, selector_map = await self._build_dom_tree(highlight_elements, focus_element, viewport_expansion)
-		return DOMState(element_tree=element_tree, selector_map=selector_map)
+		"""
+		Extract the interactive elements of the page.
+
+		With incremental=True the extractor keeps a MutationObserver on the page and only re-walks
+		the subtrees that changed since the previous call of this DomService. The changes are patched
+		into a copy of the previous element tree that shares its unchanged subtrees. Changes that cover or
+		uncover elements outside of the changed subtrees, e.g. an opening modal, fall back to a full snapshot.
+
+		With compact_payload=True the extractor returns the nodes as parallel arrays with a shared
+		string table instead of a dict per node, which is much smaller to serialize and parse.
+
+		occlusion_mode selects how the extractor checks if an element is covered by another one:
+		'point' hit tests the center of every visible element while walking the DOM, 'grid' defers the
+		checks and shares one hit test between elements whose centers fall into the same grid cell.
+
+		backend='cdp_snapshot' extracts the page with CDP DOMSnapshot.captureSnapshot and backend='accessibility'
+		lists the interactive elements of the accessibility tree (both Chromium only) instead of evaluating
+		buildDomTree.js; incremental, compact_payload and occlusion_mode only apply to 'js'.
+
+		With parallel_frames=True the extractor runs in every frame of page.frames concurrently, including
+		cross-origin iframes, instead of descending into same-origin iframes in one call. The frame trees are
+		linked below their iframe elements and renumbered with global highlight indices. Out-of-process
+		iframes are only reached if Playwright attached to their target and lists them in page.frames; frames
+		that fail to evaluate are skipped with the frames inside them and their iframe element stays empty.
+		Incremental snapshots always use a single call.
+
+		With persistent_cache=True the bounding rects and computed styles read by the extractor are kept on the
+		page between calls. Observers in the page drop the rects when the DOM, the scroll position or the
+		layout changes, so unchanged steps do not read the layout again. Pages with running animations or
+		transitions read the layout on every call.
+
+		With return_highlight_rects=True the returned state has the viewport boxes of the highlighted elements
+		(only the focus_element if it is set), so they can be drawn onto a screenshot. Pass highlight_elements=False
+		with it to leave the page untouched. The 'accessibility' backend has no boxes.
+		"""
+		if backend != 'js':
+			return await self._get_backend_service(backend).get_clickable_elements(
+				highlight_elements, focus_element, viewport_expansion, return_highlight_rects=return_highlight_rects
+			)
+
+		element_tree, selector_map = await self._build_dom_tree(
+			highlight_elements,
+			focus_element,
+			viewport_expansion,
+			incremental,
+			compact_payload,
+			occlusion_mode,
+			parallel_frames,
+			persistent_cache,
+			return_highlight_rects,
+		)
+		return DOMState(element_tree=element_tree, selector_map=selector_map, highlight_rects=self.highlight_rects)
+
+	def _get_backend_service(self, backend: str) -> 'DOMSnapshotService | AccessibilityTreeService':
+		"""One service per backend, they keep their CDP session to the page between calls"""
+		if backend not in self.backend_services:
+			if backend == 'cdp_snapshot':
+				from browser_use.dom.snapshot.service import DOMSnapshotService
+
+				self.backend_services[backend] = DOMSnapshotService(self.page, self.cdp_sessions)
+			elif backend == 'accessibility':
+				from browser_use.dom.accessibility.service import AccessibilityTreeService
+
+				self.backend_services[backend] = AccessibilityTreeService(self.page, self.cdp_sessions)
+			else:
+				raise ValueError(f'Unknown DOM backend: {backend}')
+		return self.backend_services[backend]
 
 	@time_execution_async('--build_dom_tree')
 	async def _build_dom_tree(
@@ -50,10 +222,13 @@ class DomService:
 		highlight_elements: bool,
 		focus_element: int,
 		viewport_expansion: int,
+		incremental: bool = False,
+		compact_payload: bool = False,
+		occlusion_mode: Literal['point', 'grid'] = 'point',
+		parallel_frames: bool = False,
+		persistent_cache: bool = False,
+		return_highlight_rects: bool = False,
 	) -> tuple[DOMElementNode, SelectorMap]:
-		if await self.page.evaluate('1+1') != 2:
-			raise ValueError('The page cannot evaluate javascript code properly')
-
 		# NOTE: We execute JS code in the browser to extract important DOM information.
 		#       The returned hash map contains information about the DOM tree and the
 		#       relationship between the DOM elements.
@@ -63,30 +238,324 @@ class DomService:
 			'focusHighlightIndex': focus_element,
 			'viewportExpansion': viewport_expansion,
 			'debugMode': debug_mode,
+			'incremental': incremental,
+			'baseVersion': self.snapshot.version if incremental and self.snapshot else None,
+			'compactPayload': compact_payload,
+			'occlusionMode': occlusion_mode,
+			'persistentCache': persistent_cache,
+			'collectHighlightRects': return_highlight_rects,
 		}
 
+		if parallel_frames and not incremental and len(self.page.frames) > 1:
+			self.snapshot = None
+			return await self._build_frames_dom_tree(args)
+
 		try:
-			eval_page = await self.page.evaluate(self.js_code, args)
+			eval_page = await self._evaluate_extractor(args)
 		except Exception as e:
 			logger.error('Error evaluating JavaScript: %s', e)
 			raise
 
+		self.highlight_rects = parse_highlight_rects(eval_page.get('highlightRects') or []) if return_highlight_rects else None
+
 		# Only log performance metrics in debug mode
 		if debug_mode and 'perfMetrics' in eval_page:
 			logger.debug('DOM Tree Building Performance Metrics:\n%s', json.dumps(eval_page['perfMetrics'], indent=2))
 
-		return await self._construct_dom_tree(eval_page)
+		if not incremental:
+			self.snapshot = None
+			return await self._construct_dom_tree(eval_page)
+
+		if eval_page.get('patch') is not None and self.snapshot is not None:
+			try:
+				return self._apply_patch(eval_page)
+			except (KeyError, ValueError) as e:
+				# Our copy of the tree is out of sync with the page, start over with a full snapshot
+				logger.debug(f'Failed to apply incremental DOM patch, taking a full snapshot: {e}')
+				self.snapshot = None
+				return await self._build_dom_tree(
+					highlight_elements,
+					focus_element,
+					viewport_expansion,
+					incremental,
+					compact_payload,
+					occlusion_mode,
+					parallel_frames,
+					persistent_cache,
+					return_highlight_rects,
+				)
+
+		node_map, selector_map = self._parse_eval_page(eval_page)
+		element_tree = node_map.get(str(eval_page['rootId']))
+		if element_tree is None or not isinstance(element_tree, DOMElementNode):
+			raise ValueError('Failed to parse HTML to dictionary')
+
+		HistoryTreeProcessor.hash_dom_tree(element_tree)
+
+		self.snapshot = IncrementalSnapshot(
+			version=eval_page['version'],
+			element_tree=element_tree,
+			node_map=node_map,
+			selector_map=selector_map,
+		)
+		return element_tree, dict(selector_map)
+
+	async def _evaluate_extractor(self, args: dict, frame: Optional['Frame'] = None) -> dict:
+		"""
+		Run the extractor that is installed on the page (or the given frame).
+
+		The extractor source is only sent and compiled once per document, every following call only sends the args.
+		"""
+		call_script, install_script = get_extractor_scripts()
+		target = frame or self.page
+
+		eval_page = await target.evaluate(call_script, args)
+		if eval_page is None:
+			# New document, install the extractor and run it in the same round trip
+			eval_page = await target.evaluate(install_script, args)
+
+		if not isinstance(eval_page, dict):
+			raise ValueError('The page cannot evaluate javascript code properly')
+
+		return eval_page
+
+	@time_execution_async('--build_frames_dom_tree')
+	async def _build_frames_dom_tree(self, args: dict) -> tuple[DOMElementNode, SelectorMap]:
+		"""Extract all frames concurrently and link them into the tree of the main frame"""
+		frame_args = {
+			**args,
+			'descendIframes': False,
+			'doHighlightElements': False,
+			'deferHighlights': args['doHighlightElements'] or args['collectHighlightRects'],
+			'collectHighlightRects': False,
+		}
+		frames = self.page.frames
+		results = await asyncio.gather(*(self._extract_frame(frame, frame_args) for frame in frames), return_exceptions=True)
+
+		extractions: dict['Frame', FrameExtraction] = {}
+		for frame, result in zip(frames, results):
+			if isinstance(result, BaseException):
+				if frame is self.page.main_frame:
+					raise result
+				# Detached, navigating or unreachable out-of-process frames are skipped, like frames the extractor
+				# cannot access, the frames inside them are dropped by _link_frames
+				logger.debug(f'Failed to extract frame {frame.url}: {result}')
+				continue
+			extractions[frame] = result
+
+		main = extractions[self.page.main_frame]
+		self._link_frames(main, extractions)
+
+		# Highlight indices are only unique within a frame, number them again in document order
+		local_indices = {
+			id(node): (extraction.frame, index) for extraction in extractions.values() for index, node in extraction.selector_map.items()
+		}
+		selector_map: SelectorMap = {}
+		highlight_targets: dict['Frame', list[list[int]]] = {}
+		stack: list[DOMElementNode] = [main.element_tree]
+		while stack:
+			node = stack.pop()
+			if node.highlight_index is not None:
+				frame, local_index = local_indices[id(node)]
+				node.highlight_index = len(selector_map)
+				selector_map[node.highlight_index] = node
+				highlight_targets.setdefault(frame, []).append([local_index, node.highlight_index])
+			stack.extend(child for child in reversed(node.children) if isinstance(child, DOMElementNode))
+
+		HistoryTreeProcessor.hash_dom_tree(main.element_tree)
+
+		focus_element = args['focusHighlightIndex']
+		self.highlight_rects = None
+		if args['collectHighlightRects']:
+			frame_rects = await asyncio.gather(
+				*(
+					self._frame_highlight_rects(
+						frame, [target for target in targets if focus_element < 0 or target[1] == focus_element]
+					)
+					for frame, targets in highlight_targets.items()
+				),
+				return_exceptions=True,
+			)
+			self.highlight_rects = {}
+			for rects in frame_rects:
+				if not isinstance(rects, BaseException):
+					self.highlight_rects.update(rects)
+
+		if args['doHighlightElements']:
+			await asyncio.gather(
+				*(
+					self._evaluate_extractor(
+						{'highlightTargets': [target for target in targets if focus_element < 0 or target[1] == focus_element]},
+						frame,
+					)
+					for frame, targets in highlight_targets.items()
+				),
+				return_exceptions=True,
+			)
+
+		return main.element_tree, selector_map
+
+	async def _frame_highlight_rects(self, frame: 'Frame', targets: list[list[int]]) -> dict[int, HighlightRect]:
+		"""Boxes of the highlighted elements of a frame, moved by the position of its iframe in the main frame"""
+		eval_page = await self._evaluate_extractor({'highlightTargets': targets, 'collectHighlightRects': True}, frame)
+		offset_x = offset_y = 0.0
+		if frame.parent_frame is not None:
+			box = await (await frame.frame_element()).bounding_box()
+			if box is None:
+				return {}
+			offset_x, offset_y = box['x'], box['y']
+		return parse_highlight_rects(eval_page['highlightRects'], offset_x, offset_y)
+
+	async def _extract_frame(self, frame: 'Frame', args: dict) -> FrameExtraction:
+		iframe_xpath = None
+		if frame.parent_frame is not None:
+			iframe_element = await frame.frame_element()
+			iframe_xpath = await iframe_element.evaluate(FRAME_ELEMENT_XPATH_SCRIPT)
+
+		eval_page = await self._evaluate_extractor(args, frame)
+		node_map, selector_map = self._parse_eval_page(eval_page)
+		element_tree = node_map.get(str(eval_page['rootId']))
+		if element_tree is None or not isinstance(element_tree, DOMElementNode):
+			raise ValueError('Failed to parse HTML to dictionary')
+
+		return FrameExtraction(frame=frame, element_tree=element_tree, selector_map=selector_map, iframe_xpath=iframe_xpath)
+
+	@staticmethod
+	def _link_frames(main: FrameExtraction, extractions: dict['Frame', FrameExtraction]) -> None:
+		"""
+		Attach every frame tree below its iframe element, as <html><body> like the single call extraction does.
+		Frames whose iframe element is not part of the parent tree (e.g. filtered out) are dropped.
+		"""
+
+		def depth(frame: 'Frame') -> int:
+			return 0 if frame.parent_frame is None else depth(frame.parent_frame) + 1
+
+		# Iframe elements without a linked frame by xpath, per frame, in document order
+		free_iframes: dict['Frame', dict[str, list[DOMElementNode]]] = {}
+		linked = {main.frame}
+
+		for extraction in sorted(extractions.values(), key=lambda extraction: depth(extraction.frame)):
+			if extraction is not main:
+				parent_frame = extraction.frame.parent_frame
+				if parent_frame not in linked:
+					continue
+
+				iframes = free_iframes[parent_frame].get(extraction.iframe_xpath or '')
+				if not iframes:
+					continue
+
+				iframe = iframes.pop(0)
+				html = DOMElementNode(is_visible=False, parent=iframe, tag_name='html', xpath='html', attributes={}, children=[])
+				iframe.children.append(html)
+				body = extraction.element_tree
+				body.xpath = 'html/body'
+				body.parent = html
+				html.children.append(body)
+				linked.add(extraction.frame)
+
+			iframes_by_xpath: dict[str, list[DOMElementNode]] = {}
+			stack = [extraction.element_tree]
+			while stack:
+				node = stack.pop()
+				if node.tag_name == 'iframe':
+					iframes_by_xpath.setdefault(node.xpath, []).append(node)
+				stack.extend(child for child in reversed(node.children) if isinstance(child, DOMElementNode))
+			free_iframes[extraction.frame] = iframes_by_xpath
+
+		for frame in [frame for frame in extractions if frame not in linked]:
+			del extractions[frame]
 
 	@time_execution_async('--construct_dom_tree')
 	async def _construct_dom_tree(
 		self,
 		eval_page: dict,
 	) -> tuple[DOMElementNode, SelectorMap]:
-		js_node_map = eval_page['map']
 		js_root_id = eval_page['rootId']
 
+		node_map, selector_map = self._parse_eval_page(eval_page)
+
+		html_to_dict = node_map[str(js_root_id)]
+
+		if html_to_dict is None or not isinstance(html_to_dict, DOMElementNode):
+			raise ValueError('Failed to parse HTML to dictionary')
+
+		HistoryTreeProcessor.hash_dom_tree(html_to_dict)
+
+		return html_to_dict, selector_map
+
+	def _parse_eval_page(self, eval_page: dict) -> tuple[dict[str, DOMBaseNode], SelectorMap]:
+		if 'nodes' in eval_page:
+			return self._decode_compact_nodes(eval_page['nodes'])
+		return self._build_node_map(eval_page['map'])
+
+	def _decode_compact_nodes(self, nodes: dict) -> tuple[dict[str, DOMBaseNode], SelectorMap]:
+		"""Decode the columnar payload. Nodes are in pre-order, so every parent exists before its children."""
+		strings = nodes['strings']
+		flat_attributes = nodes['attributes']
+		ids = nodes.get('ids')
+
 		selector_map = {}
 		node_map = {}
+		node_list: list[DOMBaseNode] = []
+		attribute_cursor = 0
+
+		columns = zip(
+			nodes['parents'],
+			nodes['tags'],
+			nodes['flags'],
+			nodes['highlights'],
+			nodes['values'],
+			nodes['attributeCounts'],
+		)
+		for position, (parent_position, tag_index, flags, highlight_index, value_index, attribute_count) in enumerate(columns):
+			parent = node_list[parent_position] if parent_position >= 0 else None
+
+			if flags & COMPACT_FLAG_TEXT:
+				node = DOMTextNode(
+					text=strings[value_index],
+					is_visible=bool(flags & COMPACT_FLAG_VISIBLE),
+					parent=parent,
+				)
+			else:
+				xpath = strings[value_index]
+				if flags & COMPACT_FLAG_RELATIVE_XPATH:
+					xpath = f'{parent.xpath}/{xpath}'
+
+				attribute_end = attribute_cursor + 2 * attribute_count
+				attributes = {
+					strings[flat_attributes[i]]: strings[flat_attributes[i + 1]] for i in range(attribute_cursor, attribute_end, 2)
+				}
+				attribute_cursor = attribute_end
+
+				node = DOMElementNode(
+					tag_name=strings[tag_index],
+					xpath=xpath,
+					attributes=attributes,
+					children=[],
+					is_visible=bool(flags & COMPACT_FLAG_VISIBLE),
+					is_interactive=bool(flags & COMPACT_FLAG_INTERACTIVE),
+					is_top_element=bool(flags & COMPACT_FLAG_TOP_ELEMENT),
+					is_in_viewport=bool(flags & COMPACT_FLAG_IN_VIEWPORT),
+					highlight_index=highlight_index if highlight_index >= 0 else None,
+					shadow_root=bool(flags & COMPACT_FLAG_SHADOW_ROOT),
+					parent=parent,
+				)
+				if highlight_index >= 0:
+					selector_map[highlight_index] = node
+
+			if parent is not None:
+				parent.children.append(node)
+
+			node_list.append(node)
+			node_map[str(ids[position]) if ids is not None else str(position)] = node
+
+		return node_map, selector_map
+
+	def _build_node_map(self, js_node_map: dict) -> tuple[dict[str, DOMBaseNode], SelectorMap]:
+		"""Parse all nodes of the hash map and link them to their children."""
+		selector_map = {}
+		node_map = {}
+		children_map: dict[str, list[str]] = {}
 
 		for id, node_data in js_node_map.items():
 			node, children_ids = self._parse_node(node_data)
@@ -95,33 +564,112 @@ class DomService:
 
 			node_map[id] = node
 
-			if isinstance(node, DOMElementNode) and node.highlight_index is not None:
-				selector_map[node.highlight_index] = node
-
-			# NOTE: We know that we are building the tree bottom up
-			#       and all children are already processed.
 			if isinstance(node, DOMElementNode):
-				for child_id in children_ids:
-					if child_id not in node_map:
-						continue
-
-					child_node = node_map[child_id]
-
-					child_node.parent = node
-					node.children.append(child_node)
-
-		html_to_dict = node_map[str(js_root_id)]
-
-		del node_map
-		del js_node_map
-		del js_root_id
-
-		gc.collect()
-
-		if html_to_dict is None or not isinstance(html_to_dict, DOMElementNode):
-			raise ValueError('Failed to parse HTML to dictionary')
-
-		return html_to_dict, selector_map
+				children_map[id] = children_ids
+				if node.highlight_index is not None:
+					selector_map[node.highlight_index] = node
+
+		# NOTE: Node ids are only ordered bottom up for full snapshots,
+		#       so children are linked once every node exists.
+		for id, children_ids in children_map.items():
+			node = node_map[id]
+			for child_id in children_ids:
+				if child_id not in node_map:
+					continue
+
+				child_node = node_map[child_id]
+
+				child_node.parent = node
+				node.children.append(child_node)
+
+		return node_map, selector_map
+
+	@time_execution_sync('--apply_patch')
+	def _apply_patch(self, eval_page: dict) -> tuple[DOMElementNode, SelectorMap]:
+		"""
+		Replace the subtrees that changed on the page in a copy of the previous tree.
+
+		Only the changed subtrees are parsed, every other node is copied from the previous tree. A node has a
+		single parent, so nothing is shared with the previous tree: earlier states keep their tree, parent
+		links, hashes and selector map as they were.
+		"""
+		assert self.snapshot is not None
+		snapshot = self.snapshot
+
+		new_nodes, new_selector_map = self._parse_eval_page(eval_page)
+		# Replaced nodes by their id in the original, they stay in the previous tree only
+		replaced: dict[int, str] = {}
+		for root_id in eval_page['patch']:
+			old_node = snapshot.node_map[root_id]
+			if old_node.parent is None:
+				raise ValueError(f'Patched node {root_id} has no parent')
+			replaced[id(old_node)] = root_id
+			for highlight_index in self._collect_highlight_indices(old_node):
+				snapshot.selector_map.pop(highlight_index, None)
+
+		# Copies of the previous tree's nodes by id of the original. The copies keep their hash, as they keep
+		# the position, tag, xpath and attributes of the original.
+		copies: dict[int, DOMBaseNode] = {}
+		element_tree = snapshot.element_tree.copy()
+		copies[id(snapshot.element_tree)] = element_tree
+		patched: list[DOMElementNode] = []
+		stack = [element_tree]
+		while stack:
+			parent = stack.pop()
+			children: list[DOMBaseNode] = []
+			for child in parent.children:
+				root_id = replaced.pop(id(child), None)
+				if root_id is not None:
+					new_node = new_nodes.get(root_id)
+					if new_node is not None:
+						new_node.parent = parent
+						children.append(new_node)
+						if isinstance(new_node, DOMElementNode):
+							patched.append(new_node)
+					continue
+
+				copy = child.copy()
+				copy.parent = parent
+				copies[id(child)] = copy
+				children.append(copy)
+				if isinstance(copy, DOMElementNode):
+					stack.append(copy)
+			parent.children = children
+
+		if replaced:
+			raise ValueError(f'Patched nodes {sorted(replaced.values())} are not in the tree')
+
+		# Hashes of the patched subtrees are computed once they are linked into the tree
+		for new_node in patched:
+			HistoryTreeProcessor.hash_dom_tree(new_node)
+
+		# Later patches look the nodes up by their id
+		for node_id, node in snapshot.node_map.items():
+			snapshot.node_map[node_id] = copies.get(id(node), node)
+		for highlight_index, node in snapshot.selector_map.items():
+			snapshot.selector_map[highlight_index] = copies.get(id(node), node)
+
+		for removed_id in eval_page.get('removed', []):
+			snapshot.node_map.pop(removed_id, None)
+
+		snapshot.node_map.update(new_nodes)
+		snapshot.selector_map.update(new_selector_map)
+		snapshot.version = eval_page['version']
+		snapshot.element_tree = element_tree
+
+		return element_tree, dict(snapshot.selector_map)
+
+	@staticmethod
+	def _collect_highlight_indices(node: DOMBaseNode) -> list[int]:
+		highlight_indices = []
+		stack = [node]
+		while stack:
+			current = stack.pop()
+			if isinstance(current, DOMElementNode):
+				if current.highlight_index is not None:
+					highlight_indices.append(current.highlight_index)
+				stack.extend(current.children)
+		return highlight_indices
 
 	def _parse_node(
 		self,
@@ -0,0 +1,563 @@
+"""
+DOM extraction backend built on CDP DOMSnapshot.captureSnapshot.
+
+One native call returns the flattened DOM, the layout boxes, computed styles and paint order of the
+main frame and its child frames. Visibility, interactivity and top element detection, which
+buildDomTree.js does in the page, run in Python over that data.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.views import DOMElementNode, DOMState, DOMTextNode, HighlightRect, SelectorMap
+from browser_use.utils import time_execution_async, time_execution_sync
+
+if TYPE_CHECKING:
+	from playwright.async_api import CDPSession, Page
+
+	from browser_use.browser.cdp import CDPSessionManager
+
+logger = logging.getLogger(__name__)
+
+# Order of the values in layout.styles of the snapshot
+COMPUTED_STYLES = ['display', 'visibility', 'opacity', 'cursor', 'pointer-events', 'position']
+STYLE_DISPLAY, STYLE_VISIBILITY, STYLE_OPACITY, STYLE_CURSOR, STYLE_POINTER_EVENTS, STYLE_POSITION = range(len(COMPUTED_STYLES))
+
+ELEMENT_NODE = 1
+TEXT_NODE = 3
+DOCUMENT_FRAGMENT_NODE = 11
+
+# Same rules as buildDomTree.js
+DENIED_TAGS = {'svg', 'script', 'style', 'link', 'meta', 'noscript', 'template'}
+INTERACTIVE_CANDIDATE_TAGS = {'a', 'button', 'input', 'select', 'textarea', 'details', 'summary'}
+INTERACTIVE_TAGS = {
+	'a',
+	'button',
+	'details',
+	'embed',
+	'input',
+	'menu',
+	'menuitem',
+	'object',
+	'select',
+	'textarea',
+	'canvas',
+	'summary',
+	'dialog',
+	'banner',
+}
+INTERACTIVE_ROLES = {
+	'button-icon',
+	'dialog',
+	'button-text-icon-only',
+	'treeitem',
+	'alert',
+	'grid',
+	'progressbar',
+	'radio',
+	'checkbox',
+	'menuitem',
+	'option',
+	'switch',
+	'dropdown',
+	'scrollbar',
+	'combobox',
+	'a-button-text',
+	'button',
+	'region',
+	'textbox',
+	'tabpanel',
+	'tab',
+	'click',
+	'button-text',
+	'spinbutton',
+	'a-button-inner',
+	'link',
+	'menu',
+	'slider',
+	'listbox',
+	'a-dropdown-button',
+	'button-icon-only',
+	'searchbox',
+	'menuitemradio',
+	'tooltip',
+	'tree',
+	'menuitemcheckbox',
+}
+INTERACTIVE_CLASSES = {'address-input__container__input', 'nav-btn', 'pull-left', 'dropdown-toggle'}
+CLICK_HANDLER_ATTRIBUTES = ('onclick', 'ng-click', '@click', 'v-on:click')
+ARIA_STATE_ATTRIBUTES = ('aria-expanded', 'aria-pressed', 'aria-selected', 'aria-checked')
+
+# Size of the cells the layout boxes are bucketed into for the hit tests, in css pixels
+HIT_TEST_CELL_SIZE = 128
+
+HIGHLIGHT_SCRIPT = """
+(highlights) => {
+	const colors = ['#FF0000', '#00FF00', '#0000FF', '#FFA500', '#800080', '#008080', '#FF69B4', '#4B0082', '#FF4500', '#2E8B57', '#DC143C', '#4682B4'];
+	let container = document.getElementById('playwright-highlight-container');
+	if (!container) {
+		container = document.createElement('div');
+		container.id = 'playwright-highlight-container';
+		Object.assign(container.style, { position: 'absolute', top: '0', left: '0', pointerEvents: 'none', zIndex: '2147483647' });
+		document.documentElement.appendChild(container);
+	}
+	for (const { index, x, y, width, height } of highlights) {
+		const color = colors[index % colors.length];
+		const overlay = document.createElement('div');
+		Object.assign(overlay.style, {
+			position: 'absolute', left: `${x}px`, top: `${y}px`, width: `${width}px`, height: `${height}px`,
+			border: `2px solid ${color}`, backgroundColor: `${color}1A`, boxSizing: 'border-box', pointerEvents: 'none',
+		});
+		const label = document.createElement('div');
+		label.className = 'playwright-highlight-label';
+		label.textContent = index;
+		const small = width < 24 || height < 20;
+		Object.assign(label.style, {
+			position: 'absolute', left: `${x + width - 22}px`, top: `${small ? y - 18 : y + 2}px`,
+			background: color, color: 'white', padding: '1px 4px', borderRadius: '4px',
+			fontSize: `${Math.min(12, Math.max(8, height / 2))}px`,
+		});
+		container.appendChild(overlay);
+		container.appendChild(label);
+	}
+}
+"""
+
+
+@dataclass
+class Rect:
+	x: float
+	y: float
+	width: float
+	height: float
+
+	def contains(self, x: float, y: float) -> bool:
+		return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+
+@dataclass
+class Viewport:
+	"""Visible area of the main frame in page coordinates"""
+
+	x: float
+	y: float
+	width: float
+	height: float
+
+
+class SnapshotDocument:
+	"""Index over one document of a DOMSnapshot.captureSnapshot result"""
+
+	def __init__(self, document: dict, strings: list[str], offset_x: float, offset_y: float):
+		self.strings = strings
+		nodes = document['nodes']
+		self.parent_index: list[int] = nodes['parentIndex']
+		self.node_type: list[int] = nodes['nodeType']
+		self.node_name: list[int] = nodes['nodeName']
+		self.node_value: list[int] = nodes['nodeValue']
+		self.attributes: list[list[int]] = nodes['attributes']
+		self.clickable = set(nodes.get('isClickable', {}).get('index', []))
+		self.shadow_roots = set(nodes.get('shadowRootType', {}).get('index', []))
+		content_documents = nodes.get('contentDocumentIndex', {'index': [], 'value': []})
+		self.content_document = dict(zip(content_documents['index'], content_documents['value']))
+
+		self.children: list[list[int]] = [[] for _ in self.parent_index]
+		for node_index, parent_index in enumerate(self.parent_index):
+			if parent_index >= 0:
+				self.children[parent_index].append(node_index)
+
+		layout = document['layout']
+		self.layout_nodes: list[int] = layout['nodeIndex']
+		self.bounds: list[list[float]] = layout['bounds']
+		self.styles: list[list[int]] = layout['styles']
+		self.paint_orders: list[int] = layout.get('paintOrders', [])
+		self.layout_index = {node_index: i for i, node_index in enumerate(self.layout_nodes)}
+
+		# Offset from the coordinates of this document to the page coordinates of the main frame
+		self.offset_x = offset_x
+		self.offset_y = offset_y
+
+	def name(self, node_index: int) -> str:
+		return self.strings[self.node_name[node_index]]
+
+	def value(self, node_index: int) -> str:
+		value_index = self.node_value[node_index]
+		return self.strings[value_index] if value_index >= 0 else ''
+
+	def attribute_dict(self, node_index: int) -> dict[str, str]:
+		flat = self.attributes[node_index] if node_index < len(self.attributes) else []
+		return {self.strings[flat[i]]: self.strings[flat[i + 1]] for i in range(0, len(flat), 2)}
+
+	def rect(self, node_index: int) -> Optional[Rect]:
+		"""Layout box of the node in page coordinates of the main frame"""
+		layout_index = self.layout_index.get(node_index)
+		if layout_index is None:
+			return None
+		x, y, width, height = self.bounds[layout_index]
+		return Rect(x + self.offset_x, y + self.offset_y, width, height)
+
+	def style(self, node_index: int, style: int) -> Optional[str]:
+		layout_index = self.layout_index.get(node_index)
+		if layout_index is None:
+			return None
+		style_values = self.styles[layout_index]
+		return self.strings[style_values[style]] if style < len(style_values) else None
+
+
+class HitTester:
+	"""
+	Finds the topmost element at a point of the main document from the paint order of its layout boxes,
+	the equivalent of document.elementFromPoint
+	"""
+
+	def __init__(self, document: SnapshotDocument, viewport: Viewport):
+		self.document = document
+		self.cells: dict[tuple[int, int], list[tuple[int, Rect, int]]] = {}
+
+		for layout_index, node_index in enumerate(document.layout_nodes):
+			if not document.paint_orders:
+				break
+			rect = document.rect(node_index)
+			if rect is None or rect.width <= 0 or rect.height <= 0:
+				continue
+			if document.style(node_index, STYLE_VISIBILITY) == 'hidden':
+				continue
+			if document.style(node_index, STYLE_POINTER_EVENTS) == 'none':
+				continue
+
+			# Text boxes hit their element
+			element_index = node_index
+			if document.node_type[node_index] != ELEMENT_NODE:
+				element_index = document.parent_index[node_index]
+
+			# Only cells in the viewport are ever hit tested
+			left = max(rect.x, viewport.x)
+			top = max(rect.y, viewport.y)
+			right = min(rect.x + rect.width, viewport.x + viewport.width)
+			bottom = min(rect.y + rect.height, viewport.y + viewport.height)
+			if left >= right or top >= bottom:
+				continue
+
+			entry = (document.paint_orders[layout_index], rect, element_index)
+			for cell_x in range(int(left // HIT_TEST_CELL_SIZE), int(right // HIT_TEST_CELL_SIZE) + 1):
+				for cell_y in range(int(top // HIT_TEST_CELL_SIZE), int(bottom // HIT_TEST_CELL_SIZE) + 1):
+					self.cells.setdefault((cell_x, cell_y), []).append(entry)
+
+	def element_at(self, x: float, y: float) -> Optional[int]:
+		"""Node index of the topmost element at the point, None if the paint order is unknown or nothing is hit"""
+		top_paint_order = -1
+		top_element = None
+		for paint_order, rect, element_index in self.cells.get((int(x // HIT_TEST_CELL_SIZE), int(y // HIT_TEST_CELL_SIZE)), []):
+			if paint_order > top_paint_order and rect.contains(x, y):
+				top_paint_order = paint_order
+				top_element = element_index
+		return top_element
+
+	def is_top_element(self, node_index: int, rect: Rect) -> bool:
+		if not self.document.paint_orders:
+			return True
+
+		hit = self.element_at(rect.x + rect.width / 2, rect.y + rect.height / 2)
+		while hit is not None and hit >= 0:
+			if hit == node_index:
+				return True
+			hit = self.document.parent_index[hit]
+		return False
+
+
+class SnapshotTreeBuilder:
+	"""Builds the element tree from a captureSnapshot result with the same rules as buildDomTree.js"""
+
+	def __init__(self, snapshot: dict, viewport: Viewport, viewport_expansion: int):
+		self.snapshot = snapshot
+		self.strings: list[str] = snapshot['strings']
+		self.viewport = viewport
+		self.viewport_expansion = viewport_expansion
+		self.documents: dict[int, SnapshotDocument] = {}
+		self.selector_map: SelectorMap = {}
+		self.highlight_rects: dict[int, Rect] = {}
+		self.main = self._document(0, 0, 0)
+		self.hit_tester = HitTester(self.main, viewport)
+
+	def _document(self, document_index: int, offset_x: float, offset_y: float) -> SnapshotDocument:
+		document = SnapshotDocument(self.snapshot['documents'][document_index], self.strings, offset_x, offset_y)
+		self.documents[document_index] = document
+		return document
+
+	@time_execution_sync('--snapshot_build_tree')
+	def build(self) -> tuple[DOMElementNode, SelectorMap]:
+		body_index = self._find_body(self.main)
+		if body_index is None:
+			raise ValueError('The snapshot of the page has no body')
+
+		root = DOMElementNode(is_visible=False, parent=None, tag_name='body', xpath='/body', attributes={}, children=[])
+		self._build_children(self.main, body_index, root, 'html/body')
+		return root, self.selector_map
+
+	@staticmethod
+	def _find_body(document: SnapshotDocument) -> Optional[int]:
+		for html_index in document.children[0] if document.children else []:
+			if document.name(html_index) == 'HTML':
+				for body_index in document.children[html_index]:
+					if document.name(body_index) == 'BODY':
+						return body_index
+		return None
+
+	def _build_children(
+		self,
+		document: SnapshotDocument,
+		parent_index: int,
+		parent: DOMElementNode,
+		parent_xpath: str,
+		is_shadow_root: bool = False,
+	) -> None:
+		"""Same xpath rules as buildChildren in buildDomTree.js"""
+		tag_counts: dict[str, int] = {}
+		for child_index in document.children[parent_index]:
+			node_type = document.node_type[child_index]
+			if node_type == DOCUMENT_FRAGMENT_NODE:
+				continue
+
+			xpath = ''
+			if not is_shadow_root and node_type == ELEMENT_NODE:
+				node_name = document.name(child_index)
+				count = tag_counts.get(node_name, 0) + 1
+				tag_counts[node_name] = count
+				segment = f'{node_name.lower()}[{count}]' if count > 1 else node_name.lower()
+				xpath = f'{parent_xpath}/{segment}' if parent_xpath else segment
+
+			self._build_node(document, child_index, parent, xpath)
+
+	def _build_node(self, document: SnapshotDocument, node_index: int, parent: DOMElementNode, xpath: str) -> None:
+		node_type = document.node_type[node_index]
+		if node_type == TEXT_NODE:
+			self._build_text_node(document, node_index, parent)
+			return
+		if node_type != ELEMENT_NODE:
+			return
+
+		tag_name = document.name(node_index).lower()
+		if tag_name in DENIED_TAGS:
+			return
+
+		rect = document.rect(node_index)
+		if not self._passes_viewport_filter(document, node_index, rect):
+			return
+
+		attributes = document.attribute_dict(node_index)
+		node = DOMElementNode(
+			is_visible=self._is_visible(document, node_index, rect),
+			parent=parent,
+			tag_name=tag_name,
+			xpath=xpath,
+			attributes=attributes if self._is_interactive_candidate(tag_name, attributes) or tag_name in ('iframe', 'body') else {},
+			children=[],
+		)
+		parent.children.append(node)
+
+		if node.is_visible and rect is not None:
+			node.is_top_element = document is not self.main or not self._in_viewport(rect) or self.hit_tester.is_top_element(node_index, rect)
+			if node.is_top_element:
+				node.is_interactive = self._is_interactive(document, node_index, tag_name, attributes)
+				if node.is_interactive:
+					node.is_in_viewport = True
+					node.highlight_index = len(self.selector_map)
+					self.selector_map[node.highlight_index] = node
+					self.highlight_rects[node.highlight_index] = rect
+
+		shadow_root = next((i for i in document.children[node_index] if i in document.shadow_roots), None)
+		if tag_name == 'iframe' and node_index in document.content_document:
+			content_document = self._iframe_document(document, node_index, rect)
+			self._build_children(content_document, 0, node, '')
+		elif shadow_root is not None:
+			node.shadow_root = True
+			self._build_children(document, shadow_root, node, '', is_shadow_root=True)
+		else:
+			self._build_children(document, node_index, node, xpath)
+
+		# Skip empty anchor tags
+		if tag_name == 'a' and not node.children and not attributes.get('href'):
+			parent.children.pop()
+			if node.highlight_index is not None:
+				del self.selector_map[node.highlight_index]
+				del self.highlight_rects[node.highlight_index]
+
+	def _iframe_document(self, document: SnapshotDocument, iframe_index: int, rect: Optional[Rect]) -> SnapshotDocument:
+		document_index = document.content_document[iframe_index]
+		if document_index in self.documents:
+			return self.documents[document_index]
+
+		# Layout bounds are relative to the document, so the frame's own scroll offset is subtracted
+		content_document = self.snapshot['documents'][document_index]
+		offset_x = (rect.x if rect else 0) - content_document.get('scrollOffsetX', 0)
+		offset_y = (rect.y if rect else 0) - content_document.get('scrollOffsetY', 0)
+		return self._document(document_index, offset_x, offset_y)
+
+	def _build_text_node(self, document: SnapshotDocument, node_index: int, parent: DOMElementNode) -> None:
+		text = document.value(node_index).strip()
+		parent_index = document.parent_index[node_index]
+		if not text or parent_index < 0 or document.name(parent_index) == 'SCRIPT':
+			return
+
+		rect = document.rect(node_index)
+		is_visible = (
+			rect is not None
+			and rect.width > 0
+			and rect.height > 0
+			and self._in_expanded_viewport(rect)
+			and document.style(parent_index, STYLE_DISPLAY) not in (None, 'none')
+			and document.style(parent_index, STYLE_VISIBILITY) != 'hidden'
+			and document.style(parent_index, STYLE_OPACITY) != '0'
+		)
+		parent.children.append(DOMTextNode(is_visible=is_visible, parent=parent, text=text))
+
+	def _passes_viewport_filter(self, document: SnapshotDocument, node_index: int, rect: Optional[Rect]) -> bool:
+		"""Early viewport check of buildDomTree.js: only elements without size clearly outside of the viewport are dropped"""
+		if self.viewport_expansion == -1 or rect is None:
+			return True
+		if document.style(node_index, STYLE_POSITION) in ('fixed', 'sticky'):
+			return True
+		if rect.width > 0 or rect.height > 0:
+			return True
+		return self._in_expanded_viewport(rect)
+
+	def _in_expanded_viewport(self, rect: Rect) -> bool:
+		if self.viewport_expansion == -1:
+			return True
+		expansion = self.viewport_expansion
+		return not (
+			rect.y + rect.height < self.viewport.y - expansion
+			or rect.y > self.viewport.y + self.viewport.height + expansion
+			or rect.x + rect.width < self.viewport.x - expansion
+			or rect.x > self.viewport.x + self.viewport.width + expansion
+		)
+
+	def _in_viewport(self, rect: Rect) -> bool:
+		return (
+			rect.x < self.viewport.x + self.viewport.width
+			and rect.x + rect.width > self.viewport.x
+			and rect.y < self.viewport.y + self.viewport.height
+			and rect.y + rect.height > self.viewport.y
+		)
+
+	@staticmethod
+	def _is_visible(document: SnapshotDocument, node_index: int, rect: Optional[Rect]) -> bool:
+		return (
+			rect is not None
+			and rect.width > 0
+			and rect.height > 0
+			and document.style(node_index, STYLE_VISIBILITY) != 'hidden'
+			and document.style(node_index, STYLE_DISPLAY) != 'none'
+		)
+
+	@staticmethod
+	def _is_interactive_candidate(tag_name: str, attributes: dict[str, str]) -> bool:
+		if tag_name in INTERACTIVE_CANDIDATE_TAGS:
+			return True
+		return any(name in attributes for name in ('onclick', 'role', 'tabindex', 'data-action'))
+
+	def _is_interactive(self, document: SnapshotDocument, node_index: int, tag_name: str, attributes: dict[str, str]) -> bool:
+		"""
+		Heuristics of isInteractiveElement in buildDomTree.js. Event listeners are covered by the isClickable
+		flag of the snapshot, which also includes natively clickable elements.
+		"""
+		if node_index in document.clickable:
+			return True
+
+		classes = set(attributes.get('class', '').split())
+		role = attributes.get('role')
+		tab_index = attributes.get('tabindex')
+		parent_index = document.parent_index[node_index]
+		if (
+			tag_name in INTERACTIVE_TAGS
+			or role in INTERACTIVE_ROLES
+			or attributes.get('aria-role') in INTERACTIVE_ROLES
+			or classes & INTERACTIVE_CLASSES
+			or attributes.get('data-toggle') == 'dropdown'
+			or attributes.get('aria-haspopup') == 'true'
+			or (tab_index is not None and tab_index != '-1' and parent_index >= 0 and document.name(parent_index) != 'BODY')
+			or attributes.get('data-action') in ('a-dropdown-select', 'a-dropdown-button')
+		):
+			return True
+
+		element_id = attributes.get('id', '').lower()
+		aria_label = attributes.get('aria-label', '').lower()
+		if (
+			any(word in element_id for word in ('cookie', 'consent', 'notice'))
+			or attributes.get('data-nosnippet') == 'true'
+			or 'cookie' in aria_label
+			or 'consent' in aria_label
+			or classes & {'otCenterRounded', 'ot-sdk-container'}
+		):
+			return True
+
+		return (
+			any(name in attributes for name in CLICK_HANDLER_ATTRIBUTES + ARIA_STATE_ATTRIBUTES)
+			or attributes.get('contenteditable') == 'true'
+			or attributes.get('draggable') == 'true'
+			or element_id == 'tinymce'
+			or 'mce-content-body' in classes
+		)
+
+
+class DOMSnapshotService:
+	"""Extracts the DOM state of a page with CDP DOMSnapshot.captureSnapshot instead of buildDomTree.js"""
+
+	def __init__(self, page: 'Page', cdp_sessions: Optional['CDPSessionManager'] = None):
+		self.page = page
+		self.cdp_sessions = cdp_sessions
+		self.cdp_session: Optional['CDPSession'] = None
+
+	async def _send(self, method: str, params: Optional[dict] = None) -> dict:
+		"""Send over the shared sessions of the browser context if there are any, else over an own session"""
+		if self.cdp_sessions is not None:
+			return await self.cdp_sessions.send(self.page, method, params)
+		if self.cdp_session is None:
+			self.cdp_session = await self.page.context.new_cdp_session(self.page)
+		return await self.cdp_session.send(method, params)
+
+	@time_execution_async('--get_clickable_elements_snapshot')
+	async def get_clickable_elements(
+		self,
+		highlight_elements: bool = True,
+		focus_element: int = -1,
+		viewport_expansion: int = 0,
+		return_highlight_rects: bool = False,
+	) -> DOMState:
+		snapshot = await self._send(
+			'DOMSnapshot.captureSnapshot',
+			{'computedStyles': COMPUTED_STYLES, 'includePaintOrder': True, 'includeDOMRects': True},
+		)
+		layout_metrics = await self._send('Page.getLayoutMetrics')
+		viewport = layout_metrics['cssLayoutViewport']
+
+		builder = SnapshotTreeBuilder(
+			snapshot,
+			Viewport(viewport['pageX'], viewport['pageY'], viewport['clientWidth'], viewport['clientHeight']),
+			viewport_expansion,
+		)
+		element_tree, selector_map = builder.build()
+		HistoryTreeProcessor.hash_dom_tree(element_tree)
+
+		if highlight_elements:
+			highlights = [
+				{'index': index, 'x': rect.x, 'y': rect.y, 'width': rect.width, 'height': rect.height}
+				for index, rect in builder.highlight_rects.items()
+				if focus_element < 0 or index == focus_element
+			]
+			await self.page.evaluate(HIGHLIGHT_SCRIPT, highlights)
+
+		highlight_rects = None
+		if return_highlight_rects:
+			# The snapshot rects are in page coordinates
+			highlight_rects = {
+				index: HighlightRect(
+					x=rect.x - viewport['pageX'], y=rect.y - viewport['pageY'], width=rect.width, height=rect.height
+				)
+				for index, rect in builder.highlight_rects.items()
+				if focus_element < 0 or index == focus_element
+			}
+
+		return DOMState(element_tree=element_tree, selector_map=selector_map, highlight_rects=highlight_rects)
@@ -1,8 +1,7 @@
-from dataclasses import dataclass
-from functools import cached_property
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Dict, List, Optional
 
-from browser_use.dom.history_tree_processor.view import CoordinateSet, HashedDomElement, ViewportInfo
+from browser_use.dom.history_tree_processor.view import CoordinateSet, HashedDomElement, HashedDomElementIndex, ViewportInfo
 from browser_use.utils import time_execution_sync
 
 # Avoid circular import issues
@@ -10,17 +9,32 @@ if TYPE_CHECKING:
 	from .views import DOMElementNode
 
 
-@dataclass(frozen=False)
 class DOMBaseNode:
-	is_visible: bool
-	# Use None as default and set parent later to avoid circular reference issues
-	parent: Optional['DOMElementNode']
+	"""
+	Nodes use __slots__ instead of a __dict__, which keeps large trees small.
+	A node keeps its parent alive, so walks up from an element kept on its own (e.g. from a selector map) reach the root.
+	"""
+
+	__slots__ = ('is_visible', 'parent')
+
+	def __init__(self, is_visible: bool, parent: Optional['DOMElementNode']):
+		self.is_visible = is_visible
+		self.parent = parent
 
 
-@dataclass(frozen=False)
 class DOMTextNode(DOMBaseNode):
-	text: str
-	type: str = 'TEXT_NODE'
+	__slots__ = ('text', 'type')
+
+	def __init__(self, is_visible: bool, parent: Optional['DOMElementNode'], text: str, type: str = 'TEXT_NODE'):
+		super().__init__(is_visible, parent)
+		self.text = text
+		self.type = type
+
+	def __repr__(self) -> str:
+		return f'DOMTextNode(text={self.text!r}, is_visible={self.is_visible})'
+
+	def copy(self) -> 'DOMTextNode':
+		return DOMTextNode(is_visible=self.is_visible, parent=self.parent, text=self.text, type=self.type)
 
 	def has_parent_with_highlight_index(self) -> bool:
 		current = self.parent
@@ -43,25 +57,83 @@ class DOMTextNode(DOMBaseNode):
 		return self.parent.is_top_element
 
 
-@dataclass(frozen=False)
 class DOMElementNode(DOMBaseNode):
 	"""
 	xpath: the xpath of the element from the last root node (shadow root or iframe OR document if no shadow root or iframe).
 	To properly reference the element we need to recursively switch the root node until we find the element (work you way up the tree with `.parent`)
 	"""
 
-	tag_name: str
-	xpath: str
-	attributes: Dict[str, str]
-	children: List[DOMBaseNode]
-	is_interactive: bool = False
-	is_top_element: bool = False
-	is_in_viewport: bool = False
-	shadow_root: bool = False
-	highlight_index: Optional[int] = None
-	viewport_coordinates: Optional[CoordinateSet] = None
-	page_coordinates: Optional[CoordinateSet] = None
-	viewport_info: Optional[ViewportInfo] = None
+	__slots__ = (
+		'tag_name',
+		'xpath',
+		'attributes',
+		'children',
+		'is_interactive',
+		'is_top_element',
+		'is_in_viewport',
+		'shadow_root',
+		'highlight_index',
+		'viewport_coordinates',
+		'page_coordinates',
+		'viewport_info',
+		'_hash',
+		'_string_cache',
+	)
+
+	def __init__(
+		self,
+		is_visible: bool,
+		parent: Optional['DOMElementNode'],
+		tag_name: str,
+		xpath: str,
+		attributes: Dict[str, str],
+		children: List[DOMBaseNode],
+		is_interactive: bool = False,
+		is_top_element: bool = False,
+		is_in_viewport: bool = False,
+		shadow_root: bool = False,
+		highlight_index: Optional[int] = None,
+		viewport_coordinates: Optional[CoordinateSet] = None,
+		page_coordinates: Optional[CoordinateSet] = None,
+		viewport_info: Optional[ViewportInfo] = None,
+	):
+		super().__init__(is_visible, parent)
+		self._hash: Optional[HashedDomElement] = None
+		self._string_cache: Optional[dict[tuple[str, ...], str]] = None
+		self.tag_name = tag_name
+		self.xpath = xpath
+		self.attributes = attributes
+		self.children = children
+		self.is_interactive = is_interactive
+		self.is_top_element = is_top_element
+		self.is_in_viewport = is_in_viewport
+		self.shadow_root = shadow_root
+		self.highlight_index = highlight_index
+		self.viewport_coordinates = viewport_coordinates
+		self.page_coordinates = page_coordinates
+		self.viewport_info = viewport_info
+
+	def copy(self) -> 'DOMElementNode':
+		"""Shallow copy with its own children list. The children are not copied."""
+		copy = DOMElementNode(
+			is_visible=self.is_visible,
+			parent=self.parent,
+			tag_name=self.tag_name,
+			xpath=self.xpath,
+			attributes=self.attributes,
+			children=list(self.children),
+			is_interactive=self.is_interactive,
+			is_top_element=self.is_top_element,
+			is_in_viewport=self.is_in_viewport,
+			shadow_root=self.shadow_root,
+			highlight_index=self.highlight_index,
+			viewport_coordinates=self.viewport_coordinates,
+			page_coordinates=self.page_coordinates,
+			viewport_info=self.viewport_info,
+		)
+		# Same parent branch, same hash
+		copy._hash = self._hash
+		return copy
 
 	def __repr__(self) -> str:
 		tag_str = f'<{self.tag_name}'
@@ -89,13 +161,15 @@ class DOMElementNode(DOMBaseNode):
 
 		return tag_str
 
-	@cached_property
+	@property
 	def hash(self) -> HashedDomElement:
-		from browser_use.dom.history_tree_processor.service import (
-			HistoryTreeProcessor,
-		)
+		if self._hash is None:
+			from browser_use.dom.history_tree_processor.service import (
+				HistoryTreeProcessor,
+			)
 
-		return HistoryTreeProcessor._hash_dom_element(self)
+			self._hash = HistoryTreeProcessor._hash_dom_element(self)
+		return self._hash
 
 	def get_all_text_till_next_clickable_element(self, max_depth: int = -1) -> str:
 		text_parts = []
@@ -105,7 +179,7 @@ class DOMElementNode(DOMBaseNode):
 				return
 
 			# Skip this branch if we hit a highlighted element (except for the current node)
-			if isinstance(node, DOMElementNode) and node != self and node.highlight_index is not None:
+			if isinstance(node, DOMElementNode) and node is not self and node.highlight_index is not None:
 				return
 
 			if isinstance(node, DOMTextNode):
@@ -119,50 +193,82 @@ class DOMElementNode(DOMBaseNode):
 
 	@time_execution_sync('--clickable_elements_to_string')
 	def clickable_elements_to_string(self, include_attributes: list[str] = []) -> str:
-		"""Convert the processed DOM content to HTML."""
-		formatted_text = []
+		"""
+		Convert the processed DOM content to HTML.
+
+		The tree is walked once: every text node is added to its closest highlighted ancestor, or to the output if it has none.
+		The result is cached on this node, call `invalidate_string_cache` after changing the tree below it.
+		"""
+		cache_key = tuple(include_attributes)
+		if self._string_cache is not None and cache_key in self._string_cache:
+			return self._string_cache[cache_key]
+
+		formatted_text: list[str] = []
+		# Highlighted elements with their position in formatted_text and the text parts of their subtree
+		highlighted: list[tuple[DOMElementNode, int, list[str]]] = []
+
+		# Text of a subtree that is below a highlighted element outside of it is never shown on its own
+		initial_parts: Optional[list[str]] = [] if self._has_highlighted_ancestor() else None
+		stack: list[tuple[DOMBaseNode, Optional[list[str]]]] = [(self, initial_parts)]
+		while stack:
+			node, text_parts = stack.pop()
 
-		def process_node(node: DOMBaseNode, depth: int) -> None:
 			if isinstance(node, DOMElementNode):
-				# Add element with highlight_index
 				if node.highlight_index is not None:
-					attributes_str = ''
-					text = node.get_all_text_till_next_clickable_element()
-					if include_attributes:
-						attributes = list(
-							set(
-								[
-									str(value)
-									for key, value in node.attributes.items()
-									if key in include_attributes and value != node.tag_name
-								]
-							)
-						)
-						if text in attributes:
-							attributes.remove(text)
-						attributes_str = ';'.join(attributes)
-					line = f'[{node.highlight_index}]<{node.tag_name} '
-					if attributes_str:
-						line += f'{attributes_str}'
-					if text:
-						if attributes_str:
-							line += f'>{text}'
-						else:
-							line += f'{text}'
-					line += '/>'
-					formatted_text.append(line)
+					text_parts = []
+					highlighted.append((node, len(formatted_text), text_parts))
+					formatted_text.append('')
 
 				# Process children regardless
-				for child in node.children:
-					process_node(child, depth + 1)
+				for child in reversed(node.children):
+					stack.append((child, text_parts))
 
 			elif isinstance(node, DOMTextNode):
+				if text_parts is not None:
+					text_parts.append(node.text)
 				# Add text only if it doesn't have a highlighted parent
-				if not node.has_parent_with_highlight_index() and node.is_visible:  # and node.is_parent_top_element()
+				elif node.is_visible:  # and node.is_parent_top_element()
 					formatted_text.append(f'{node.text}')
 
-		process_node(self, 0)
-		return '\n'.join(formatted_text)
+		for node, position, text_parts in highlighted:
+			formatted_text[position] = node._format_highlighted_line('\n'.join(text_parts).strip(), include_attributes)
+
+		result = '\n'.join(formatted_text)
+		if self._string_cache is None:
+			self._string_cache = {}
+		self._string_cache[cache_key] = result
+		return result
+
+	def invalidate_string_cache(self) -> None:
+		self._string_cache = None
+
+	def _has_highlighted_ancestor(self) -> bool:
+		current = self.parent
+		while current is not None:
+			if current.highlight_index is not None:
+				return True
+			current = current.parent
+		return False
+
+	def _format_highlighted_line(self, text: str, include_attributes: list[str]) -> str:
+		attributes_str = ''
+		if include_attributes:
+			attributes = list(
+				set([str(value) for key, value in self.attributes.items() if key in include_attributes and value != self.tag_name])
+			)
+			if text in attributes:
+				attributes.remove(text)
+			attributes_str = ';'.join(attributes)
+		line = f'[{self.highlight_index}]<{self.tag_name} '
+		if attributes_str:
+			line += f'{attributes_str}'
+		if text:
+			if attributes_str:
+				line += f'>{text}'
+			else:
+				line += f'{text}'
+		line += '/>'
+		return line
 
 	def get_file_upload_element(self, check_siblings: bool = True) -> Optional['DOMElementNode']:
 		# Check if current element is a file input
@@ -190,7 +296,29 @@ class DOMElementNode(DOMBaseNode):
 SelectorMap = dict[int, DOMElementNode]
 
 
+@dataclass
+class HighlightRect:
+	"""Box of a highlighted element in CSS pixels, relative to the viewport of the main frame"""
+
+	x: float
+	y: float
+	width: float
+	height: float
+
+
 @dataclass
 class DOMState:
 	element_tree: DOMElementNode
 	selector_map: SelectorMap
+	# Boxes by highlight index, only returned when the highlights are drawn onto the screenshot instead of the page
+	highlight_rects: Optional[dict[int, HighlightRect]] = field(default=None, kw_only=True)
+	_hash_index: Optional[HashedDomElementIndex] = field(default=None, init=False, repr=False, compare=False)
+
+	@property
+	def hash_index(self) -> HashedDomElementIndex:
+		"""Highlighted elements by hash, built on first use"""
+		if self._hash_index is None:
+			from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+
+			self._hash_index = HistoryTreeProcessor.build_hash_index(self.element_tree)
+		return self._hash_index
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from browser_use.browser.cdp import CDPSessionManager
+
+
+class DummySession:
+	def __init__(self, fail_with=None):
+		self.sent = []
+		self.detached = False
+		self.fail_with = fail_with
+
+	async def send(self, method, params=None):
+		self.sent.append(method)
+		if self.fail_with:
+			raise Exception(self.fail_with)
+		if method == 'Target.getTargets':
+			return {'targetInfos': [{'targetId': 'a', 'type': 'page', 'title': '', 'url': 'about:blank', 'attached': True}]}
+		if method == 'Performance.getMetrics':
+			return {'metrics': [{'name': 'Nodes', 'value': 12}]}
+		return {}
+
+	async def detach(self):
+		self.detached = True
+
+
+class DummyPage:
+	def __init__(self):
+		self.handlers = {}
+		self.closed = False
+
+	def once(self, event, handler):
+		self.handlers.setdefault(event, []).append(handler)
+
+	def emit(self, event):
+		for handler in self.handlers.pop(event, []):
+			handler(self)
+
+	def is_closed(self):
+		return self.closed
+
+
+class DummyBrowser:
+	def __init__(self):
+		self.sessions = []
+
+	async def new_browser_cdp_session(self):
+		self.sessions.append(DummySession())
+		return self.sessions[-1]
+
+
+class DummyContext:
+	def __init__(self):
+		self.browser = DummyBrowser()
+		self.sessions = []
+		self.next_failure = None
+
+	async def new_cdp_session(self, page):
+		await asyncio.sleep(0)
+		self.sessions.append(DummySession(self.next_failure))
+		self.next_failure = None
+		return self.sessions[-1]
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_attached_once_and_reused():
+	context = DummyContext()
+	manager = CDPSessionManager(context)
+	page = DummyPage()
+
+	# Concurrent commands share one attach
+	await asyncio.gather(*(manager.send(page, 'Page.getLayoutMetrics') for _ in range(3)))
+	await manager.get_performance_metrics(page)
+	assert await manager.get_performance_metrics(page) == {'Nodes': 12}
+	assert len(context.sessions) == 1
+	assert context.sessions[0].sent.count('Performance.enable') == 1
+
+	assert [target['targetId'] for target in await manager.get_targets()] == ['a']
+	await manager.get_targets()
+	assert len(context.browser.sessions) == 1
+
+	await manager.close()
+	assert context.sessions[0].detached and context.browser.sessions[0].detached
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_attached_again_after_losing_them():
+	context = DummyContext()
+	manager = CDPSessionManager(context)
+	page = DummyPage()
+
+	# A detached session is replaced and the command resent
+	context.next_failure = 'Target page, context or browser has been closed'
+	await manager.send(page, 'Page.getLayoutMetrics')
+	assert len(context.sessions) == 2 and context.sessions[1].sent == ['Page.getLayoutMetrics']
+
+	# A crashed page gets a new session on its next command
+	page.emit('crash')
+	await manager.send(page, 'Page.getLayoutMetrics')
+	assert len(context.sessions) == 3
+
+	# Errors of the command itself are not retried
+	context.sessions[2].fail_with = 'Protocol error (DOM.foo): not found'
+	with pytest.raises(Exception, match='Protocol error'):
+		await manager.send(page, 'DOM.foo')
+	assert len(context.sessions) == 3 and manager.attached == 3
@@ -323,4 +323,391 @@ async def test_remove_highlights_failure():
     try:
         await context.remove_highlights()
     except Exception as e:
-        pytest.fail(f"remove_highlights raised an exception: {e}")
\ No newline at end of file
+        pytest.fail(f"remove_highlights raised an exception: {e}")
+@pytest.mark.asyncio
+async def test_element_handles_are_cached_per_snapshot_version():
+    """
+    Test that get_locate_element reuses the handle of an element until the DOM of the
+    element's document changes or the handles are invalidated by a navigation.
+    """
+    from browser_use.browser.context import BrowserSession
+    from browser_use.dom.views import DOMState
+    class DummyElementHandle:
+        def __init__(self):
+            self.dom_version = 0
+        async def evaluate(self, script):
+            return self.dom_version
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig())
+    context.session = BrowserSession(context=Mock(), cached_state=None)
+    page = object()
+    async def get_current_page():
+        return page
+    context.get_current_page = get_current_page
+    handle = DummyElementHandle()
+    located = []
+    async def locate_element(current_page, element):
+        located.append(element)
+        return handle
+    context._locate_element = locate_element
+    element = DOMElementNode(
+        tag_name="input", xpath="html/body/input", attributes={}, children=[], is_visible=True, parent=None, highlight_index=3
+    )
+    context.session.dom_states[page] = DOMState(element_tree=element, selector_map={3: element})
+    # Repeated actions on the same element only locate it once
+    assert await context.get_locate_element(element) is handle
+    assert await context.get_locate_element(element) is handle
+    assert len(located) == 1
+    # A DOM mutation in the element's document drops the cached handle
+    handle.dom_version = 1
+    await context.get_locate_element(element)
+    assert len(located) == 2
+    # A navigation drops all handles
+    version = context.session.snapshot_version
+    context._invalidate_element_handles(context.session)
+    assert context.session.snapshot_version == version + 1
+    await context.get_locate_element(element)
+    assert len(located) == 3
+@pytest.mark.asyncio
+async def test_har_record_and_replay(tmp_path):
+    """
+    Test that _setup_har records into the HAR file through route_from_har(update=True)
+    and replays it without network access.
+    """
+    class DummyPlaywrightContext:
+        def __init__(self):
+            self.calls = []
+        async def route_from_har(self, har, **kwargs):
+            self.calls.append((har, kwargs))
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    har_path = str(tmp_path / "runs" / "run.har.zip")
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig(har_path=har_path, har_mode="record"))
+    playwright_context = DummyPlaywrightContext()
+    await context._setup_har(playwright_context)
+    assert playwright_context.calls == [(har_path, {"update": True, "update_content": "attach", "update_mode": "full"})]
+    assert os.path.isdir(tmp_path / "runs")
+    # Replaying a HAR that was never recorded fails early
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig(har_path=har_path, har_mode="replay"))
+    from browser_use.browser.views import BrowserError
+    with pytest.raises(BrowserError):
+        await context._setup_har(DummyPlaywrightContext())
+    open(har_path, "w").close()
+    playwright_context = DummyPlaywrightContext()
+    await context._setup_har(playwright_context)
+    assert playwright_context.calls == [(har_path, {"not_found": "abort"})]
+@pytest.mark.asyncio
+async def test_update_state_uses_one_probe_round_trip():
+    """
+    Test that _update_state reads title and scroll position with a single evaluate call that also
+    removes the old highlights, and reads the tab titles while the DOM is extracted.
+    """
+    from browser_use.browser.context import PAGE_STATE_PROBE_SCRIPT, BrowserSession
+    from browser_use.dom.views import DOMState
+    class DummyPage:
+        def __init__(self, url, title):
+            self.url = url
+            self._title = title
+            self.scripts = []
+        async def evaluate(self, script):
+            self.scripts.append(script)
+            return {"title": self._title, "scrollX": 0, "scrollY": 100, "viewportWidth": 800, "viewportHeight": 500, "scrollHeight": 1200}
+        async def title(self):
+            return self._title
+    class DummyDomService:
+        async def get_clickable_elements(self, **kwargs):
+            return DOMState(element_tree=DOMElementNode(tag_name="body", xpath="", attributes={}, children=[], is_visible=True, parent=None), selector_map={})
+    page = DummyPage("https://example.com", "Example")
+    other = DummyPage("https://other.com", "Other")
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig(capture_screenshots=False))
+    context.session = BrowserSession(context=type("DummyContext", (), {"pages": [page, other]})(), cached_state=None)
+    async def get_current_page():
+        return page
+    context.get_current_page = get_current_page
+    context._get_dom_service = lambda session, current_page: DummyDomService()
+    state = await context._update_state()
+    assert page.scripts == [PAGE_STATE_PROBE_SCRIPT]
+    assert state.title == "Example"
+    assert (state.pixels_above, state.pixels_below) == (100, 600)
+    assert [(tab.page_id, tab.title) for tab in state.tabs] == [(0, "Example"), (1, "Other")]
+@pytest.mark.asyncio
+async def test_element_handles_survive_unchanged_snapshots():
+    """
+    Test that a handle located before two get_state calls is reused without querying the page again,
+    because the state probe already confirmed that its element is still in place.
+    """
+    from browser_use.browser.context import BrowserSession
+    from browser_use.dom.views import DOMState
+    class DummyElementHandle:
+        def __init__(self):
+            self.evaluations = 0
+        async def evaluate(self, script):
+            self.evaluations += 1
+            return "doc:1"
+    class DummyPage:
+        def __init__(self):
+            self.url = "https://example.com"
+            self.xpath = "html/body/button"
+            self.probed_handles = []
+        async def evaluate(self, script, handles=None):
+            self.probed_handles.append(handles)
+            return {
+                "title": "Example", "scrollX": 0, "scrollY": 0, "viewportWidth": 800, "viewportHeight": 500,
+                "scrollHeight": 500, "domVersion": "doc:1", "handleXPaths": [self.xpath for _ in handles or []],
+            }
+        async def title(self):
+            return "Example"
+    class DummyDomService:
+        async def get_clickable_elements(self, **kwargs):
+            # Every snapshot builds new element objects
+            body = DOMElementNode(tag_name="body", xpath="html/body", attributes={}, children=[], is_visible=True, parent=None)
+            button = DOMElementNode(
+                tag_name="button", xpath="html/body/button", attributes={"id": "save"}, children=[], is_visible=True,
+                parent=body, highlight_index=0,
+            )
+            body.children.append(button)
+            return DOMState(element_tree=body, selector_map={0: button})
+    page = DummyPage()
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig(capture_screenshots=False))
+    context.session = BrowserSession(context=type("DummyContext", (), {"pages": [page]})(), cached_state=None)
+    async def get_current_page():
+        return page
+    async def wait_for_page_and_frames_load(timeout_overwrite=None):
+        pass
+    context.get_current_page = get_current_page
+    context._wait_for_page_and_frames_load = wait_for_page_and_frames_load
+    context._get_dom_service = lambda session, current_page: DummyDomService()
+    handle = DummyElementHandle()
+    located = []
+    async def locate_element(current_page, element):
+        located.append(element)
+        return handle
+    context._locate_element = locate_element
+    state = await context.get_state()
+    assert await context.get_locate_element(state.selector_map[0]) is handle
+    await context.get_state()
+    state = await context.get_state()
+    assert page.probed_handles[-1] == [handle]
+    # Neither the locator query nor a check of the handle is repeated
+    assert await context.get_locate_element(state.selector_map[0]) is handle
+    assert len(located) == 1
+    assert handle.evaluations == 1
+    # An element that moved is located again
+    page.xpath = "html/body/div/button"
+    state = await context.get_state()
+    await context.get_locate_element(state.selector_map[0])
+    assert len(located) == 2
+@pytest.mark.asyncio
+async def test_clear_web_storage_clears_every_visited_origin():
+    """
+    Test that resetting a context clears all storage types of every origin any frame navigated to,
+    not only the origins that currently have local storage.
+    """
+    from browser_use.browser.context import BrowserSession
+    class DummyFrame:
+        def __init__(self, url):
+            self.url = url
+    class DummyPage:
+        def __init__(self):
+            self.handlers = {}
+            self.frames = [DummyFrame("https://start.example.com/")]
+        def on(self, event, handler):
+            self.handlers[event] = handler
+    class DummyPlaywrightContext:
+        def __init__(self, page):
+            self.pages = [page]
+        def on(self, event, handler):
+            pass
+        async def storage_state(self):
+            return {"cookies": [], "origins": [{"origin": "https://stored.example.com", "localStorage": []}]}
+    page = DummyPage()
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig())
+    session = BrowserSession(context=DummyPlaywrightContext(page), cached_state=None)
+    context._track_visited_origins(session)
+    page.handlers["framenavigated"](DummyFrame("https://ads.example.net/frame?id=1"))
+    page.handlers["framenavigated"](DummyFrame("about:blank"))
+    cleared = []
+    async def page_session(current_page):
+        return Mock()
+    async def clear_storage(current_page, origin, storage_types="all"):
+        cleared.append((origin, storage_types))
+    session.cdp_sessions.page_session = page_session
+    session.cdp_sessions.clear_storage = clear_storage
+    await context._clear_web_storage(session, page)
+    assert sorted(cleared) == [
+        ("https://ads.example.net", "all"), ("https://start.example.com", "all"), ("https://stored.example.com", "all"),
+    ]
+    assert session.visited_origins == set()
+@pytest.mark.asyncio
+async def test_reset_for_reuse_saves_cookies_before_clearing_them(tmp_path):
+    """
+    Test that a cookie save scheduled by the last step is written before the reset clears the cookies,
+    and that the emptied cookie jar never overwrites the cookies_file.
+    """
+    import json
+    from browser_use.browser.context import BrowserSession
+    cookies_file = str(tmp_path / "cookies.json")
+    class DummyPage:
+        url = "about:blank"
+        frames = []
+        def is_closed(self):
+            return False
+        def on(self, event, handler):
+            pass
+        async def evaluate(self, script):
+            pass
+        async def goto(self, url):
+            self.url = url
+    class DummyPlaywrightContext:
+        def __init__(self):
+            self.pages = [DummyPage()]
+            self.jar = [{"name": "session", "value": "1", "domain": "example.com", "path": "/"}]
+        def on(self, event, handler):
+            pass
+        async def cookies(self):
+            return list(self.jar)
+        async def clear_cookies(self):
+            self.jar = []
+        async def clear_permissions(self):
+            pass
+        async def add_cookies(self, cookies):
+            self.jar.extend(cookies)
+        async def storage_state(self):
+            return {"cookies": list(self.jar), "origins": []}
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    context = BrowserContext(
+        browser=dummy_browser, config=BrowserContextConfig(cookies_file=cookies_file, state_save_debounce=60)
+    )
+    context.session = BrowserSession(context=DummyPlaywrightContext(), cached_state=None)
+    async def page_session(page):
+        raise RuntimeError("CDP is not supported")
+    context.session.cdp_sessions.page_session = page_session
+    context.cookie_persister.schedule()
+    await context.reset_for_reuse()
+    with open(cookies_file) as f:
+        assert [cookie["name"] for cookie in json.load(f)] == ["session"]
+    # The cookies of the file are loaded again for the next task
+    assert [cookie["name"] for cookie in context.session.context.jar] == ["session"]
+@pytest.mark.asyncio
+async def test_element_handles_of_identical_iframes_are_not_mixed_up():
+    """
+    Test that the buttons of two identical iframes, which have the same element hash, are each located
+    on their own instead of sharing the cached handle of the first one.
+    """
+    from browser_use.browser.context import BrowserSession
+    from browser_use.dom.views import DOMState
+    class DummyElementHandle:
+        async def evaluate(self, script):
+            return "doc:1"
+    class DummyPage:
+        url = "https://example.com"
+        async def evaluate(self, script, handles=None):
+            return {
+                "title": "Example", "scrollX": 0, "scrollY": 0, "viewportWidth": 800, "viewportHeight": 500,
+                "scrollHeight": 500, "domVersion": "doc:1", "handleXPaths": [],
+            }
+        async def title(self):
+            return "Example"
+    class DummyDomService:
+        async def get_clickable_elements(self, **kwargs):
+            body = DOMElementNode(tag_name="body", xpath="html/body", attributes={}, children=[], is_visible=True, parent=None)
+            selector_map = {}
+            for index in range(2):
+                iframe = DOMElementNode(
+                    tag_name="iframe", xpath=f"html/body/iframe[{index + 1}]", attributes={"src": "/widget"}, children=[],
+                    is_visible=True, parent=body,
+                )
+                frame_body = DOMElementNode(tag_name="body", xpath="html/body", attributes={}, children=[], is_visible=True, parent=iframe)
+                button = DOMElementNode(
+                    tag_name="button", xpath="html/body/button", attributes={"id": "ok"}, children=[], is_visible=True,
+                    parent=frame_body, highlight_index=index,
+                )
+                frame_body.children.append(button)
+                iframe.children.append(frame_body)
+                body.children.append(iframe)
+                selector_map[index] = button
+            return DOMState(element_tree=body, selector_map=selector_map)
+    page = DummyPage()
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig(capture_screenshots=False))
+    context.session = BrowserSession(context=type("DummyContext", (), {"pages": [page]})(), cached_state=None)
+    async def get_current_page():
+        return page
+    async def wait_for_page_and_frames_load(timeout_overwrite=None):
+        pass
+    context.get_current_page = get_current_page
+    context._wait_for_page_and_frames_load = wait_for_page_and_frames_load
+    context._get_dom_service = lambda session, current_page: DummyDomService()
+    located = []
+    async def locate_element(current_page, element):
+        located.append(element)
+        return DummyElementHandle()
+    context._locate_element = locate_element
+    state = await context.get_state()
+    first, second = state.selector_map[0], state.selector_map[1]
+    assert first.hash == second.hash
+    first_handle = await context.get_locate_element(first)
+    second_handle = await context.get_locate_element(second)
+    assert second_handle is not first_handle
+    assert located == [first, second]
+    assert context.session.element_handles == {}
+@pytest.mark.asyncio
+async def test_update_state_brings_page_to_front_only_after_a_tab_change():
+    """
+    Test that _update_state only brings the page to front before the screenshot when the
+    current page differs from the page brought to front last.
+    """
+    from browser_use.browser.context import BrowserSession
+    from browser_use.dom.views import DOMState
+    class DummyPage:
+        url = "https://example.com"
+        def __init__(self):
+            self.brought_to_front = 0
+        async def evaluate(self, script, handles=None):
+            return {
+                "title": "Example", "scrollX": 0, "scrollY": 0, "viewportWidth": 800, "viewportHeight": 500,
+                "scrollHeight": 500, "domVersion": "doc:1", "handleXPaths": [],
+            }
+        async def title(self):
+            return "Example"
+        async def bring_to_front(self):
+            self.brought_to_front += 1
+    class DummyDomService:
+        async def get_clickable_elements(self, **kwargs):
+            body = DOMElementNode(tag_name="body", xpath="html/body", attributes={}, children=[], is_visible=True, parent=None)
+            return DOMState(element_tree=body, selector_map={})
+    first, second = DummyPage(), DummyPage()
+    dummy_browser = Mock()
+    dummy_browser.config = Mock()
+    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig())
+    context.session = BrowserSession(context=type("DummyContext", (), {"pages": [first, second]})(), cached_state=None)
+    current = first
+    async def get_current_page():
+        return current
+    async def wait_for_page_and_frames_load(timeout_overwrite=None):
+        pass
+    async def capture_screenshot(page, highlights=None, viewport_width=None):
+        return "screenshot"
+    context.get_current_page = get_current_page
+    context._wait_for_page_and_frames_load = wait_for_page_and_frames_load
+    context._get_dom_service = lambda session, current_page: DummyDomService()
+    context._capture_screenshot = capture_screenshot
+    await context.get_state()
+    await context.get_state()
+    assert first.brought_to_front == 1
+    current = second
+    await context.get_state()
+    assert second.brought_to_front == 1
+    # A new page may take the focus, so the current page is brought to front again
+    context.session.front_page = None
+    await context.get_state()
+    assert second.brought_to_front == 2
@@ -0,0 +1,108 @@
+import pytest
+
+from browser_use.dom.service import DomService
+
+
+def element(backend_id: int, name: str, children: list | None = None, attributes: list | None = None, **extra) -> dict:
+	return {
+		'nodeType': 1,
+		'nodeName': name.upper(),
+		'localName': name,
+		'backendNodeId': backend_id,
+		'attributes': attributes or [],
+		'children': children or [],
+		**extra,
+	}
+
+
+DOCUMENT = {
+	'root': {
+		'nodeType': 9,
+		'nodeName': '#document',
+		'backendNodeId': 1,
+		'children': [
+			element(
+				2,
+				'html',
+				[
+					element(3, 'head'),
+					element(
+						4,
+						'body',
+						[
+							element(5, 'div', [element(6, 'button', attributes=['type', 'submit'])]),
+							element(7, 'div', [element(8, 'a', attributes=['href', '/docs'])]),
+							element(
+								9,
+								'my-search',
+								shadowRoots=[
+									{'nodeType': 11, 'nodeName': '#document-fragment', 'backendNodeId': 10, 'children': [element(11, 'input')]}
+								],
+							),
+						],
+					),
+				],
+			)
+		],
+	}
+}
+
+
+def ax_node(node_id: str, role: str, name: str = '', children: list[str] | None = None, backend_id: int | None = None, **extra) -> dict:
+	node = {'nodeId': node_id, 'role': {'type': 'role', 'value': role}, 'childIds': children or [], **extra}
+	if name:
+		node['name'] = {'type': 'computedString', 'value': name}
+	if backend_id is not None:
+		node['backendDOMNodeId'] = backend_id
+	return node
+
+
+AX_TREE = {
+	'nodes': [
+		ax_node('1', 'RootWebArea', 'Shop', ['2', '3', '6', '8']),
+		ax_node('2', 'heading', 'Checkout', ['20']),
+		ax_node('20', 'StaticText', 'Checkout'),
+		ax_node('3', 'generic', children=['4'], ignored=True),
+		ax_node('4', 'button', 'Pay now', ['5'], backend_id=6),
+		ax_node('5', 'StaticText', 'Pay now'),
+		ax_node('6', 'link', 'Docs', ['7'], backend_id=8),
+		ax_node('7', 'StaticText', 'Docs'),
+		ax_node('8', 'searchbox', 'Search', backend_id=11),
+	]
+}
+
+
+class DummyCDPSession:
+	async def send(self, method, params=None):
+		if method == 'DOM.getDocument':
+			assert params == {'depth': -1, 'pierce': True}
+			return DOCUMENT
+		if method == 'Accessibility.getFullAXTree':
+			return AX_TREE
+		raise AssertionError(method)
+
+
+class DummyContext:
+	async def new_cdp_session(self, page):
+		return DummyCDPSession()
+
+
+class DummyPage:
+	context = DummyContext()
+
+	async def evaluate(self, script, args=None):
+		raise AssertionError('The accessibility backend does not evaluate scripts')
+
+
+@pytest.mark.asyncio
+async def test_accessibility_backend_lists_interactive_elements():
+	state = await DomService(DummyPage()).get_clickable_elements(backend='accessibility')
+
+	assert [(element.tag_name, element.xpath) for element in state.selector_map.values()] == [
+		('button', 'html/body/div/button'),
+		('a', 'html/body/div[2]/a'),
+		('input', ''),
+	]
+	assert state.selector_map[0].attributes == {'type': 'submit'}
+	assert state.element_tree.clickable_elements_to_string() == 'Checkout\n[0]<button Pay now/>\n[1]<a Docs/>\n[2]<input Search/>'
+	assert state.selector_map[1].hash is not None
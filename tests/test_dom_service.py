@@ -0,0 +1,477 @@
+import gc
+
+import pytest
+
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.service import FRAME_ELEMENT_XPATH_SCRIPT, DomService, get_extractor_scripts
+from browser_use.dom.views import DOMElementNode, DOMTextNode
+
+
+class DummyPage:
+	"""Page that returns the queued buildDomTree results in order"""
+
+	def __init__(self, results: list[dict]):
+		self.results = results
+		self.calls: list[dict] = []
+		self.installs = 0
+		self.installed = False
+
+	async def evaluate(self, script, args=None):
+		call_script, install_script = get_extractor_scripts()
+		if script == call_script and not self.installed:
+			return None
+		if script == install_script:
+			self.installs += 1
+			self.installed = True
+		self.calls.append(args)
+		return self.results.pop(0)
+
+
+FULL_SNAPSHOT = {
+	'rootId': '0',
+	'version': 1,
+	'patch': None,
+	'removed': [],
+	'map': {
+		'0': {'tagName': 'body', 'attributes': {}, 'xpath': '/body', 'children': ['1', '3']},
+		'1': {
+			'tagName': 'button',
+			'attributes': {},
+			'xpath': 'html/body/button',
+			'children': ['2'],
+			'isVisible': True,
+			'isInteractive': True,
+			'isTopElement': True,
+			'highlightIndex': 0,
+		},
+		'2': {'type': 'TEXT_NODE', 'text': 'Save', 'isVisible': True},
+		'3': {'tagName': 'div', 'attributes': {}, 'xpath': 'html/body/div', 'children': ['4'], 'isVisible': True},
+		'4': {
+			'tagName': 'a',
+			'attributes': {'href': '/old'},
+			'xpath': 'html/body/div/a',
+			'children': [],
+			'isVisible': True,
+			'isInteractive': True,
+			'isTopElement': True,
+			'highlightIndex': 1,
+		},
+	},
+}
+
+PATCH = {
+	'rootId': '0',
+	'version': 2,
+	'patch': ['3'],
+	'removed': ['4'],
+	'map': {
+		'5': {
+			'tagName': 'input',
+			'attributes': {'type': 'text'},
+			'xpath': 'html/body/div/input',
+			'children': [],
+			'isVisible': True,
+			'isInteractive': True,
+			'isTopElement': True,
+			'highlightIndex': 2,
+		},
+		'3': {'tagName': 'div', 'attributes': {}, 'xpath': 'html/body/div', 'children': ['5'], 'isVisible': True},
+	},
+}
+
+
+@pytest.mark.asyncio
+async def test_incremental_patch_replaces_changed_subtree():
+	"""
+	A patch only contains the changed subtree; it must replace the old subtree in a copy of the previous
+	tree, keep the untouched nodes and their selector map entries and leave the previous state as it was.
+	"""
+	page = DummyPage([dict(FULL_SNAPSHOT), dict(PATCH)])
+	dom_service = DomService(page)
+
+	first = await dom_service.get_clickable_elements(incremental=True)
+	button = first.selector_map[0]
+	assert set(first.selector_map) == {0, 1}
+	assert first.element_tree.clickable_elements_to_string() == '[0]<button Save/>\n[1]<a />'
+
+	second = await dom_service.get_clickable_elements(incremental=True)
+	assert page.calls[1]['baseVersion'] == 1
+
+	# Unchanged nodes are copied into the new tree, the previous tree is left alone
+	assert second.element_tree is not first.element_tree
+	assert second.selector_map[0] is not button
+	assert second.selector_map[0].parent is second.element_tree
+	assert button.parent is first.element_tree
+	assert set(second.selector_map) == {0, 2}
+
+	# The previous state still shows the page as it was
+	assert set(first.selector_map) == {0, 1}
+	assert first.selector_map[1].parent is first.element_tree.children[1]
+	assert first.element_tree.clickable_elements_to_string() == '[0]<button Save/>\n[1]<a />'
+
+	div = second.element_tree.children[1]
+	assert isinstance(div, DOMElementNode)
+	assert div.parent is second.element_tree
+	assert [child.tag_name for child in div.children] == ['input']
+	assert div.children[0].parent is div
+	assert isinstance(second.selector_map[0].children[0], DOMTextNode)
+	assert second.selector_map[0].children[0].parent is second.selector_map[0]
+	assert '4' not in dom_service.snapshot.node_map
+	assert second.element_tree.clickable_elements_to_string() == '[0]<button Save/>\n[2]<input />'
+
+	# Hashes of the patched subtree are computed when it is linked into the tree
+	for element in second.selector_map.values():
+		assert element.hash == HistoryTreeProcessor._hash_dom_element(element)
+
+
+@pytest.mark.asyncio
+async def test_incremental_patch_keeps_previous_state_intact():
+	"""Applying a patch must not move nodes of the previous state or reset their hashes"""
+	page = DummyPage([dict(FULL_SNAPSHOT), dict(PATCH)])
+	dom_service = DomService(page)
+
+	first = await dom_service.get_clickable_elements(incremental=True)
+	hashes = {index: element.hash for index, element in first.selector_map.items()}
+	await dom_service.get_clickable_elements(incremental=True)
+
+	for index, element in first.selector_map.items():
+		assert element._hash == hashes[index]
+		assert element.hash == HistoryTreeProcessor._hash_dom_element(element)
+		root = element
+		while root.parent is not None:
+			assert root in root.parent.children
+			root = root.parent
+		assert root is first.element_tree
+
+
+@pytest.mark.asyncio
+async def test_incremental_patch_out_of_sync_takes_full_snapshot():
+	"""If the patch references a node we do not know, a full snapshot is requested instead"""
+	broken_patch = dict(PATCH, patch=['42'])
+	page = DummyPage([dict(FULL_SNAPSHOT), broken_patch, dict(FULL_SNAPSHOT, version=3)])
+	dom_service = DomService(page)
+
+	await dom_service.get_clickable_elements(incremental=True)
+	state = await dom_service.get_clickable_elements(incremental=True)
+
+	assert page.calls[-1]['baseVersion'] is None
+	assert dom_service.snapshot.version == 3
+	assert set(state.selector_map) == {0, 1}
+
+
+@pytest.mark.asyncio
+async def test_extractor_is_installed_once_per_document():
+	"""The extractor source is only sent when the page does not have it installed yet"""
+	page = DummyPage([dict(FULL_SNAPSHOT), dict(FULL_SNAPSHOT), dict(FULL_SNAPSHOT)])
+	dom_service = DomService(page)
+
+	await dom_service.get_clickable_elements()
+	await dom_service.get_clickable_elements()
+	assert page.installs == 1
+
+	# Navigating to a new document drops the installed extractor
+	page.installed = False
+	await dom_service.get_clickable_elements()
+	assert page.installs == 2
+	assert len(page.calls) == 3
+	assert page.calls[0]['occlusionMode'] == 'point'
+
+
+@pytest.mark.asyncio
+async def test_occlusion_mode_is_passed_to_extractor():
+	page = DummyPage([dict(FULL_SNAPSHOT)])
+	await DomService(page).get_clickable_elements(occlusion_mode='grid')
+	assert page.calls[0]['occlusionMode'] == 'grid'
+
+
+@pytest.mark.asyncio
+async def test_persistent_cache_is_passed_to_extractor():
+	page = DummyPage([dict(FULL_SNAPSHOT), dict(FULL_SNAPSHOT)])
+	dom_service = DomService(page)
+	await dom_service.get_clickable_elements()
+	await dom_service.get_clickable_elements(persistent_cache=True)
+	assert [call['persistentCache'] for call in page.calls] == [False, True]
+
+
+
+@pytest.mark.asyncio
+async def test_highlight_rects_are_returned_instead_of_drawn():
+	page = DummyPage([{**FULL_SNAPSHOT, 'highlightRects': [[0, 10, 20, 80, 30], [1, 10.5, 60, 40, 16]]}, dict(FULL_SNAPSHOT)])
+	dom_service = DomService(page)
+	state = await dom_service.get_clickable_elements(highlight_elements=False, return_highlight_rects=True)
+	assert page.calls[0]['doHighlightElements'] is False and page.calls[0]['collectHighlightRects'] is True
+	assert sorted(state.highlight_rects) == [0, 1]
+	assert (state.highlight_rects[1].x, state.highlight_rects[1].height) == (10.5, 16)
+
+	state = await dom_service.get_clickable_elements()
+	assert state.highlight_rects is None
+
+
+COMPACT_SNAPSHOT = {
+	'rootId': '0',
+	'nodes': {
+		'strings': ['body', '/body', 'button', 'html/body/button', 'type', 'submit', 'Save', 'div', 'html/body/div', 'a', 'href', '/old'],
+		'parents': [-1, 0, 1, 0, 3],
+		'tags': [0, 2, -1, 7, 9],
+		'flags': [0, 2 | 4 | 8, 1 | 2, 2, 2 | 4 | 8 | 64],
+		'highlights': [-1, 0, -1, -1, 1],
+		'values': [1, 3, 6, 8, 9],
+		'attributeCounts': [0, 1, 0, 0, 1],
+		'attributes': [4, 5, 10, 11],
+	},
+}
+
+
+@pytest.mark.asyncio
+async def test_compact_payload_matches_dict_payload():
+	"""The columnar payload decodes to the same tree as the dict per node payload"""
+	dict_state = await DomService(DummyPage([dict(FULL_SNAPSHOT)])).get_clickable_elements()
+	compact_state = await DomService(DummyPage([dict(COMPACT_SNAPSHOT)])).get_clickable_elements(compact_payload=True)
+
+	assert set(compact_state.selector_map) == set(dict_state.selector_map)
+	for index, element in dict_state.selector_map.items():
+		decoded = compact_state.selector_map[index]
+		assert decoded.tag_name == element.tag_name
+		assert decoded.xpath == element.xpath
+		assert decoded.is_interactive and decoded.is_top_element and decoded.is_visible
+
+	button = compact_state.selector_map[0]
+	assert button.attributes == {'type': 'submit'}
+	assert button.children[0].text == 'Save'
+	assert button.children[0].parent is button
+	assert compact_state.selector_map[1].parent.tag_name == 'div'
+	assert compact_state.element_tree.clickable_elements_to_string() == '[0]<button Save/>\n[1]<a />'
+
+
+@pytest.mark.asyncio
+async def test_precomputed_hashes_match_element_hashes():
+	"""Hashes computed top-down while building the tree match hashing each element on its own"""
+	state = await DomService(DummyPage([dict(FULL_SNAPSHOT)])).get_clickable_elements()
+
+	for element in state.selector_map.values():
+		precomputed = element._hash
+		assert precomputed is not None
+		assert precomputed == HistoryTreeProcessor._hash_dom_element(element)
+		history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(element)
+		assert HistoryTreeProcessor.compare_history_element_and_dom_element(history_element, element)
+
+	path_hashes = {element.hash.branch_path_hash for element in state.selector_map.values()}
+	assert len(path_hashes) == 2
+
+
+@pytest.mark.asyncio
+async def test_element_keeps_its_ancestors_without_the_tree():
+	"""An element kept on its own, e.g. from a selector map, can still walk up to the root"""
+	state = await DomService(DummyPage([dict(FULL_SNAPSHOT)])).get_clickable_elements()
+	link = state.selector_map[1]
+	assert not hasattr(link, '__dict__')
+	expected_hash = HistoryTreeProcessor._hash_dom_element(link)
+
+	del state
+	gc.collect()
+	assert link.parent.tag_name == 'div'
+	assert link.parent.parent.tag_name == 'body'
+	assert HistoryTreeProcessor._hash_dom_element(link) == expected_hash
+
+
+def test_clickable_elements_to_string_assigns_text_to_closest_highlighted_element():
+	def text(value: str, is_visible: bool = True) -> DOMTextNode:
+		return DOMTextNode(is_visible=is_visible, parent=None, text=value)
+
+	def element(tag_name: str, children: list, highlight_index=None, attributes=None) -> DOMElementNode:
+		node = DOMElementNode(
+			is_visible=True,
+			parent=None,
+			tag_name=tag_name,
+			xpath=tag_name,
+			attributes=attributes or {},
+			children=children,
+			highlight_index=highlight_index,
+		)
+		for child in children:
+			child.parent = node
+		return node
+
+	nested_link = element('a', [text('Details')], highlight_index=1, attributes={'title': 'Details'})
+	card = element('div', [text('Product'), element('span', [text('$10')]), nested_link, text('In stock')], highlight_index=0)
+	root = element('body', [text('Header'), text('hidden', is_visible=False), card, text('Footer')])
+
+	expected = '\n'.join(['Header', '[0]<div Product\n$10\nIn stock/>', '[1]<a Details/>', 'Footer'])
+	assert root.clickable_elements_to_string(include_attributes=['title']) == expected
+	assert root.clickable_elements_to_string(include_attributes=['title']) is root.clickable_elements_to_string(['title'])
+	# Text below a highlighted element is not shown on its own when rendering a subtree
+	assert card.children[1].clickable_elements_to_string() == ''
+
+
+@pytest.mark.asyncio
+async def test_hash_index_finds_history_elements():
+	"""History elements are found by exact hash, or by two of three hash components if unique"""
+	state = await DomService(DummyPage([dict(FULL_SNAPSHOT)])).get_clickable_elements()
+	link = state.selector_map[1]
+	history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(link)
+
+	assert state.hash_index is state.hash_index
+	assert HistoryTreeProcessor.find_history_element_in_index(history_element, state.hash_index) is link
+
+	# The href changed, branch path and xpath still identify the element
+	history_element.attributes = {'href': '/new'}
+	assert HistoryTreeProcessor.find_history_element_in_index(history_element, state.hash_index) is link
+
+	# Only the attributes still match
+	history_element.xpath = 'html/body/section/a'
+	history_element.entire_parent_branch_path = ['section', 'a']
+	assert HistoryTreeProcessor.find_history_element_in_index(history_element, state.hash_index) is None
+
+
+class DummyElementHandle:
+	def __init__(self, xpath: str):
+		self.xpath = xpath
+
+	async def evaluate(self, script, args=None):
+		assert script == FRAME_ELEMENT_XPATH_SCRIPT
+		return self.xpath
+
+
+class DummyFrame:
+	"""Frame with the extractor installed that returns one result and records the highlight calls"""
+
+	def __init__(self, url: str, result: dict, parent_frame=None, iframe_xpath: str = ''):
+		self.url = url
+		self.result = result
+		self.parent_frame = parent_frame
+		self.iframe_xpath = iframe_xpath
+		self.calls: list[dict] = []
+
+	async def frame_element(self):
+		return DummyElementHandle(self.iframe_xpath)
+
+	async def evaluate(self, script, args=None):
+		self.calls.append(args)
+		if args.get('highlightTargets') is not None:
+			return {'highlighted': len(args['highlightTargets'])}
+		return self.result
+
+
+def frame_snapshot(nodes: dict) -> dict:
+	return {'rootId': '0', 'map': {'0': {'tagName': 'body', 'attributes': {}, 'xpath': '/body', 'children': list(nodes)}, **nodes}}
+
+
+def interactive(tag_name: str, xpath: str, highlight_index: int, attributes: dict | None = None) -> dict:
+	return {
+		'tagName': tag_name,
+		'attributes': attributes or {},
+		'xpath': xpath,
+		'children': [],
+		'isVisible': True,
+		'isInteractive': True,
+		'isTopElement': True,
+		'highlightIndex': highlight_index,
+	}
+
+
+@pytest.mark.asyncio
+async def test_parallel_frames_are_linked_with_global_highlight_indices():
+	main_frame = DummyFrame(
+		'https://shop.example',
+		frame_snapshot(
+			{
+				'1': interactive('button', 'html/body/button', 0),
+				'2': {'tagName': 'iframe', 'attributes': {'src': 'https://pay.example'}, 'xpath': 'html/body/iframe', 'children': []},
+				'3': interactive('a', 'html/body/a', 1, {'href': '/help'}),
+			}
+		),
+	)
+	payment_frame = DummyFrame(
+		'https://pay.example',
+		frame_snapshot({'1': interactive('input', 'html/body/input', 0)}),
+		parent_frame=main_frame,
+		iframe_xpath='html/body/iframe',
+	)
+	hidden_frame = DummyFrame('https://ads.example', frame_snapshot({}), parent_frame=main_frame, iframe_xpath='html/body/div/iframe')
+
+	page = DummyPage([])
+	page.main_frame = main_frame
+	page.frames = [main_frame, payment_frame, hidden_frame]
+
+	state = await DomService(page).get_clickable_elements(parallel_frames=True)
+
+	assert [element.tag_name for element in state.selector_map.values()] == ['button', 'input', 'a']
+	card_input = state.selector_map[1]
+	assert card_input.xpath == 'html/body/input'
+	assert [parent.tag_name for parent in (card_input.parent, card_input.parent.parent, card_input.parent.parent.parent)] == [
+		'body',
+		'html',
+		'iframe',
+	]
+	assert card_input.hash == HistoryTreeProcessor._hash_dom_element(card_input)
+
+	# Every frame is extracted on its own and then highlighted with the global indices
+	assert main_frame.calls[0]['descendIframes'] is False
+	assert main_frame.calls[0]['deferHighlights'] is True
+	assert main_frame.calls[1] == {'highlightTargets': [[0, 0], [1, 2]]}
+	assert payment_frame.calls[1] == {'highlightTargets': [[0, 1]]}
+	assert len(hidden_frame.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_incremental_patch_copies_highlighted_ancestors():
+	"""A highlighted ancestor of a patched subtree is copied, the selector map points to the copy"""
+	full = dict(FULL_SNAPSHOT, map=dict(FULL_SNAPSHOT['map']))
+	full['map']['3'] = dict(full['map']['3'], isInteractive=True, isTopElement=True, highlightIndex=3)
+	full['map']['4'] = dict(full['map']['4'], children=['6'])
+	full['map']['6'] = {'tagName': 'span', 'attributes': {}, 'xpath': 'html/body/div/a/span', 'children': [], 'isVisible': True}
+	patch = dict(PATCH, patch=['6'], removed=[], map={'6': dict(full['map']['6'], attributes={'class': 'new'})})
+	page = DummyPage([full, patch, dict(PATCH, patch=['3'], version=3)])
+	dom_service = DomService(page)
+
+	first = await dom_service.get_clickable_elements(incremental=True)
+	second = await dom_service.get_clickable_elements(incremental=True)
+	assert second.selector_map[3] is not first.selector_map[3]
+	assert second.selector_map[1].parent is second.selector_map[3]
+	assert second.selector_map[1].children[0].attributes == {'class': 'new'}
+	assert first.selector_map[1].children[0].attributes == {}
+
+	# The copies are patched again by later patches
+	third = await dom_service.get_clickable_elements(incremental=True)
+	assert page.calls[-1]['baseVersion'] == 2
+	assert set(third.selector_map) == {0, 2}
+	assert third.element_tree.children[1].children[0].tag_name == 'input'
+
+
+@pytest.mark.asyncio
+async def test_parallel_frames_skip_frames_that_cannot_be_evaluated():
+	"""A frame that fails to evaluate, e.g. an out-of-process iframe that was not attached, is left empty"""
+
+	class UnreachableFrame(DummyFrame):
+		async def evaluate(self, script, args=None):
+			self.calls.append(args)
+			raise RuntimeError('Execution context was destroyed')
+
+	main_frame = DummyFrame(
+		'https://shop.example',
+		frame_snapshot(
+			{
+				'1': {'tagName': 'iframe', 'attributes': {}, 'xpath': 'html/body/iframe', 'children': []},
+				'2': interactive('button', 'html/body/button', 0),
+			}
+		),
+	)
+	remote_frame = UnreachableFrame('https://remote.example', {}, parent_frame=main_frame, iframe_xpath='html/body/iframe')
+	nested_frame = DummyFrame(
+		'https://nested.example',
+		frame_snapshot({'1': interactive('a', 'html/body/a', 0)}),
+		parent_frame=remote_frame,
+		iframe_xpath='html/body/iframe',
+	)
+
+	page = DummyPage([])
+	page.main_frame = main_frame
+	page.frames = [main_frame, remote_frame, nested_frame]
+
+	state = await DomService(page).get_clickable_elements(parallel_frames=True)
+
+	assert [element.tag_name for element in state.selector_map.values()] == ['button']
+	iframe = state.element_tree.children[0]
+	assert iframe.tag_name == 'iframe' and iframe.children == []
+	# The nested frame has no parent tree to be linked into, so it is not highlighted either
+	assert len(nested_frame.calls) == 1
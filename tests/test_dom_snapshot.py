@@ -0,0 +1,157 @@
+import pytest
+
+from browser_use.dom.service import DomService
+from browser_use.dom.snapshot.service import COMPUTED_STYLES, HIGHLIGHT_SCRIPT
+
+
+class SnapshotBuilder:
+	"""Builds a DOMSnapshot.captureSnapshot result with a shared string table"""
+
+	def __init__(self):
+		self.strings: list[str] = []
+		self.documents: list[dict] = []
+
+	def intern(self, value: str) -> int:
+		if value not in self.strings:
+			self.strings.append(value)
+		return self.strings.index(value)
+
+	def document(self, nodes: list[tuple], scroll: tuple[int, int] = (0, 0)) -> None:
+		"""nodes: (parent, node_type, name, value, attributes, bounds, extra)"""
+		document = {
+			'nodes': {
+				'parentIndex': [],
+				'nodeType': [],
+				'nodeName': [],
+				'nodeValue': [],
+				'attributes': [],
+				'isClickable': {'index': []},
+				'contentDocumentIndex': {'index': [], 'value': []},
+			},
+			'layout': {'nodeIndex': [], 'bounds': [], 'styles': [], 'paintOrders': []},
+			'scrollOffsetX': scroll[0],
+			'scrollOffsetY': scroll[1],
+		}
+		for index, (parent, node_type, name, value, attributes, bounds, extra) in enumerate(nodes):
+			document['nodes']['parentIndex'].append(parent)
+			document['nodes']['nodeType'].append(node_type)
+			document['nodes']['nodeName'].append(self.intern(name))
+			document['nodes']['nodeValue'].append(self.intern(value) if value else -1)
+			document['nodes']['attributes'].append([self.intern(part) for item in attributes.items() for part in item])
+			if extra.get('clickable'):
+				document['nodes']['isClickable']['index'].append(index)
+			if 'content_document' in extra:
+				document['nodes']['contentDocumentIndex']['index'].append(index)
+				document['nodes']['contentDocumentIndex']['value'].append(extra['content_document'])
+			if bounds is not None:
+				styles = {
+					'display': 'block',
+					'visibility': 'visible',
+					'opacity': '1',
+					'cursor': 'auto',
+					'pointer-events': 'auto',
+					'position': 'static',
+				}
+				styles.update(extra.get('styles', {}))
+				document['layout']['nodeIndex'].append(index)
+				document['layout']['bounds'].append(list(bounds))
+				document['layout']['styles'].append([self.intern(styles[name]) for name in COMPUTED_STYLES])
+				document['layout']['paintOrders'].append(extra.get('paint_order', index))
+		self.documents.append(document)
+
+	def result(self) -> dict:
+		return {'documents': self.documents, 'strings': self.strings}
+
+
+def build_snapshot() -> dict:
+	snapshot = SnapshotBuilder()
+	snapshot.document(
+		[
+			(-1, 9, '#document', '', {}, None, {}),
+			(0, 1, 'HTML', '', {}, (0, 0, 800, 2000), {}),
+			(1, 1, 'BODY', '', {}, (0, 0, 800, 2000), {}),
+			(2, 1, 'BUTTON', '', {'type': 'submit'}, (10, 10, 100, 30), {'clickable': True}),
+			(3, 3, '#text', 'Save', {}, (20, 15, 40, 20), {}),
+			# A link covered by an overlay that is painted later
+			(2, 1, 'A', '', {'href': '/covered'}, (10, 100, 100, 30), {}),
+			(5, 3, '#text', 'Covered', {}, (20, 105, 60, 20), {}),
+			(2, 1, 'DIV', '', {'class': 'overlay'}, (0, 90, 800, 60), {'paint_order': 100}),
+			(2, 1, 'SCRIPT', '', {}, None, {}),
+			(2, 1, 'IFRAME', '', {'src': '/frame'}, (0, 200, 400, 300), {'content_document': 1}),
+			(2, 1, 'DIV', '', {'role': 'button'}, (0, 0, 0, 0), {'styles': {'display': 'none'}}),
+		]
+	)
+	snapshot.document(
+		[
+			(-1, 9, '#document', '', {}, None, {}),
+			(0, 1, 'HTML', '', {}, (0, 0, 400, 300), {}),
+			(1, 1, 'BODY', '', {}, (0, 0, 400, 300), {}),
+			(2, 1, 'INPUT', '', {'name': 'q'}, (10, 10, 200, 20), {}),
+		],
+		scroll=(0, 5),
+	)
+	return snapshot.result()
+
+
+class DummyCDPSession:
+	def __init__(self, snapshot: dict):
+		self.snapshot = snapshot
+		self.methods: list[str] = []
+
+	async def send(self, method, params=None):
+		self.methods.append(method)
+		if method == 'DOMSnapshot.captureSnapshot':
+			assert params['computedStyles'] == COMPUTED_STYLES
+			return self.snapshot
+		if method == 'Page.getLayoutMetrics':
+			return {'cssLayoutViewport': {'pageX': 0, 'pageY': 0, 'clientWidth': 800, 'clientHeight': 600}}
+		raise AssertionError(method)
+
+
+class DummyContext:
+	def __init__(self, session: DummyCDPSession):
+		self.session = session
+
+	async def new_cdp_session(self, page):
+		return self.session
+
+
+class DummyPage:
+	def __init__(self, snapshot: dict):
+		self.session = DummyCDPSession(snapshot)
+		self.context = DummyContext(self.session)
+		self.highlights = None
+
+	async def evaluate(self, script, args=None):
+		assert script == HIGHLIGHT_SCRIPT
+		self.highlights = args
+
+
+@pytest.mark.asyncio
+async def test_cdp_snapshot_backend_builds_element_tree():
+	page = DummyPage(build_snapshot())
+	state = await DomService(page).get_clickable_elements(viewport_expansion=500, backend='cdp_snapshot')
+
+	assert [element.tag_name for element in state.selector_map.values()] == ['button', 'input']
+	button, frame_input = state.selector_map[0], state.selector_map[1]
+	assert button.xpath == 'html/body/button'
+	assert button.attributes == {'type': 'submit'}
+	assert button.children[0].text == 'Save'
+	assert frame_input.xpath == 'html/body/input'
+	assert frame_input.parent.parent.parent.tag_name == 'iframe'
+
+	tags = [child.tag_name for child in state.element_tree.children]
+	assert tags == ['button', 'a', 'div', 'iframe', 'div']
+	covered_link = state.element_tree.children[1]
+	assert covered_link.is_visible and not covered_link.is_top_element and covered_link.highlight_index is None
+	hidden_div = state.element_tree.children[4]
+	assert not hidden_div.is_visible
+
+	assert state.element_tree.clickable_elements_to_string() == '[0]<button Save/>\nCovered\n[1]<input />'
+
+	# Highlights are drawn in page coordinates, frame content is offset by the frame and its scroll position
+	assert page.highlights == [
+		{'index': 0, 'x': 10, 'y': 10, 'width': 100, 'height': 30},
+		{'index': 1, 'x': 10, 'y': 205, 'width': 200, 'height': 20},
+	]
+	assert button.hash is not None
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from browser_use.browser.network import IGNORED_URL_MATCHER, NetworkTracker, is_relevant_request
+
+
+class DummyRequest:
+	def __init__(self, url: str, resource_type: str = 'script'):
+		self.url = url
+		self.resource_type = resource_type
+		self.headers = {}
+
+
+class DummyResponse:
+	def __init__(self, request: DummyRequest, content_type: str = 'application/javascript'):
+		self.request = request
+		self.headers = {'content-type': content_type}
+
+
+class DummyPage:
+	def __init__(self):
+		self.listeners = {}
+
+	def on(self, event, handler):
+		assert event not in self.listeners
+		self.listeners[event] = handler
+
+	def emit(self, event, payload):
+		self.listeners[event](payload)
+
+
+def test_ignored_urls_are_matched_in_one_scan():
+	assert IGNORED_URL_MATCHER.search('https://www.google-analytics.com/collect')
+	assert not IGNORED_URL_MATCHER.search('https://example.com/app.js')
+	assert not is_relevant_request(DummyRequest('https://example.com/heartbeat'))
+	assert not is_relevant_request(DummyRequest('https://example.com/live', resource_type='websocket'))
+	assert is_relevant_request(DummyRequest('https://example.com/app.js'))
+
+
+@pytest.mark.asyncio
+async def test_tracker_waits_for_pending_requests_and_idle_window():
+	page = DummyPage()
+	tracker = NetworkTracker(page, idle_time=0.05)
+	assert set(page.listeners) == {'request', 'response', 'requestfailed'}
+
+	request = DummyRequest('https://example.com/app.js')
+	page.emit('request', request)
+	wait = asyncio.create_task(tracker.wait_for_idle(timeout=2))
+	await asyncio.sleep(0.1)
+	assert not wait.done()
+
+	loop = asyncio.get_running_loop()
+	page.emit('response', DummyResponse(request))
+	finished = loop.time()
+	assert await wait is True
+	assert loop.time() - finished >= 0.04
+
+	# The listeners stay attached, a failed request does not block the next wait
+	page.emit('request', DummyRequest('https://example.com/style.css', resource_type='stylesheet'))
+	page.emit('requestfailed', next(iter(tracker.pending_requests)))
+	assert await tracker.wait_for_idle(timeout=2) is True
+
+
+@pytest.mark.asyncio
+async def test_tracker_times_out_on_hanging_request():
+	page = DummyPage()
+	tracker = NetworkTracker(page, idle_time=0.01)
+	page.emit('request', DummyRequest('https://example.com/slow.js'))
+	assert await tracker.wait_for_idle(timeout=0.05) is False
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from browser_use.browser.persistence import StatePersister, normalize_cookies
+
+
+@pytest.mark.asyncio
+async def test_scheduled_saves_are_coalesced_and_skipped_when_unchanged(tmp_path):
+	path = str(tmp_path / 'cookies' / 'cookies.json')
+	cookies = [{'name': 'b', 'domain': 'example.com', 'path': '/'}, {'name': 'a', 'domain': 'example.com', 'path': '/'}]
+	fetches = 0
+
+	async def fetch():
+		nonlocal fetches
+		fetches += 1
+		return list(cookies)
+
+	persister = StatePersister(path, fetch, debounce=0.05, normalize=normalize_cookies)
+	for _ in range(5):
+		persister.schedule()
+	await asyncio.sleep(0.1)
+	assert fetches == 1 and persister.writes == 1
+	with open(path) as f:
+		assert [cookie['name'] for cookie in json.load(f)] == ['a', 'b']
+
+	# Same cookie set in another order
+	cookies.reverse()
+	assert not await persister.flush()
+	cookies.append({'name': 'c', 'domain': 'example.com', 'path': '/'})
+	assert await persister.flush()
+	assert persister.writes == 2 and persister.skipped == 1
+	# Only the file itself is left, no temporary files
+	assert os.listdir(tmp_path / 'cookies') == ['cookies.json']
+
+	# A new persister for the saved file does not write the same content again
+	assert not await StatePersister(path, fetch, normalize=normalize_cookies).flush()
+
+
+@pytest.mark.asyncio
+async def test_flush_cancels_scheduled_save(tmp_path):
+	path = str(tmp_path / 'state.json')
+	writes = []
+
+	async def fetch():
+		writes.append(1)
+		return {'cookies': [], 'origins': []}
+
+	persister = StatePersister(path, fetch, debounce=10)
+	persister.schedule()
+	assert await persister.flush()
+	await asyncio.sleep(0)
+	assert persister._timer is None and len(writes) == 1
+
+	async def fetch_nothing():
+		return None
+
+	assert not await StatePersister(str(tmp_path / 'none.json'), fetch_nothing).flush()
+	assert not os.path.exists(tmp_path / 'none.json')
@@ -0,0 +1,131 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from browser_use.browser.browser import Browser, BrowserConfig
+from browser_use.browser.pool import BrowserContextPool
+
+
+class DummyContext:
+	def __init__(self):
+		self.resets = 0
+		self.closed = False
+
+	async def reset_for_reuse(self):
+		self.resets += 1
+
+	async def close(self):
+		self.closed = True
+
+
+def make_pool(**kwargs) -> tuple[BrowserContextPool, list[DummyContext]]:
+	browser = Mock()
+	browser.config = BrowserConfig()
+	pool = BrowserContextPool(browser, **kwargs)
+	created = []
+
+	async def new_context():
+		context = DummyContext()
+		created.append(context)
+		return context
+
+	pool._new_context = new_context
+	return pool, created
+
+
+@pytest.mark.asyncio
+async def test_pool_hands_out_warm_contexts_and_resets_them():
+	pool, created = make_pool(size=2, max_uses=10)
+	await pool.start()
+	assert len(created) == 2
+
+	async with pool.context() as first:
+		second = await pool.acquire()
+		assert {first, second} == set(created)
+		# All contexts are in use, the next agent waits for one to be released
+		waiting = asyncio.create_task(pool.acquire())
+		await asyncio.sleep(0)
+		assert not waiting.done()
+		await pool.release(second)
+		assert await waiting is second
+	assert first.resets == 1 and second.resets == 1
+	assert len(created) == 2
+
+
+@pytest.mark.asyncio
+async def test_pool_recycles_contexts_after_max_uses():
+	pool, created = make_pool(size=1, max_uses=2)
+	await pool.start()
+	first = created[0]
+	async with pool.context():
+		pass
+	async with pool.context():
+		pass
+	assert first.closed and first.resets == 1
+
+	# A fresh context replaces the recycled one
+	replacement = await pool.acquire()
+	assert replacement is created[1] and not replacement.closed
+
+	await pool.release(replacement)
+	await pool.close()
+	assert replacement.closed
+
+
+@pytest.mark.asyncio
+async def test_browser_closes_its_context_pool():
+	browser = Browser(config=BrowserConfig(context_pool_size=1))
+	pool, created = make_pool(size=1)
+	browser.context_pool = pool
+	await pool.start()
+	await browser.close()
+	assert created[0].closed and browser.context_pool is None
+
+
+@pytest.mark.asyncio
+async def test_pool_close_stops_warm_ups(monkeypatch):
+	pool, created = make_pool(size=1, max_uses=1)
+	started = asyncio.Event()
+
+	class SlowContext(DummyContext):
+		def __init__(self, browser, config):
+			super().__init__()
+			created.append(self)
+
+		async def get_session(self):
+			started.set()
+			await asyncio.sleep(10)
+
+	await pool.start()
+	# Replacements are warmed by the real _new_context
+	del pool._new_context
+	monkeypatch.setattr('browser_use.browser.pool.BrowserContext', SlowContext)
+	async with pool.context():
+		pass
+	await started.wait()
+	await pool.close()
+	assert len(created) == 2 and all(context.closed for context in created)
+	assert not pool._warming and pool._count() == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_acquire_fails_once_closed():
+	pool, created = make_pool(size=1)
+	await pool.start()
+	first = await pool.acquire()
+	# Waits for the only context, which is still in use when the pool is closed
+	waiting = [asyncio.create_task(pool.acquire()) for _ in range(2)]
+	await asyncio.sleep(0)
+	assert not any(task.done() for task in waiting)
+
+	await pool.close()
+	for task in waiting:
+		with pytest.raises(RuntimeError):
+			await asyncio.wait_for(task, timeout=1)
+	with pytest.raises(RuntimeError):
+		await asyncio.wait_for(pool.acquire(), timeout=1)
+
+	# The context in use is closed on release instead of being handed out
+	await pool.release(first)
+	assert first.closed and len(created) == 1
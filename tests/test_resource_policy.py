@@ -0,0 +1,66 @@
+import pytest
+
+from browser_use.browser.resource_policy import DomainSuffixTrie, ResourceBlocker, ResourcePolicy
+
+
+class DummyFrame:
+	def __init__(self, parent_frame=None):
+		self.parent_frame = parent_frame
+
+
+class DummyRequest:
+	def __init__(self, url: str, resource_type: str = 'script', navigation: bool = False, frame: DummyFrame | None = None):
+		self.url = url
+		self.resource_type = resource_type
+		self.navigation = navigation
+		self.frame = frame or DummyFrame()
+
+	def is_navigation_request(self):
+		return self.navigation
+
+
+class DummyRoute:
+	def __init__(self, request: DummyRequest):
+		self.request = request
+		self.result = None
+
+	async def fallback(self):
+		self.result = 'continued'
+
+	async def abort(self, error_code=None):
+		self.result = error_code
+
+
+def test_domain_suffix_trie_matches_domains_and_subdomains():
+	trie = DomainSuffixTrie(['example.com', 'Api.Other.org'])
+	assert trie.matches('example.com')
+	assert trie.matches('sub.example.com')
+	assert trie.matches('api.other.org')
+	assert not trie.matches('other.org')
+	assert not trie.matches('notexample.com')
+	assert not trie.matches('')
+
+
+@pytest.mark.asyncio
+async def test_resource_blocker_aborts_and_counts_blocked_requests():
+	policy = ResourcePolicy.text_only()
+	policy.predicates.append(lambda request: request.url.endswith('.map'))
+	blocker = ResourceBlocker(policy, allowed_domains=['example.com'])
+
+	requests = [
+		DummyRequest('https://example.com/logo.png', resource_type='image'),
+		DummyRequest('https://www.google-analytics.com/collect'),
+		DummyRequest('https://example.com/app.js.map'),
+		DummyRequest('https://evil.com/', resource_type='document', navigation=True),
+		# Navigations of iframes and subresources are not restricted by allowed_domains
+		DummyRequest('https://cdn.net/frame', resource_type='document', navigation=True, frame=DummyFrame(DummyFrame())),
+		DummyRequest('https://cdn.net/app.js'),
+	]
+	routes = [DummyRoute(request) for request in requests]
+	for route in routes:
+		await blocker.handle(route)
+
+	assert [route.result for route in routes] == ['blockedbyclient'] * 4 + ['continued'] * 2
+	assert blocker.blocked_counts == {'resource_type:image': 1, 'domain': 1, 'predicate': 1, 'not_allowed': 1}
+	assert blocker.total_blocked == 4
+	assert blocker.blocked_requests[-1] == ('not_allowed', 'https://evil.com/')
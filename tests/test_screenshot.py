@@ -0,0 +1,113 @@
+import base64
+import io
+import sys
+from unittest.mock import Mock
+
+import pytest
+
+from browser_use.browser.context import SCREENSHOT_FINGERPRINT_SCRIPT, BrowserContext, BrowserContextConfig
+from browser_use.browser.screenshot import screenshot_mime_type
+from browser_use.dom.views import HighlightRect
+
+
+class DummyPage:
+	def __init__(self, screenshots: list[bytes]):
+		self.screenshots = screenshots
+		self.calls = []
+		self.fingerprint = {'version': 'doc:0:0', 'domVersion': 'doc:0', 'static': False}
+
+	async def screenshot(self, **kwargs):
+		self.calls.append(kwargs)
+		return self.screenshots[len(self.calls) - 1]
+
+	async def evaluate(self, script):
+		assert script == SCREENSHOT_FINGERPRINT_SCRIPT
+		return dict(self.fingerprint)
+
+
+def make_context(**config) -> BrowserContext:
+	browser = Mock()
+	browser.config = Mock()
+	return BrowserContext(browser=browser, config=BrowserContextConfig(**config))
+
+
+def test_screenshot_mime_type_is_detected_from_base64():
+	assert screenshot_mime_type(base64.b64encode(b'\x89PNG\r\n\x1a\n').decode()) == 'image/png'
+	assert screenshot_mime_type(base64.b64encode(b'\xff\xd8\xff\xe0').decode()) == 'image/jpeg'
+	assert screenshot_mime_type(base64.b64encode(b'RIFF\x00\x00\x00\x00WEBP').decode()) == 'image/webp'
+
+
+@pytest.mark.asyncio
+async def test_jpeg_screenshots_are_encoded_by_the_browser():
+	context = make_context(screenshot_format='jpeg', screenshot_quality=60)
+	page = DummyPage([b'\xff\xd8\xff\xe0jpeg'])
+	screenshot = await context._capture_screenshot(page)
+	assert base64.b64decode(screenshot) == b'\xff\xd8\xff\xe0jpeg'
+	assert page.calls == [{'full_page': False, 'animations': 'disabled', 'type': 'jpeg', 'quality': 60}]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_screenshots_are_reused_and_downscaled():
+	Image = pytest.importorskip('PIL.Image')
+
+	def png(color, size=(800, 600)) -> bytes:
+		image = Image.new('RGB', size, color)
+		image.paste((255, 255, 255), (0, 0, size[0] // 2, size[1]))
+		output = io.BytesIO()
+		image.save(output, format='PNG')
+		return output.getvalue()
+
+	context = make_context(screenshot_format='webp', screenshot_max_dimension=400, screenshot_skip_unchanged=True)
+	page = DummyPage([png((0, 0, 0)), png((0, 0, 0)), png((255, 255, 255)), png((255, 255, 255))])
+
+	first = await context._capture_screenshot(page)
+	assert screenshot_mime_type(first) == 'image/webp'
+	assert Image.open(io.BytesIO(base64.b64decode(first))).size == (400, 300)
+	# The same frame is shared instead of being encoded again
+	assert await context._capture_screenshot(page) is first
+	third = await context._capture_screenshot(page)
+	assert third != first
+	assert len(page.calls) == 3
+
+	# A static page that did not change is not captured at all
+	page.fingerprint['static'] = True
+	assert await context._capture_screenshot(page) is third
+	assert len(page.calls) == 3
+
+	# A DOM mutation the hash does not see still makes a new screenshot
+	page.fingerprint = {'version': 'doc:1:0', 'domVersion': 'doc:1', 'static': False}
+	assert await context._capture_screenshot(page) is not third
+	assert len(page.calls) == 4
+
+
+def test_config_without_pillow_fails_early(monkeypatch):
+	monkeypatch.setitem(sys.modules, 'PIL', None)
+	with pytest.raises(ImportError, match='screenshot_max_dimension'):
+		BrowserContextConfig(screenshot_max_dimension=1024)
+	# The default PNG and JPEG screenshots do not need it
+	BrowserContextConfig(screenshot_format='jpeg')
+
+
+@pytest.mark.asyncio
+async def test_highlights_are_drawn_onto_the_screenshot():
+	Image = pytest.importorskip('PIL.Image')
+
+	output = io.BytesIO()
+	# Device scale factor 2, the viewport is 400 CSS pixels wide
+	Image.new('RGB', (800, 600), (255, 255, 255)).save(output, format='PNG')
+	context = make_context(screenshot_skip_unchanged=True)
+	page = DummyPage([output.getvalue()] * 3)
+	highlights = {0: HighlightRect(x=100, y=100, width=100, height=50)}
+
+	screenshot = await context._capture_screenshot(page, highlights=highlights, viewport_width=400)
+	assert screenshot_mime_type(screenshot) == 'image/png'
+	image = Image.open(io.BytesIO(base64.b64decode(screenshot))).convert('RGB')
+	# Red border, lightly tinted inside, untouched outside, label in the top right corner
+	assert image.getpixel((200, 250)) == (255, 0, 0)
+	assert image.getpixel((260, 280))[0] == 255 and image.getpixel((260, 280))[1] < 255
+	assert image.getpixel((100, 100)) == (255, 255, 255)
+	assert image.getpixel((380, 212))[1] < 100
+
+	# An unchanged frame is only reused with the same highlights
+	assert await context._capture_screenshot(page, highlights=highlights, viewport_width=400) is screenshot
+	assert await context._capture_screenshot(page, highlights={}, viewport_width=400) != screenshot
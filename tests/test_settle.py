@@ -0,0 +1,49 @@
+import os
+
+from browser_use.browser.settle import SettleStats
+
+
+def test_settle_times_use_percentile_of_samples_capped_by_config(tmp_path):
+	path = str(tmp_path / 'settle.json')
+	stats = SettleStats(path, percentile=0.9, margin=1.0, min_samples=5, explore_every=100)
+
+	# Not enough samples yet, the configured times are used
+	assert stats.settle_times('example.com', 0.5, 0.25).network_idle == 0.5
+	for i in range(10):
+		stats.record('example.com', network_gap=0.01 * (i + 1), dom_settle=0.02)
+	stats.record('slow.com', network_gap=3.0, dom_settle=None)
+
+	times = stats.settle_times('example.com', 0.5, 0.25)
+	assert times.network_idle == 0.1
+	assert times.minimum_wait == 0.02
+	# Learned times never exceed the configured ones
+	assert stats.learned('example.com', 'network_gap', 0.05) == 0.05
+
+	stats.save()
+	loaded = SettleStats(path, percentile=0.9, margin=1.0, min_samples=5, explore_every=100)
+	assert loaded.settle_times('example.com', 0.5, 0.25).network_idle == 0.1
+	assert list(loaded.samples['slow.com']) == ['network_gap']
+
+
+def test_settle_times_explore_configured_times():
+	stats = SettleStats(min_samples=1, margin=1.0, explore_every=3)
+	stats.record('example.com', network_gap=0.1, dom_settle=0.1)
+	assert [stats.settle_times('example.com', 0.5, 0.25).network_idle for _ in range(3)] == [0.1, 0.1, 0.5]
+
+
+def test_failed_save_keeps_previous_stats(tmp_path, monkeypatch):
+	path = str(tmp_path / 'settle.json')
+	stats = SettleStats(path)
+	stats.record('example.com', network_gap=0.1, dom_settle=0.2)
+	stats.save()
+
+	def failing_dump(data, f):
+		f.write('{"example.com": {"netw')
+		raise OSError('disk full')
+
+	monkeypatch.setattr('browser_use.browser.persistence.json.dump', failing_dump)
+	stats.record('example.com', network_gap=0.3, dom_settle=None)
+	stats.save()
+	assert stats.dirty
+	assert list(SettleStats(path).samples['example.com']['network_gap']) == [0.1]
+	assert os.listdir(tmp_path) == ['settle.json']
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from browser_use.browser.browser import BrowserConfig
+from browser_use.browser.sharding import ShardedBrowser
+
+
+class DummyPlaywrightContext:
+	def __init__(self, browser):
+		self.browser = browser
+		self.pages = [object()]
+
+
+class DummyPlaywrightBrowser:
+	def __init__(self):
+		self.contexts = []
+		self.connected = True
+		self.closed = False
+		self.handlers = {}
+		self.cdp_sessions = []
+
+	def on(self, event, handler):
+		self.handlers.setdefault(event, []).append(handler)
+
+	def crash(self):
+		self.connected = False
+		for handler in self.handlers.get('disconnected', []):
+			handler(self)
+
+	async def new_browser_cdp_session(self):
+		session = DummyCDPSession()
+		self.cdp_sessions.append(session)
+		return session
+
+	def is_connected(self):
+		return self.connected
+
+	async def close(self):
+		self.closed = True
+		self.crash()
+
+
+class DummyCDPSession:
+	def __init__(self):
+		self.calls = 0
+
+	async def send(self, method, params=None):
+		self.calls += 1
+		return {'processInfo': []}
+
+
+class DummyBrowserContext:
+	def __init__(self, browser, config):
+		self.browser = browser
+		self.context = None
+
+	async def get_session(self):
+		self.context = DummyPlaywrightContext(self.browser.playwright_browser)
+		self.browser.playwright_browser.contexts.append(self.context)
+
+	async def close(self):
+		self.browser.playwright_browser.contexts.remove(self.context)
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+	launched = []
+
+	async def setup_standard_browser(self, playwright):
+		browser = DummyPlaywrightBrowser()
+		launched.append(browser)
+		return browser
+
+	monkeypatch.setattr('browser_use.browser.browser.Browser._setup_standard_browser', setup_standard_browser)
+	monkeypatch.setattr('browser_use.browser.sharding.BrowserContext', DummyBrowserContext)
+	sharded = ShardedBrowser(BrowserConfig(), shards=2, max_contexts_per_process=3)
+	sharded.playwright = object()
+	return sharded, launched
+
+
+@pytest.mark.asyncio
+async def test_contexts_are_placed_on_least_loaded_shard(sharded):
+	sharded, launched = sharded
+	await sharded.start()
+	assert len(launched) == 2
+
+	contexts = [await sharded.new_context() for _ in range(3)]
+	assert [context.browser for context in contexts] == [
+		sharded.shards[0].browser,
+		sharded.shards[1].browser,
+		sharded.shards[0].browser,
+	]
+	await contexts[0].close()
+	assert [load.contexts for load in await sharded.get_load()] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_crashed_and_bloated_shards_are_relaunched(sharded):
+	sharded, launched = sharded
+	await sharded.start()
+
+	# A process that crashed without being noticed is relaunched on the next placement
+	launched[0].connected = False
+	contexts = [await sharded.new_context()]
+	assert sharded.shards[0].restarts == 1 and sharded.shards[0].browser.playwright_browser is launched[2]
+
+	# A process that served max_contexts_per_process contexts only takes new ones after it was relaunched
+	shard = sharded.shards[0]
+	contexts += [await sharded.new_context() for _ in range(4)]
+	assert shard.served == 3
+	load = (await sharded.get_load())[0]
+	assert load.draining and load.contexts == 3
+	for context in contexts:
+		if context.browser is shard.browser:
+			await context.close()
+	await sharded.new_context()
+	assert shard.restarts == 2 and not shard.draining and launched[2].closed
+
+
+@pytest.mark.asyncio
+async def test_crashed_shard_is_relaunched_right_away(sharded):
+	sharded, launched = sharded
+	await sharded.start()
+
+	launched[1].crash()
+	await asyncio.gather(*sharded._relaunching)
+	assert sharded.shards[1].restarts == 1 and sharded.shards[1].browser.playwright_browser is launched[2]
+
+	# Closing a process on purpose, e.g. a drained one, does not relaunch it a second time
+	await sharded._relaunch(sharded.shards[0])
+	assert launched[0].closed and not sharded._relaunching
+	assert sharded.shards[0].restarts == 1 and len(launched) == 4
+
+
+@pytest.mark.asyncio
+async def test_memory_probe_reuses_its_cdp_session(sharded):
+	pytest.importorskip('psutil')
+	sharded, launched = sharded
+	sharded.max_memory_mb = 1024
+	await sharded.start()
+
+	for _ in range(3):
+		await sharded.new_context()
+	assert [len(browser.cdp_sessions) for browser in launched] == [1, 1]
+	assert launched[0].cdp_sessions[0].calls == 3